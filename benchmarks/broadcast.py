@@ -0,0 +1,116 @@
+"""
+Load test of the broadcast server with many viewers over localhost.
+
+Run with `python -m benchmarks.broadcast`. The server streams synthetic frames (see
+`benchmarks.palettes.sample_clip`) to N viewers connected over TCP, each writing what it
+receives to /dev/null like `connect` writes to a terminal. Every run sends the frames as
+fast as they are rendered and reports the frames per second the server sustains, plus
+what the viewers got; `--slow` viewers also sleep between reads, so they fall behind and
+have to be resynced with keyframes.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+from fractions import Fraction
+
+from benchmarks.palettes import sample_clip
+from src.utils.broadcast import BroadcastServer
+from src.utils.palette import get_palette
+from src.utils.protocol import connect
+
+
+class SlowTerminal:
+    # a /dev/null that takes `delay` seconds per write, like a terminal that can't keep up
+    def __init__(self, delay):
+        self.delay = delay
+        self.read_fd, self.fd = os.pipe()
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+        self.thread.start()
+
+    def _drain(self):
+        while os.read(self.read_fd, 1 << 16):
+            time.sleep(self.delay)
+
+    def close(self):
+        os.close(self.fd)
+        self.thread.join()
+        os.close(self.read_fd)
+
+
+def viewer(address, results, delay=0.0):
+    if delay:
+        terminal = SlowTerminal(delay)
+        results.append(connect(address, terminal.fd))
+        terminal.close()
+    else:
+        with open(os.devnull, 'wb') as sink:
+            results.append(connect(address, sink.fileno()))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def run(cells, palette, viewers, slow, delay, max_buffer):
+    address = f'localhost:{free_port()}'
+    results = []
+    threads = [
+        threading.Thread(target=viewer, args=(address, results, delay if index < slow else 0.0), daemon=True)
+        for index in range(viewers)
+    ]
+    server = BroadcastServer(
+        lambda: ((frame, None) for frame in cells), Fraction(25), palette,
+        max_buffer=max_buffer, min_viewers=viewers, realtime=False,
+    )
+
+    start = None
+    def ready():
+        for thread in threads:
+            thread.start()
+
+    async def serve():
+        nonlocal start
+        task = asyncio.create_task(server.serve(address, cells[0].shape, ready))
+        while len(server.viewers) < viewers and not task.done():
+            await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        await task
+
+    asyncio.run(serve())
+    seconds = time.perf_counter() - start
+    for thread in threads:
+        thread.join()
+    return server, seconds, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=200)
+    parser.add_argument('--height', type=int, default=60)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--viewers', default='1,8,32,64', help="comma separated viewer counts")
+    parser.add_argument('--slow', type=int, default=2, help="viewers per run that can't keep up")
+    parser.add_argument('--delay', type=float, default=0.02, help="seconds slow viewers sleep per read")
+    parser.add_argument('--max-buffer', type=int, default=1 << 18, help="bytes queued for a viewer before it's resynced")
+    args = parser.parse_args()
+
+    palette = get_palette('truecolor')
+    cells = [palette.quantize(frame) for frame in sample_clip(args.width, args.height, args.frames)]
+    print(f"{args.width}x{args.height}, {args.frames} frames, {args.slow} slow viewer(s) per run")
+    print(f"{'viewers':>8}{'server fps':>12}{'MB/s':>10}{'resyncs':>9}{'frames shown (min/max)':>26}")
+    for count in map(int, args.viewers.split(',')):
+        server, seconds, results = run(cells, palette, count, min(args.slow, count), args.delay, args.max_buffer)
+        shown = [frames for frames, _, _ in results]
+        print(
+            f"{count:>8}{server.frames_sent / seconds:>12,.1f}{server.bytes_sent / seconds / 1e6:>10,.1f}"
+            f"{server.resyncs:>9}{f'{min(shown)}/{max(shown)}':>26}"
+        )
+
+
+if __name__ == '__main__':
+    main()
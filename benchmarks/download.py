@@ -0,0 +1,157 @@
+"""
+End-to-end check of videos streamed from a URL, against a local HTTP server.
+
+Run with `python -m benchmarks.download`. A clip is generated with ffmpeg (at 29.97 fps)
+and served by `http.server`, throttled to `--rate` bytes per second. Like some sites,
+the server refuses requests without the headers yt-dlp resolved, so probing and
+downloading both have to send them. The clip is looked up with `yt_resolve`, probed
+with `probe_stream`, downloaded with `download_video` and converted through
+`Download.feed` while it arrives, exactly like the player does: the cell grids and the
+audio must be identical to those of the local file, the frame rate exact, and the first
+frame must be converted before the download is complete. The time to the first frame is reported; any failed check exits with status 1.
+"""
+import argparse
+import functools
+import os
+import shutil
+import tempfile
+import threading
+import time
+from fractions import Fraction
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from src.utils.conversion import cells_shape, exact_frame_rate, frame_pipeline
+from src.utils.download import download_video, probe_stream
+from src.utils.others import yt_resolve
+from src.utils.palette import get_palette
+from src.utils.stream import stream_audio
+
+FRAME_RATE = Fraction(30000, 1001)
+
+
+def generate_clip(directory, seconds):
+    # a test pattern plus a tone, with the index up front so it can be decoded from a pipe
+    import ffmpeg
+
+    path = os.path.join(directory, 'clip.mp4')
+    video = ffmpeg.input(f'testsrc2=size=320x180:rate={FRAME_RATE}', f='lavfi', t=seconds)
+    audio = ffmpeg.input('sine=frequency=440:sample_rate=44100', f='lavfi', t=seconds)
+    ffmpeg.output(video, audio, path, pix_fmt='yuv420p', movflags='+faststart', loglevel='quiet').overwrite_output().run()
+    return path
+
+
+class ThrottledHandler(SimpleHTTPRequestHandler):
+    # serves files at `rate` bytes per second, to browser-like user agents only
+    rate = 1 << 18
+
+    def do_GET(self):
+        if self.refused():
+            return
+        super().do_GET()
+
+    def do_HEAD(self):
+        if self.refused():
+            return
+        super().do_HEAD()
+
+    def refused(self):
+        # requests' and ffmpeg's own user agents mean the resolved headers weren't sent
+        if self.headers.get('User-Agent', '').startswith('Mozilla/'):
+            return False
+        self.server.refused += 1
+        self.send_error(403, "Headers required")
+        return True
+
+    def copyfile(self, source, outputfile):
+        chunk_size = max(1, self.rate // 20)
+        try:
+            while chunk := source.read(chunk_size):
+                outputfile.write(chunk)
+                time.sleep(len(chunk) / self.rate)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # the client went away
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory, rate):
+    handler = type('Handler', (ThrottledHandler,), {'rate': rate})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(handler, directory=directory))
+    server.refused = 0
+    threading.Thread(target=server.serve_forever, name='http server', daemon=True).start()
+    return server
+
+
+def convert(pipeline):
+    # every cell grid of a pipeline, copied out of its ring, and when the first one came out
+    frames = []
+    first = None
+    for cells in pipeline:
+        if first is None:
+            first = time.perf_counter()
+        frames.append(cells.copy())
+    pipeline.close()
+    return frames, first
+
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=4, help="length of the generated clip")
+    parser.add_argument('--rate', type=int, default=1 << 18, help="bytes per second the server sends")
+    parser.add_argument('--height', type=int, default=24, help="rows of cells of the conversion")
+    args = parser.parse_args()
+
+    check(exact_frame_rate(29.97) == FRAME_RATE, f"29.97 fps read as {exact_frame_rate(29.97)}")
+
+    directory = tempfile.mkdtemp()
+    server = serve(directory, args.rate)
+    try:
+        clip = generate_clip(directory, args.seconds)
+        url = f'http://127.0.0.1:{server.server_address[1]}/{os.path.basename(clip)}'
+        size = os.path.getsize(clip)
+        print(f"serving {size:,} bytes at {args.rate:,} B/s ({size / args.rate:.1f} s)")
+
+        video = yt_resolve(url, args.height)
+        check(video, f"yt-dlp couldn't resolve {url}")
+
+        start = time.perf_counter()
+        width, height, frame_rate, _ = probe_stream(video)
+        download = download_video(video)
+        finished = []
+        threading.Thread(target=lambda: (download.wait(), finished.append(time.perf_counter())), daemon=True).start()
+        try:
+            check(frame_rate == FRAME_RATE, f"frame rate {frame_rate}, expected {FRAME_RATE}")
+            shape = cells_shape(width, height, args.height)
+            palette = get_palette('truecolor', 0)
+
+            streamed, first = convert(frame_pipeline(download.path, shape, palette, feed=download.feed))
+            download.wait()
+            streamed_audio = b''.join(stream_audio(download.path, download.feed))
+        finally:
+            download.close()
+        check(server.refused == 0, f"{server.refused} request(s) sent without the resolved headers")
+
+        local, _ = convert(frame_pipeline(clip, shape, palette))
+        local_audio = b''.join(stream_audio(clip))
+        check(len(streamed) == len(local), f"{len(streamed)} frames streamed, {len(local)} from the file")
+        check(all(np.array_equal(a, b) for a, b in zip(streamed, local)), "streamed frames differ from the file's")
+        check(streamed_audio == local_audio, "streamed audio differs from the file's")
+        check(first is not None and first < finished[0], "the first frame only came out once the download was complete")
+
+        print(f"{len(streamed)} frames of {shape[1]}x{shape[0]} cells at {frame_rate} fps, identical to the file's")
+        print(f"  first frame after {first - start:.2f} s, download complete after {finished[0] - start:.2f} s")
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
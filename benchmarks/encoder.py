@@ -0,0 +1,108 @@
+"""
+Parity check and microbenchmark for the vectorized frame encoder.
+
+Run with `python -m benchmarks.encoder`. The reference below is the original per-pixel
+implementation of `TerminalPlayer.process_frame`, kept here so the vectorized encoder can
+be checked byte for byte against it. The check runs before the benchmark and exits with
+status 1 on the first difference; `--check` runs it alone, e.g. in CI.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.utils.encoder import encode_frame
+
+
+def reference_encode(image):
+    rgb_pixels = np.array(image, dtype=np.int32)
+
+    ascii_image = []
+
+    height, width, _ = rgb_pixels.shape
+    last_rgb = np.zeros((3,), dtype=np.int32)
+
+    ansi_colors = np.full((height, width), "\033[0m", dtype=object)
+    color_changes = np.zeros((height, width), dtype=bool)
+
+    for y in range(height):
+        for x in range(width):
+            current_rgb = rgb_pixels[y, x]
+
+            distance = 0
+            for i in range(3):
+                distance += abs(current_rgb[i] - last_rgb[i])
+
+            if distance > 0 or (y == 0 and x == 0):
+                ansi_colors[y, x] = f"\033[48;2;{current_rgb[0]};{current_rgb[1]};{current_rgb[2]}m"
+                color_changes[y, x] = True
+                last_rgb = current_rgb
+            else:
+                ansi_colors[y, x] = ansi_colors[y, x-1]
+
+    for y in range(height):
+        ascii_row = []
+        for x in range(width):
+            if color_changes[y, x]:
+                ascii_row.append(ansi_colors[y, x] + " ")
+            else:
+                ascii_row.append(" ")
+        ascii_image.append("".join(ascii_row))
+
+    return "\n".join(ascii_image)
+
+
+def sample_frames(width, height, count, seed=0):
+    # a mix of noise, flat areas and gradients so both run lengths and digit counts vary
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        frame[:height // 3] = (i * 7) % 256
+        frame[height // 3:2 * height // 3, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)
+        frame[-2:, : width // 2] = rng.integers(0, 12, 3, dtype=np.uint8)
+        frames.append(frame)
+    return frames
+
+
+def check_parity():
+    frames = sample_frames(37, 11, 8) + sample_frames(1, 6, 2, seed=1) + sample_frames(9, 1, 2, seed=2)
+    frames += [np.zeros((5, 5, 3), np.uint8), np.full((1, 1, 3), 255, np.uint8)]
+    for index, frame in enumerate(frames):
+        if encode_frame(frame) != reference_encode(frame):
+            raise SystemExit(f"parity: frame {index} ({frame.shape[1]}x{frame.shape[0]}) differs from the reference encoder")
+    print(f"parity: {len(frames)} frames identical")
+
+
+def cells_per_second(func, frames, repeat):
+    cells = sum(frame.shape[0] * frame.shape[1] for frame in frames) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            func(frame)
+    return cells / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=400)
+    parser.add_argument('--height', type=int, default=150)
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--check', action='store_true', help="only check the encoder against the reference")
+    args = parser.parse_args()
+
+    check_parity()
+    if args.check:
+        return
+
+    frames = sample_frames(args.width, args.height, args.frames)
+    vectorized = cells_per_second(encode_frame, frames, 3)
+    reference = cells_per_second(reference_encode, frames[:1], 1)
+
+    print(f"{args.width}x{args.height} cells")
+    print(f"  reference:  {reference:>14,.0f} cells/s")
+    print(f"  vectorized: {vectorized:>14,.0f} cells/s ({vectorized / reference:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Startup cost of the entry points, measured with `python -X importtime`.
+
+Run with `python -m benchmarks.importtime`. Every entry point is imported in fresh
+interpreters (the fastest run is kept) and the time spent importing it is reported,
+with its heaviest dependencies and any heavy library it shouldn't need: `play` must
+only load what showing a stored video takes, ffmpeg, the audio and keyboard libraries
+and the downloaders are imported later, on the paths using them. Results are written as
+JSON with `--output` and compared with `--compare`, like the suite; `--history` appends
+every run to a JSON lines file, to follow the startup time from commit to commit.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.suite import environment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What each command imports before it does anything
+ENTRY_POINTS = {
+    'cli': 'import src.cli',
+    'play': 'import src.cli; from src.converter import TerminalPlayer',
+    'serve': 'import src.cli; from src.utils.broadcast import BroadcastServer',
+}
+
+# Libraries only some paths need, and the entry points that may import them up front
+HEAVY_MODULES = {
+    'asyncio': {'serve'},
+    'ffmpeg': set(),
+    'keyboard': set(),
+    'multiprocessing.pool': set(),
+    'pyaudio': set(),
+    'requests': set(),
+    'rich': set(),
+    'yt_dlp': set(),
+}
+
+
+def parse_importtime(output):
+    # (module, cumulative microseconds, depth) of every import in `-X importtime` output
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(cumulative), depth))
+    return imports
+
+
+def measure(code):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, env=env, cwd=ROOT)
+    if result.returncode:
+        raise SystemExit(f"`{code}` failed:\n{result.stderr.strip().splitlines()[-1]}")
+    return parse_importtime(result.stderr)
+
+
+def bench_entry_point(code, startup, repeat):
+    # import time of the modules the code imports on top of the interpreter's own startup
+    best = None
+    for _ in range(repeat):
+        imports = measure(code)
+        total = sum(cumulative for name, cumulative, depth in imports if depth == 0 and name not in startup)
+        if best is None or total < best[0]:
+            best = total, imports
+    total, imports = best
+    # the heaviest packages, by the time of their outermost import (children are listed before it)
+    packages = {}
+    for name, cumulative, _ in imports:
+        package = name.split('.')[0]
+        if package not in startup and package != 'src':
+            packages[package] = max(packages.get(package, 0), cumulative)
+    modules = {name for name, _, _ in imports}
+    return {
+        'ms': total / 1e3,
+        'modules': len(modules - startup),
+        'heaviest': sorted(packages.items(), key=lambda item: -item[1])[:5],
+        'imported': sorted(module for module in HEAVY_MODULES if module in modules),
+    }
+
+
+def compare(results, previous, threshold):
+    # prints the change of every entry point present in both runs, returns the number of regressions
+    previous_ms = {entry['entry']: entry['ms'] for entry in previous['results']}
+    regressions = 0
+    print(f"\ncompared with {previous['environment'].get('commit') or 'previous run'}")
+    for entry in results:
+        before = previous_ms.get(entry['entry'])
+        if not before:
+            continue
+        change = entry['ms'] / before - 1
+        slower = change > threshold
+        regressions += slower
+        print(f"  {entry['entry']:<10}{before:>10.1f} ms ->{entry['ms']:>8.1f} ms{change:>+8.1%}{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help="fresh interpreters per entry point, the fastest one is kept")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON results of a previous run")
+    parser.add_argument('--threshold', type=float, default=0.2, help="slowdown reported as a regression")
+    parser.add_argument('--history', help="append the results to this JSON lines file")
+    args = parser.parse_args()
+
+    startup = {name for name, _, _ in measure('pass')}
+    results = []
+    unexpected = 0
+    print(f"{'entry':<10}{'import':>12}{'modules':>9}  heaviest packages")
+    for entry, code in ENTRY_POINTS.items():
+        measured = bench_entry_point(code, startup, args.repeat)
+        results.append({'entry': entry, **measured})
+        heaviest = ', '.join(f'{package} {cumulative / 1e3:.0f} ms' for package, cumulative in measured['heaviest'])
+        print(f"{entry:<10}{measured['ms']:>9.1f} ms{measured['modules']:>9}  {heaviest}")
+        for module in measured['imported']:
+            if entry not in HEAVY_MODULES[module]:
+                unexpected += 1
+                print(f"  {module} is imported up front, it should only be imported where it's used")
+
+    report = {'environment': environment(), 'repeat': args.repeat, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nresults written to {args.output}")
+    if args.history:
+        with open(args.history, 'a') as file:
+            file.write(json.dumps(report) + '\n')
+
+    regressions = 0
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+    if regressions or unexpected:
+        raise SystemExit(f"{regressions} entry point(s) slower than {args.threshold:.0%}, {unexpected} heavy import(s) up front")
+
+
+if __name__ == '__main__':
+    main()
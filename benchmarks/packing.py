@@ -0,0 +1,134 @@
+"""
+Round-trip check and throughput benchmark for the 4-bit and 7-bit frame packers.
+
+Run with `python -m benchmarks.packing`. The reference functions below are the original
+bit-buffer implementations; the vectorized packers must produce the same bytes and text.
+The round trip is checked before the benchmark and exits with status 1 on the first
+difference; `--check` runs it alone, e.g. in CI.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from src.utils.file.tools import (
+    BRIGHTNESS_GLYPHS_HIGH, BRIGHTNESS_GLYPHS_LOW, BRIGHTNESS_LEVELS_HIGH, BRIGHTNESS_LEVELS_LOW, HIGH_ENCODING, LOW_ENCODING,
+    pack_frame_batch, pack_function, pack_high, pack_low, unpack_function, unpack_high, unpack_low,
+)
+
+
+def reference_pack(frame, encoding, bits):
+    packed_bytes = bytearray()
+    bit_buffer = 0
+    bit_count = 0
+
+    for char in frame:
+        value = encoding.get(char, 0)
+        bit_buffer = (bit_buffer << bits) | value
+        bit_count += bits
+        while bit_count >= 8:
+            bit_count -= 8
+            packed_bytes.append((bit_buffer >> bit_count) & 0xFF)
+
+    if bit_count > 0:
+        packed_bytes.append((bit_buffer << (8 - bit_count)) & 0xFF)
+    return packed_bytes
+
+
+def reference_unpack(packed_bytes, levels, bits):
+    bit_buffer = 0
+    bit_count = 0
+    result = []
+
+    for byte in packed_bytes:
+        bit_buffer = (bit_buffer << 8) | byte
+        bit_count += 8
+
+        while bit_count >= bits:
+            bit_count -= bits
+            value = (bit_buffer >> bit_count) & ((1 << bits) - 1)
+            if value < len(levels):
+                result.append(levels[value])
+
+    return ''.join(result)
+
+
+CODECS = {
+    'low': (pack_low, unpack_low, LOW_ENCODING, BRIGHTNESS_LEVELS_LOW, 4, 0.5),
+    'high': (pack_high, unpack_high, HIGH_ENCODING, BRIGHTNESS_LEVELS_HIGH, 7, 1.0),
+}
+
+
+def random_frame(rng, levels, length):
+    # mostly valid levels, plus the odd character outside the table
+    return ''.join(rng.choice(levels) if rng.random() < 0.98 else rng.choice('xyzé') for _ in range(length))
+
+
+def check_round_trip(rng, cases):
+    for name, (pack, unpack, encoding, levels, bits, brightness) in CODECS.items():
+        frames = [random_frame(rng, levels, rng.randrange(0, 300)) for _ in range(cases)]
+        for frame in frames:
+            packed = pack(frame)
+            if packed != reference_pack(frame, encoding, bits):
+                raise SystemExit(f"{name}: packed bytes differ from the reference for {frame!r}")
+            if unpack(packed) != reference_unpack(packed, levels, bits):
+                raise SystemExit(f"{name}: unpacked text differs from the reference for {frame!r}")
+            # every character maps back to a level with the same index
+            expected = ''.join(levels[encoding.get(char, 0)] for char in frame)
+            if not unpack(packed).startswith(expected):
+                raise SystemExit(f"{name}: round trip lost characters for {frame!r}")
+        if pack_frame_batch(frames, brightness) != [bytes(reference_pack(frame, encoding, bits)) for frame in frames]:
+            raise SystemExit(f"{name}: batch packing differs from the reference")
+        print(f"{name}: {cases} random frames round-trip identically")
+
+    # glyph cells are packed from their levels, and unpack to them plus at most one padding value
+    for brightness, levels in ((BRIGHTNESS_GLYPHS_LOW, BRIGHTNESS_LEVELS_LOW), (BRIGHTNESS_GLYPHS_HIGH, BRIGHTNESS_LEVELS_HIGH)):
+        pack, unpack = pack_function(brightness), unpack_function(brightness)
+        for _ in range(cases):
+            height, width = rng.randrange(1, 6), rng.randrange(1, 20)
+            cells = np.array([[rng.randrange(len(levels)) for _ in range(width)] for _ in range(height)], dtype=np.uint8)
+            if not np.array_equal(unpack(pack(cells))[:cells.size], cells.reshape(-1)):
+                raise SystemExit(f"glyphs {brightness}: round trip differs for {cells.tolist()}")
+    print(f"glyphs: {cases} random cell grids round-trip identically")
+
+
+def throughput(func, items, chars):
+    start = time.perf_counter()
+    func(items)
+    return chars / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=400)
+    parser.add_argument('--height', type=int, default=150)
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--cases', type=int, default=300)
+    parser.add_argument('--check', action='store_true', help="only check the round trip against the reference")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    check_round_trip(rng, args.cases)
+    if args.check:
+        return
+
+    for name, (pack, unpack, encoding, levels, bits, brightness) in CODECS.items():
+        frames = [random_frame(rng, levels, args.width * args.height) for _ in range(args.frames)]
+        chars = sum(map(len, frames))
+        packed = pack_frame_batch(frames, brightness)
+
+        rates = {
+            'pack (reference)': throughput(lambda f: [reference_pack(x, encoding, bits) for x in f], frames[:2], chars * 2 / len(frames)),
+            'pack': throughput(lambda f: [pack(x) for x in f], frames, chars),
+            'pack batch': throughput(lambda f: pack_frame_batch(f, brightness), frames, chars),
+            'unpack (reference)': throughput(lambda p: [reference_unpack(x, levels, bits) for x in p], packed[:2], chars * 2 / len(frames)),
+            'unpack': throughput(lambda p: [unpack(x) for x in p], packed, chars),
+        }
+        print(f"{name} ({args.width}x{args.height}, {args.frames} frames)")
+        for label, rate in rates.items():
+            print(f"  {label:<20}{rate:>16,.0f} chars/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Bytes-per-frame comparison of the output palettes.
+
+Run with `python -m benchmarks.palettes`. Frames are synthetic but video-like: smooth
+moving gradients with a little sensor noise, so almost no two cells share an exact color.
+Half-block mode is measured on the same cell grid with frames of twice the height, and
+compared in bytes per displayed pixel.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.utils.encoder import half_blocks
+from src.utils.palette import get_palette
+from src.utils.render import DamageRenderer
+
+
+def sample_clip(width, height, count, noise=3, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    frames = []
+    for i in range(count):
+        red = 128 + 100 * np.sin((x + 2 * i) / 23)
+        green = 128 + 100 * np.cos((y - i) / 17)
+        blue = 128 + 60 * np.sin((x + y + 3 * i) / 31)
+        frame = np.stack([red, green, blue], axis=-1) + rng.normal(0, noise, (height, width, 3))
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
+
+
+def measure(palette, frames, half_block=False):
+    renderer = DamageRenderer(palette)
+    start = time.perf_counter()
+    if half_block:
+        sizes = [len(renderer.render(half_blocks(palette.quantize(frame)))) for frame in frames]
+    else:
+        sizes = [len(renderer.render(palette.quantize(frame))) for frame in frames]
+    elapsed = time.perf_counter() - start
+    return sizes[0], sum(sizes[1:]) / max(len(sizes) - 1, 1), len(frames) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=400)
+    parser.add_argument('--height', type=int, default=150)
+    parser.add_argument('--frames', type=int, default=30)
+    args = parser.parse_args()
+
+    frames = sample_clip(args.width, args.height, args.frames)
+    palettes = [
+        ('truecolor', get_palette('truecolor')),
+        ('truecolor, tolerance 4', get_palette('truecolor', tolerance=4)),
+        ('truecolor, tolerance 8', get_palette('truecolor', tolerance=8)),
+        ('xterm256', get_palette('xterm256')),
+        ('ansi16', get_palette('ansi16')),
+    ]
+
+    baseline = None
+    print(f"{args.width}x{args.height}, {args.frames} frames")
+    print(f"  {'palette':<24}{'first frame':>14}{'per update':>14}{'vs truecolor':>14}{'fps':>8}")
+    for name, palette in palettes:
+        first, update, fps = measure(palette, frames)
+        baseline = baseline or update
+        print(f"  {name:<24}{first:>14,}{update:>14,.0f}{update / baseline:>13.0%}{fps:>8.1f}")
+
+    pixels = args.width * args.height
+    tall_frames = sample_clip(args.width, args.height * 2, args.frames)
+    print(f"\nbytes per displayed pixel, per update ({args.width}x{args.height} cells)")
+    print(f"  {'palette':<24}{'spaces':>14}{'half blocks':>14}{'ratio':>14}")
+    for name, palette in palettes:
+        _, spaces, _ = measure(palette, frames)
+        _, halves, _ = measure(palette, tall_frames, half_block=True)
+        print(f"  {name:<24}{spaces / pixels:>14.2f}{halves / (2 * pixels):>14.2f}{halves / 2 / spaces:>14.0%}")
+
+
+if __name__ == '__main__':
+    main()
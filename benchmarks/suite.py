@@ -0,0 +1,330 @@
+"""
+Throughput benchmarks for every hot path: decode, convert, pack, container I/O and render.
+
+Run with `python -m benchmarks.suite`. Clips are generated locally (ffmpeg's `testsrc2`
+when ffmpeg is available, NumPy gradients otherwise), so no network is needed. Results
+are written as JSON with `--output`; pass a previous file to `--compare` to see every
+stage's change and flag the ones that got slower.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from functools import partial
+
+import numpy as np
+
+from benchmarks.palettes import sample_clip
+from src.utils.audio import wav_bytes
+from src.utils.encoder import half_blocks
+from src.utils.file.tools import (
+    BRIGHTNESS_CELLS, BRIGHTNESS_LEVELS_HIGH, BRIGHTNESS_LEVELS_LOW, pack_frame_batch, read_video, write_video, VideoReader,
+)
+from src.utils.glyphs import Glyphs
+from src.utils.output import TerminalWriter
+from src.utils.palette import get_palette
+from src.utils.render import DamageRenderer
+from src.utils.stream import FramePipeline, iter_frames, read_frames, stream_audio
+
+DEFAULT_RESOLUTIONS = '80x24,200x60,400x150'
+FRAME_RATE = 25
+
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def generate_clip(directory, frames):
+    # a test pattern plus a tone, at a size every resolution is scaled down from; None
+    # without ffmpeg (imported here so the suite runs without ffmpeg-python installed)
+    try:
+        import ffmpeg
+    except ImportError:
+        return None
+    path = os.path.join(directory, 'clip.mp4')
+    video = ffmpeg.input(f'testsrc2=size=640x360:rate={FRAME_RATE}', f='lavfi', t=frames / FRAME_RATE)
+    audio = ffmpeg.input('sine=frequency=440:sample_rate=44100', f='lavfi', t=frames / FRAME_RATE)
+    try:
+        ffmpeg.output(video, audio, path, pix_fmt='yuv420p', loglevel='quiet').overwrite_output().run()
+    except (OSError, ffmpeg.Error):
+        return None
+    return path
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_decode(clip, width, height):
+    seconds, frames = timed(read_frames, clip, width, height)
+    audio_seconds, _ = timed(lambda: sum(len(pcm) for pcm in stream_audio(clip)))
+    stream_seconds, count = timed(lambda: sum(1 for _ in iter_frames(clip, width, height)))
+    # the full size plus the 3/4 and 1/2 renditions of a ladder, in one pass
+    sizes = [(width, height), (width * 3 // 4, height * 3 // 4), (width // 2, height // 2)]
+    ladder_height = sum(size[1] for size in sizes)
+    ladder_seconds, ladder_count = timed(lambda: sum(1 for _ in iter_frames(clip, width, ladder_height, sizes=sizes)))
+    return frames, {
+        'decode (read_frames)': {'seconds': seconds, 'frames': len(frames)},
+        'decode (iter_frames)': {'seconds': stream_seconds, 'frames': count},
+        'decode (ladder of 3)': {'seconds': ladder_seconds, 'frames': ladder_count},
+        'decode audio': {'seconds': audio_seconds, 'frames': len(frames)},
+    }
+
+
+def convert(frame, palette, half_block=False):
+    return half_blocks(palette.quantize(frame)) if half_block else palette.quantize(frame)
+
+
+def bench_convert(frames, clip):
+    results = {}
+    for name in ('truecolor', 'xterm256'):
+        palette = get_palette(name)
+        for half_block in (False, True):
+            label = f"convert {name}{' half-block' if half_block else ''}"
+            seconds, _ = timed(lambda: [convert(frame, palette, half_block) for frame in frames])
+            results[label] = {'seconds': seconds, 'frames': len(frames)}
+
+    for glyphs in (Glyphs('high'), Glyphs('high', color=True)):
+        palette = get_palette('truecolor')
+        seconds, _ = timed(lambda: [glyphs.quantize(frame, palette) for frame in frames])
+        results[f'convert glyphs {glyphs.name}'] = {'seconds': seconds, 'frames': len(frames)}
+
+    if clip is not None:
+        # decode and convert through the worker pool, as the player does
+        height, width = frames.shape[1:3]
+        palette = get_palette('truecolor')
+        pipeline = FramePipeline(
+            lambda ring: iter_frames(clip, width, height, ring=ring),
+            partial(convert, palette=palette),
+            (height, width), (height, width), np.uint32,
+        )
+        pipeline.start()
+        seconds, count = timed(lambda: sum(1 for _ in pipeline))
+        pipeline.close()
+        results['decode + convert (FramePipeline)'] = {'seconds': seconds, 'frames': count}
+    return results
+
+
+def bench_pack(frames):
+    results = {}
+    cells = [convert(frame, get_palette('truecolor')) for frame in frames]
+    seconds, packed = timed(pack_frame_batch, cells, BRIGHTNESS_CELLS)
+    results['pack cells'] = {'seconds': seconds, 'frames': len(cells), 'bytes': sum(map(len, packed))}
+
+    # glyph frames of the same size, brightness picked from the red channel
+    height, width = frames.shape[1:3]
+    for brightness, levels in ((0.5, BRIGHTNESS_LEVELS_LOW[:-1]), (1.0, BRIGHTNESS_LEVELS_HIGH[:-1])):
+        table = np.array(list(levels))
+        text = ['\n'.join(''.join(row) for row in table[frame[..., 0].astype(np.intp) * len(levels) // 256]) for frame in frames]
+        seconds, packed = timed(pack_frame_batch, text, brightness)
+        label = 'pack glyphs (4-bit)' if brightness == 0.5 else 'pack glyphs (7-bit)'
+        results[label] = {'seconds': seconds, 'frames': len(text), 'bytes': sum(map(len, packed))}
+
+    # the same levels as glyph cells, packed without going through text
+    for glyphs in (Glyphs('low'), Glyphs('high')):
+        levels = [glyphs.quantize(frame) for frame in frames]
+        seconds, packed = timed(pack_frame_batch, levels, glyphs.brightness)
+        label = f"pack glyph cells ({'4' if glyphs.ramp == 'low' else '7'}-bit)"
+        results[label] = {'seconds': seconds, 'frames': len(levels), 'bytes': sum(map(len, packed))}
+    return results
+
+
+def bench_container(frames, directory):
+    cells = [convert(frame, get_palette('truecolor')) for frame in frames]
+    path = os.path.join(directory, 'video.vide')
+    audio = wav_bytes(bytes(1 << 20))
+
+    with open(path, 'wb') as file:
+        write_seconds, _ = timed(write_video, file, cells, FRAME_RATE, BRIGHTNESS_CELLS, audio)
+    size = os.path.getsize(path)
+    with open(path, 'rb') as file:
+        read_seconds, (decoded, _, _, _) = timed(read_video, file)
+    with open(path, 'rb') as file:
+        # what playback from the cache does: deltas streamed chunk by chunk
+        reader = VideoReader(file)
+        stream_seconds, count = timed(lambda: sum(1 for _ in reader.deltas()))
+        # what playback starting midway does: seek into the audio and decompress the chunk there
+        seek_seconds, _ = timed(lambda: next(iter(reader.audio_source(reader.audio_chunks[-1][2] / reader.audio_format[0]))))
+        reader.close()
+
+    # a letterboxed slideshow cycling through three pictures, where the row store keeps each distinct row once
+    bars = max(len(cells[0]) // 8, 1)
+    slides = []
+    for index in range(len(cells)):
+        slide = cells[index // 5 % 3].copy()
+        slide[:bars] = 0
+        slide[-bars:] = 0
+        slides.append(slide)
+    slideshow = {}
+    for row_store in (True, False):
+        with open(path, 'wb') as file:
+            seconds, _ = timed(lambda: write_video(file, slides, FRAME_RATE, BRIGHTNESS_CELLS, None, row_store=row_store))
+        label = 'write_video (slideshow)' if row_store else 'write_video (slideshow, deltas)'
+        slideshow[label] = {'seconds': seconds, 'frames': len(slides), 'bytes': os.path.getsize(path)}
+
+    return {
+        'write_video': {'seconds': write_seconds, 'frames': len(cells), 'bytes': size},
+        'read_video': {'seconds': read_seconds, 'frames': len(decoded)},
+        'VideoReader.deltas': {'seconds': stream_seconds, 'frames': count},
+        'VideoReader.audio_source (seek)': {'seconds': seek_seconds, 'frames': 1},
+        **slideshow,
+    }
+
+
+def drain(fd):
+    # reads a pty until its other end is closed, like a terminal emulator would
+    try:
+        while os.read(fd, 1 << 16):
+            pass
+    except OSError:
+        pass
+
+
+def render_to(fd, cells, palette, glyphs=None):
+    renderer = DamageRenderer(palette, glyphs)
+    for frame in cells:
+        output = renderer.render(frame)
+        view = memoryview(output)
+        while view:
+            view = view[os.write(fd, view):]
+    return renderer.bytes_written
+
+
+def render_through(writer, cells, palette):
+    # what playback does: the loop renders and queues, the writer thread writes
+    renderer = DamageRenderer(palette)
+    start = time.perf_counter()
+    for frame in cells:
+        writer.write(renderer.render(frame))
+    queued = time.perf_counter() - start
+    writer.close()
+    return queued, renderer.bytes_written
+
+
+def bench_render(frames):
+    results = {}
+    for name in ('truecolor', 'xterm256'):
+        palette = get_palette(name)
+        cells = [convert(frame, palette) for frame in frames]
+
+        with open(os.devnull, 'wb') as sink:
+            seconds, written = timed(render_to, sink.fileno(), cells, palette)
+        results[f'render {name} (null)'] = {'seconds': seconds, 'frames': len(cells), 'bytes': written}
+
+        if hasattr(os, 'openpty'):
+            # a real terminal device, with the flow control of one
+            master, slave = os.openpty()
+            reader = threading.Thread(target=drain, args=(master,), daemon=True)
+            reader.start()
+            seconds, written = timed(render_to, slave, cells, palette)
+            writer = TerminalWriter(slave).start()
+            writer_seconds, (queued_seconds, _) = timed(render_through, writer, cells, palette)
+            os.close(slave)
+            reader.join(timeout=1)
+            os.close(master)
+            results[f'render {name} (pty)'] = {'seconds': seconds, 'frames': len(cells), 'bytes': written}
+            results[f'render {name} (pty, writer thread)'] = {'seconds': writer_seconds, 'frames': len(cells), 'bytes': written}
+            # the part spent on the playback loop, the rest is left to the writer thread
+            results[f'render {name} (pty, loop only)'] = {'seconds': queued_seconds, 'frames': len(cells)}
+
+    for glyphs in (Glyphs('low'), Glyphs('high', color=True)):
+        palette = get_palette('truecolor')
+        cells = [glyphs.quantize(frame, palette) for frame in frames]
+        with open(os.devnull, 'wb') as sink:
+            seconds, written = timed(render_to, sink.fileno(), cells, palette, glyphs)
+        results[f'render glyphs {glyphs.name} (null)'] = {'seconds': seconds, 'frames': len(cells), 'bytes': written}
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, previous, threshold):
+    # prints the change of every stage present in both runs, returns the number of regressions
+    previous_fps = {(entry['resolution'], entry['stage']): entry['fps'] for entry in previous['results']}
+    regressions = 0
+    print(f"\ncompared with {previous['environment'].get('commit') or 'previous run'}")
+    for entry in results:
+        before = previous_fps.get((entry['resolution'], entry['stage']))
+        if not before:
+            continue
+        change = entry['fps'] / before - 1
+        slower = change < -threshold
+        regressions += slower
+        print(f"  {entry['resolution']:<10}{entry['stage']:<36}{change:>+8.1%}{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--resolutions', default=DEFAULT_RESOLUTIONS, help="comma separated WIDTHxHEIGHT cell grids")
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per resolution, the fastest one is kept")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON results of a previous run")
+    parser.add_argument('--threshold', type=float, default=0.1, help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        clip = generate_clip(directory, args.frames)
+        if clip is None:
+            print("ffmpeg unavailable, skipping decoding and using generated frames")
+
+        for resolution in args.resolutions.split(','):
+            width, height = parse_resolution(resolution)
+            stages = {}
+            for _ in range(args.repeat):
+                if clip is not None:
+                    frames, run = bench_decode(clip, width, height)
+                else:
+                    frames, run = np.stack(sample_clip(width, height, args.frames)), {}
+                run.update(bench_convert(frames, clip))
+                run.update(bench_pack(frames))
+                run.update(bench_container(frames, directory))
+                run.update(bench_render(frames))
+                for stage, measure in run.items():
+                    if stage not in stages or measure['seconds'] < stages[stage]['seconds']:
+                        stages[stage] = measure
+
+            print(f"{width}x{height}, {len(frames)} frames")
+            for stage, measure in stages.items():
+                fps = measure['frames'] / measure['seconds'] if measure['seconds'] else 0.0
+                results.append({'resolution': f'{width}x{height}', 'stage': stage, 'fps': fps, **measure})
+                size = f"{measure['bytes'] / measure['frames']:>14,.0f} B/frame" if 'bytes' in measure else ''
+                print(f"  {stage:<36}{fps:>12,.1f} fps{size}")
+
+    report = {'environment': environment(), 'frames': args.frames, 'repeat': args.repeat, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nresults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            raise SystemExit(f"{regressions} stage(s) slower than {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Command line interface, for converting videos without any prompt and playing the results.
+
+    python -m src.cli convert videos/ --output converted/ --height 60 --palette xterm256
+    python -m src.cli play converted/clip.vide --trace play.json
+    python -m src.cli bench-codecs converted/clip.vide
+    python -m src.cli serve converted/clip.vide --listen :7878 --loop
+    python -m src.cli connect wall-server:7878
+"""
+import argparse
+import os
+import struct
+from sys import stderr, stdout
+
+from src.utils.conversion import convert_file, convert_many, find_videos
+from src.utils.file.cache import VideoCache
+from src.utils.file.codecs import CODECS, DEFAULT_CODEC, bench_codec, get_codec
+from src.utils.file.tools import VideoReader
+from src.utils.glyphs import RAMPS, Glyphs, glyphs_for_brightness
+from src.utils.metrics import METRICS
+from src.utils.palette import PALETTES, get_palette
+from src.utils.protocol import DEFAULT_ADDRESS, DEFAULT_MAX_BUFFER, connect as connect_viewer
+
+# Block size other files are compressed in, about the size of a container chunk
+BENCH_BLOCK_BYTES = 1 << 20
+
+
+def report_file(input_filename, output_filename, frames, seconds, error):
+    if error is not None:
+        stderr.write(f"{input_filename}: failed, {error}\n")
+        return
+    fps = frames / seconds if seconds else 0.0
+    stdout.write(f"{input_filename} -> {output_filename}: {frames} frames in {seconds:.2f} s ({fps:.1f} fps)\n")
+    stdout.flush()
+
+
+def report_metrics(args):
+    # the stages' timings, when asked for, and the trace
+    if args.stats or args.trace:
+        stdout.write(METRICS.summary() + '\n')
+    if args.trace:
+        METRICS.write_trace(args.trace)
+        stdout.write(f"Trace written to {args.trace}\n")
+
+
+def convert(args):
+    if args.trace:
+        METRICS.start_trace()
+    input_filenames = find_videos(args.inputs)
+    if not input_filenames:
+        raise SystemExit("No video found")
+
+    palette = get_palette(args.palette, args.tolerance)
+    glyphs = Glyphs(args.glyphs, args.glyph_color) if args.glyphs else None
+    if glyphs is not None and args.half_block:
+        raise SystemExit("--glyphs and --half-block can't be combined")
+    try:
+        ladder = [int(height) for height in args.ladder.split(',')] if args.ladder else None
+    except ValueError:
+        raise SystemExit(f"--ladder takes comma separated heights, not {args.ladder}")
+
+    # a single video may be written to an explicit file, several always go to a directory
+    if len(input_filenames) == 1 and args.output and not os.path.isdir(args.output) and os.path.splitext(args.output)[1]:
+        processes = max(1, args.processes - 1) if args.processes else None # a core is left for decoding
+        frames, seconds = convert_file(input_filenames[0], args.output, palette, args.height, args.width, args.half_block, processes, args.codec, args.level, glyphs, ladder)
+        report_file(input_filenames[0], args.output, frames, seconds, None)
+        report_metrics(args)
+        return
+
+    frames, seconds, failures = convert_many(
+        input_filenames, args.output, palette, args.height, args.width, args.half_block,
+        jobs=args.jobs, cpus=args.processes, report=report_file, codec=args.codec, level=args.level, glyphs=glyphs, ladder=ladder,
+    )
+    fps = frames / seconds if seconds else 0.0
+    stdout.write(f"{len(input_filenames) - failures} of {len(input_filenames)} videos, {frames} frames in {seconds:.2f} s ({fps:.1f} fps overall)\n")
+    report_metrics(args)
+    if failures:
+        raise SystemExit(1)
+
+
+def play(args):
+    # the player needs the audio and keyboard libraries, converting doesn't
+    from src.converter import TerminalPlayer
+
+    player = TerminalPlayer(cache=False, trace=args.trace)
+    try:
+        player.play_file(args.container)
+    except KeyboardInterrupt:
+        stdout.write('\033[?1049l') # return to main buffer
+
+
+def open_container(path):
+    # a VideoReader, or None when the file isn't a container
+    try:
+        with open(path, 'rb') as file:
+            return VideoReader(file)
+    except (ValueError, struct.error):
+        return None
+
+
+def codec_samples(path):
+    # a container's chunks, decompressed, or the blocks of any other file
+    reader = open_container(path)
+    if reader is not None:
+        try:
+            return list(reader.chunk_payloads())
+        finally:
+            reader.close()
+
+    with open(path, 'rb') as file:
+        return list(iter(lambda: file.read(BENCH_BLOCK_BYTES), b''))
+
+
+def bench_codecs(args):
+    samples = codec_samples(args.file)
+    if not samples:
+        raise SystemExit(f"{args.file} is empty")
+    try:
+        codecs = [get_codec(name) for name in (args.codecs.split(',') if args.codecs else CODECS)]
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    stdout.write(f"{args.file}: {sum(map(len, samples)) / 1e6:.1f} MB in {len(samples)} chunks\n")
+    stdout.write(f"{'codec':<8}{'level':>6}{'ratio':>9}{'encode MB/s':>14}{'decode MB/s':>14}\n")
+    for codec in codecs:
+        levels = [int(level) for level in args.levels.split(',')] if args.levels and codec.levels else codec.levels or [None]
+        for level in levels:
+            ratio, encode_speed, decode_speed = bench_codec(codec, level, samples)
+            stdout.write(f"{codec.name:<8}{'-' if level is None else level:>6}{ratio:>9.2f}{encode_speed:>14,.1f}{decode_speed:>14,.1f}\n")
+            stdout.flush()
+
+
+def serve(args):
+    # the server runs on asyncio, only imported to serve
+    import asyncio
+    from src.utils.broadcast import BroadcastServer, video_frames
+
+    if not os.path.exists(args.source):
+        raise SystemExit(f"{args.source} doesn't exist")
+    palette = get_palette(args.palette, args.tolerance)
+    glyphs = Glyphs(args.glyphs, args.glyph_color) if args.glyphs else None
+    if glyphs is not None and args.half_block:
+        raise SystemExit("--glyphs and --half-block can't be combined")
+
+    reader = open_container(args.source)
+    if reader is not None:
+        if not reader.cells:
+            reader.close()
+            raise SystemExit(f"{args.source} doesn't hold cell grids, convert it again to serve it")
+        if reader.palette:
+            palette = get_palette(reader.palette, args.tolerance)
+        glyphs = glyphs_for_brightness(reader.brightness)
+        frames, frame_rate, shape, close = reader.deltas, reader.frame_rate, (reader.height, reader.width), reader.close
+    else:
+        cache = None if args.no_cache else VideoCache()
+        frames, frame_rate, shape, close = video_frames(args.source, palette, args.height, args.width, args.half_block, glyphs, cache)
+
+    server = BroadcastServer(frames, frame_rate, palette, glyphs, args.max_buffer, args.wait, args.loop)
+    stdout.write(f"Serving {args.source} ({shape[1]} X {shape[0]} cells) on {args.listen}, press Ctrl+C to stop\n")
+    try:
+        asyncio.run(server.serve(args.listen, shape))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close()
+    stdout.write(server.summary() + '\n')
+
+
+def connect(args):
+    try:
+        frames, keyframes, received = connect_viewer(args.address)
+    except KeyboardInterrupt:
+        return
+    except OSError as e:
+        raise SystemExit(f"Couldn't connect to {args.address}: {e}")
+    stdout.write(f"{frames} frames ({keyframes} keyframe(s)), {received / 1e6:.1f} MB received\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m src.cli', description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = commands.add_parser('convert', help="convert videos into containers")
+    convert_parser.add_argument('inputs', nargs='+', help="video files, directories or glob patterns")
+    convert_parser.add_argument('-o', '--output', help="output container, or directory for several videos (default: next to each video)")
+    convert_parser.add_argument('--height', type=int, default=48, help="rows of cells (default: 48)")
+    convert_parser.add_argument('--width', type=int, help="columns of cells (default: follows the aspect ratio)")
+    convert_parser.add_argument('--palette', choices=PALETTES, default='truecolor')
+    convert_parser.add_argument('--tolerance', type=float, default=0, help="truecolor perceptual tolerance")
+    convert_parser.add_argument('--half-block', action='store_true', help="two pixels per cell, drawn with half blocks")
+    convert_parser.add_argument('--glyphs', choices=RAMPS, help="draw characters picked by brightness instead of colored cells")
+    convert_parser.add_argument('--glyph-color', action='store_true', help="draw the glyphs in the palette's colors")
+    convert_parser.add_argument('--jobs', type=int, help="videos converted at a time (default: one per two cores)")
+    convert_parser.add_argument('--processes', type=int, help="cores to use in total (default: all of them)")
+    convert_parser.add_argument('--codec', choices=CODECS, default=DEFAULT_CODEC, help=f"chunk compression (default: {DEFAULT_CODEC})")
+    convert_parser.add_argument('--level', type=int, help="compression level (default: the codec's own)")
+    convert_parser.add_argument('--ladder', help="comma separated heights of smaller or larger renditions to store next to each container, for resized terminals")
+    convert_parser.add_argument('--stats', action='store_true', help="print the time spent in every stage")
+    convert_parser.add_argument('--trace', metavar='FILE', help="write the stages' timings as a Chrome trace (implies --stats)")
+    convert_parser.set_defaults(func=convert)
+
+    play_parser = commands.add_parser('play', help="play a converted container")
+    play_parser.add_argument('container')
+    play_parser.add_argument('--trace', metavar='FILE', help="write the stages' timings as a Chrome trace")
+    play_parser.set_defaults(func=play)
+
+    bench_parser = commands.add_parser('bench-codecs', help="compare compression codecs on a file")
+    bench_parser.add_argument('file', help="a container (its chunks are compressed again) or any other file")
+    bench_parser.add_argument('--codecs', help=f"comma separated codecs (default: every installed one, {', '.join(CODECS)})")
+    bench_parser.add_argument('--levels', help="comma separated levels (default: a few per codec)")
+    bench_parser.set_defaults(func=bench_codecs)
+
+    serve_parser = commands.add_parser('serve', help="stream a container or a video to terminals over the network")
+    serve_parser.add_argument('source', help="a container, or a video converted while it's served")
+    serve_parser.add_argument('--listen', default=DEFAULT_ADDRESS, help=f"HOST:PORT or unix:PATH (default: {DEFAULT_ADDRESS})")
+    serve_parser.add_argument('--height', type=int, default=48, help="rows of cells of a video (default: 48)")
+    serve_parser.add_argument('--width', type=int, help="columns of cells of a video (default: follows the aspect ratio)")
+    serve_parser.add_argument('--palette', choices=PALETTES, default='truecolor')
+    serve_parser.add_argument('--tolerance', type=float, default=0, help="truecolor perceptual tolerance")
+    serve_parser.add_argument('--half-block', action='store_true', help="two pixels per cell, drawn with half blocks")
+    serve_parser.add_argument('--glyphs', choices=RAMPS, help="draw characters picked by brightness instead of colored cells")
+    serve_parser.add_argument('--glyph-color', action='store_true', help="draw the glyphs in the palette's colors")
+    serve_parser.add_argument('--wait', type=int, default=0, help="viewers to wait for before starting (default: none)")
+    serve_parser.add_argument('--loop', action='store_true', help="start over once the video ends")
+    serve_parser.add_argument('--max-buffer', type=int, default=DEFAULT_MAX_BUFFER, help="bytes queued for a viewer before it's resynced")
+    serve_parser.add_argument('--no-cache', action='store_true', help="don't look videos up in the conversion cache or store them")
+    serve_parser.set_defaults(func=serve)
+
+    connect_parser = commands.add_parser('connect', help="show a served video on this terminal")
+    connect_parser.add_argument('address', help="HOST:PORT or unix:PATH")
+    connect_parser.set_defaults(func=connect)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
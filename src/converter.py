@@ -1,29 +1,53 @@
-# external libraries
-import ffmpeg, pyaudio, numpy as np
-from keyboard import add_hotkey, wait
-
-from rich.progress import Progress
-from rich.progress import Progress, TextColumn, BarColumn, TimeRemainingColumn, SpinnerColumn
+# external libraries are imported where they're used: playing a stored video only needs
+# numpy until its first frame is on screen (see benchmarks/importtime.py)
 
 # internal libraries
-from multiprocessing import Pool, Queue
 import threading
 
-import io, tempfile, time
-import wave
+import time
+import signal
 import os
 from os import system
 from sys import stdout
 
 # modules
-from src.utils.others import yt_download
+from src.utils.palette import get_palette
+from src.utils.audio import AudioBuffer, fill_buffer, wav_audio
+from src.utils.stream import FramePipeline, decode_audio, read_frames, stream_audio
+from src.utils.conversion import cache_variant, cells_format, convert_frame, frame_pipeline, ladder_pipeline, ladder_shapes, probe_video
+from src.utils.file.cache import BackgroundRecording, VideoCache
+from src.utils.file.tools import VideoReader
+from src.utils.render import DamageRenderer
+from src.utils.output import TerminalWriter
+from src.utils.clock import PlaybackClock
+from src.utils.governor import QualityGovernor
+from src.utils.glyphs import Glyphs, glyphs_for_brightness
+from src.utils.metrics import METRICS
+from src.utils.ladder import MARGIN_COLUMNS, MARGIN_LINES, LadderRecording, ReaderLadder, StackedLadder, closest_rendition, ladder_heights, rendition_paths
 
 class TerminalPlayer:
-    def __init__(self) -> None:
+    def __init__(self, streaming=True, cache=True, palette='truecolor', tolerance=0, half_block=False, glyphs=None, glyph_color=False, trace=None, ladder=None) -> None:
+        if glyphs and half_block:
+            raise ValueError("Glyph mode can't be combined with half blocks")
+        self.streaming = streaming # convert while playing instead of converting everything first
+        self.palette = get_palette(palette, tolerance) # output colors, see src.utils.palette
+        self.half_block = half_block # two vertical pixels per cell, drawn with '▀'
+        self.glyphs = Glyphs(glyphs, glyph_color) if glyphs else None # 'low' or 'high': characters picked by brightness, see src.utils.glyphs
+        self.cache = VideoCache() if cache else None
+        self.ladder = ladder # sizes of further renditions relative to the captured one (see src.utils.ladder.DEFAULT_LADDER), shown when the terminal is resized
+        self.resized = False # set by SIGWINCH, handled before the next frame
+        self.trace = trace # file the stages' timings are written to as a Chrome trace, see src.utils.metrics
+        METRICS.reset()
+        if trace:
+            METRICS.start_trace()
+        self.recording = None # cache entry filled while the first streamed playback runs
+        self.download = None # the video being streamed from a URL, if any
         self.playing = False
+        self.audio_started = threading.Event()
+        self.audio_buffer = None # decoded audio waiting for the output stream, see `play_audio`
+        self.audio_latency = 0.0
         self.stop = False
         self.windows = os.name == 'nt'
-        stdout.write('\033[?1049h') # initializes alternate buffer
 
     def extract_frames_and_audio(self, input_filename, target_frame_width, target_frame_height):
         """
@@ -31,8 +55,8 @@ class TerminalPlayer:
 
         This function reads a video file, extracts its audio in WAV format, and
         converts its frames to a specified width and height in RGB format. The
-        extracted frames are stored as numpy arrays and returned along with the
-        audio data.
+        extracted frames are stored in a single numpy array and returned along
+        with the audio data.
 
         Args:
             input_filename (str): The path to the video file.
@@ -41,79 +65,93 @@ class TerminalPlayer:
 
         Returns:
             tuple: A tuple containing:
-                - list: A list of numpy arrays representing the video frames.
+                - np.ndarray: A (frames, height, width, 3) array of the video frames.
                 - bytes: The audio data in WAV format.
         """
-        audio_data = (
-            ffmpeg
-            .input(input_filename)
-            .output('pipe:', format='wav', loglevel="quiet")
-            .run(capture_stdout=True, capture_stderr=True)
-        )[0] 
-
-        frames = []
-
-        process = (
-            ffmpeg
-            .input(input_filename)
-            .filter('scale', target_frame_width, target_frame_height)
-            .filter('format', 'rgb24')
-            .output('pipe:', format='rawvideo', pix_fmt='rgb24', loglevel="quiet")
-            .run_async(pipe_stdout=True, pipe_stderr=True)
-        )
+        audio_data = self.extract_audio(input_filename)
+        frames = read_frames(input_filename, target_frame_width, target_frame_height)
 
-        frame_size = target_frame_width * target_frame_height * 3 
-        while True:
-            in_bytes = process.stdout.read(frame_size)
-            if not in_bytes:
-                break
-            frame = np.frombuffer(in_bytes, np.uint8).reshape((target_frame_height, target_frame_width, 3)) 
+        return frames, audio_data
 
-            frames.append(frame)
+    def extract_audio(self, input_filename):
+        """
+        Decodes the audio track of a video file to WAV in memory.
 
-        process.stdout.close()
-        process.wait()
+        Args:
+            input_filename (str): The path to the video file.
 
-        return frames, audio_data
+        Returns:
+            bytes: The audio data in WAV format.
+        """
+        return decode_audio(input_filename)
 
-    def play_audio(self, content):
+    def play_audio(self, content, record=None):
         """
         Plays the given audio content using PyAudio.
 
+        The audio is decoded by a producer thread into a bounded `AudioBuffer` the output
+        stream reads from, so it starts playing right away and only a couple of seconds
+        of it are ever held in memory.
+
         Args:
-            content (bytes): The audio data in WAV format.
+            content (bytes | callable): The audio data in WAV format, or a function opening
+                an `AudioSource` (e.g. `stream_audio` or `VideoReader.audio_source`).
+            record (callable | None): Called with every PCM chunk decoded, see `fill_buffer`.
 
         """
+        import pyaudio
         
         p = pyaudio.PyAudio()
         
-        wf = wave.Wave_read(io.BytesIO(content))
+        source = content() if callable(content) else wav_audio(content)
+        buffer = AudioBuffer(source.rate, source.frame_size)
+        producer = threading.Thread(target=fill_buffer, args=(source, buffer, record), daemon=True)
+        producer.start()
         
         stream = p.open(
-            format=p.get_format_from_width(wf.getsampwidth()),
-            channels=wf.getnchannels(),
-            rate=wf.getframerate(),
+            format=p.get_format_from_width(source.sample_width),
+            channels=source.channels,
+            rate=source.rate,
             output=True
         )
 
-        data = wf.readframes(1024)
+        self.audio_buffer = buffer
+        self.audio_latency = stream.get_output_latency()
+
+        block = 1024 * source.frame_size
+        data = buffer.read(block)
         self.playing = True
         self.stop = False
+        self.audio_started.set()
         while len(data) > 0 and not self.stop:
             stream.write(data)
-            data = wf.readframes(1024)
+            data = buffer.read(block)
 
+        buffer.close()
+        producer.join()
         stream.stop_stream()
         stream.close()
         p.terminate()
         self.playing = False
 
 
+    def audio_position(self):
+        """
+        Returns the position of the audio being heard, in seconds.
+
+        The audio handed to the output stream minus the stream's output latency, or None
+        while no audio is playing.
+        """
+        if not self.playing or self.audio_buffer is None:
+            return None
+        return max(0.0, self.audio_buffer.position - self.audio_latency)
+
     def escape(self): # Function to be called by hotkey
         self.stop = True
 
     def start_hotkeys(self):
         # initialize and wait for hotkey in thread
+        from keyboard import add_hotkey, wait
 
         add_hotkey('q', self.escape)
         wait()
@@ -141,31 +179,23 @@ class TerminalPlayer:
 
         The function then extracts the frames and audio from the video and converts the frames to ASCII art. The function then returns the ASCII art frames, the frame rate of the video, and the audio bytes of the video.
 
+        In streaming mode, no frame is decoded here: the frames are returned as a `FramePipeline` that decodes and converts them while playing. Videos from a URL are never downloaded up front: the format closest to the captured resolution is streamed straight into ffmpeg, so playback starts after a few seconds.
+
         Args:
 
             None
 
         Returns:
 
-            list: A list of strings, where each string is an ASCII art frame of the video.
-            int: The frame rate of the video.
-            bytes: The audio bytes of the video.
+            list | FramePipeline: The ASCII art frames of the video, as a list of strings or a pipeline yielding them.
+            Fraction: The frame rate of the video.
+            callable: Opens the audio of the video as an `AudioSource`, see `play_audio`.
         """
         chooseyt = input("Do you want to use an Youtube URL? [Y/N] ")
+        remote = chooseyt.strip().lower() in ['y', 'yes', 'sim', 's']
 
-        if chooseyt.strip().lower() in ['y', 'yes', 'sim', 's']:
-            while True:
-                yt_url = input("Enter the video's URL: ")
-
-                args = yt_download(yt_url)
-                if not yt_url or not args:
-                    stdout.write(f"The URL '{yt_url}' doesn't exist!")
-                    continue
-                stdout.write(f"Video {args[1]} downloaded successfully.")
-                with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{args[2]}') as temp_file:
-                    temp_file.write(args[3])
-                    input_filename = temp_file.name
-                break
+        if remote:
+            yt_url = input("Enter the video's URL: ")
 
         else:
             while True:
@@ -180,43 +210,95 @@ class TerminalPlayer:
 
             terminal = os.get_terminal_size()
 
-            target_frame_width = terminal.columns - 1
-            target_frame_height = terminal.lines - 2
+            target_frame_width = terminal.columns - MARGIN_COLUMNS
+            target_frame_height = terminal.lines - MARGIN_LINES
 
             stdout.write(f"Terminal resolution captured: \033[48;5;28m{target_frame_width} X {target_frame_height}\033[0m\n")
             if input("Do you want to retake the resolution? (leave blank to continue) [Y/N] ").strip().lower() not in ['y', 'yes', 'sim', 's']:
                 break
 
+        # renditions for other terminal sizes, converted in the same pass as the captured one
+        heights = ladder_heights(target_frame_height, self.ladder) if self.ladder else [target_frame_height]
+
+        feed = None # writes the video into ffmpeg's stdin when it's streamed from a URL
+        source_id = None
+        if remote:
+            # the format is picked for the resolution, then streamed into ffmpeg while it downloads
+            from src.utils.others import yt_resolve
+            from src.utils.download import download_video, probe_stream
 
-        probe = ffmpeg.probe(input_filename)
-        vid_info = next(stream for stream in probe['streams'] if stream['codec_type'] == 'video')
-        vidW = int(vid_info['width'])
-        vidH = int(vid_info['height'])
+            while True:
+                video = yt_resolve(yt_url, heights[0] * (2 if self.half_block else 1)) if yt_url else False
+                if video:
+                    break
+                stdout.write(f"The URL '{yt_url}' doesn't exist!\n")
+                yt_url = input("Enter the video's URL: ")
 
-        ratio = vidW / vidH
-        target_frame_width = int(round(target_frame_height * ratio * 2))
+            stdout.write(f"Streaming {video['title']} ({video['width'] or '?'} X {video['height'] or '?'})\n")
+            # nothing is downloaded before the cache was looked up, its keys only need the video's ID
+            vidW, vidH, frame_rate, frame_count = probe_stream(video)
+            source_id = video['id']
+            input_filename = None # the download's spool, once it's started
+        else:
+            vidW, vidH, frame_rate, frame_count = probe_video(input_filename) # frame rate is exact, 29.97 fps is 30000/1001
+
+        shapes = ladder_shapes(vidW, vidH, heights)
+        current = heights.index(target_frame_height)
+        shape = shapes[current]
+        target_frame_width = shape[1]
 
         stdout.write(f"\nVideo resolution: {vidW} X {vidH}\n")
 
-        stdout.write(f"\nExtracting frames and audio...")
+        # half-block cells show two pixels each, frames are decoded at twice the height
+        scale = 2 if self.half_block else 1
+        brightness, palette_name = cells_format(self.palette, self.half_block, self.glyphs)
+        variant = cache_variant(self.palette, self.half_block, self.glyphs)
+
+        if self.cache is not None:
+            stdout.write("\nLooking for a cached conversion...")
+            # every rendition has an entry of its own
+            cache_keys = [self.cache.key(input_filename, width, height * scale, variant, source_id) for height, width in shapes]
+            cached = [self.cache.load(cache_key) for cache_key in cache_keys]
+            if all(cached):
+                stdout.write(" Found, skipping conversion\n")
+                if len(cached) == 1:
+                    return cached[0]
+                return ReaderLadder([frames for frames, _, _ in cached], current), cached[0][1], cached[0][2]
+            for entry in filter(None, cached):
+                entry[0].close()
+            stdout.write(" Not found\n")
+
+        if remote:
+            self.download = download_video(video)
+            input_filename = self.download.path
+            feed = self.download.feed
+
+        # decoded frames and cell grids are handed to the workers through shared memory
+        prebuffer = max(1, int(frame_rate) // 4) # batches of 4 frames, about a second of video
+        if len(shapes) > 1:
+            pipeline = ladder_pipeline(input_filename, shapes, self.palette, self.half_block, feed, self.glyphs, prebuffer=prebuffer)
+        else:
+            pipeline = frame_pipeline(input_filename, shape, self.palette, self.half_block, feed, self.glyphs, prebuffer=prebuffer)
 
-        frame_bytes, audio_bytes = self.extract_frames_and_audio(input_filename, target_frame_width, target_frame_height)
+        # audio is decoded by its own ffmpeg alongside the frames, chunk by chunk as it plays
+        audio_bytes = lambda: stream_audio(input_filename, feed)
 
-        frame_chars = target_frame_width * target_frame_height
-        video_lenght = len(frame_bytes)
+        if self.streaming:
+            stdout.write(f"\nAudio and frames will be decoded while {'downloading' if remote else 'playing'}\n")
+            if self.cache is not None:
+                # the audio is stored as it plays, see `play_frames`
+                self.recording = self._store(cache_keys, shapes, frame_rate, brightness, palette_name)
 
-        stdout.write(f" Extracted {video_lenght} frames from video\n")
-        stdout.write(f"Approximate characters per frame: {frame_chars}\n")
+            return (StackedLadder(pipeline, shapes, current) if len(shapes) > 1 else pipeline), frame_rate, audio_bytes
 
-        processes = 7
+        stdout.write(f"Approximate characters per frame: {shape[0] * shape[1]}\n")
 
-        frame_bytes = self.batch(frame_bytes, round(len(frame_bytes) / (processes * 2))) # batches frames to reduce function calling, increase multiplication to increase batches
+        from rich.progress import Progress, TextColumn, BarColumn, TimeRemainingColumn, SpinnerColumn
 
         stdout.write("Converting frames to ASCII...\n")
         time_snapshot = time.time()
 
         frames_ascii = []
-        queue = Queue()
 
         with Progress(
             SpinnerColumn(),
@@ -224,78 +306,37 @@ class TerminalPlayer:
             BarColumn(),
             TimeRemainingColumn(),
         ) as progress:
-            task = progress.add_task("[yellow]Converting frames...", total=len(frame_bytes))
-
-            def monitor_progress(queue):
-                while not progress.finished:
-                    queue.get()
-                    progress.update(task, advance=1)
-
-            progress_thread = threading.Thread(target=monitor_progress, args=(queue,))
-            progress_thread.start()
-
-            with Pool(processes=processes) as pool:
-                for frame_batch in pool.imap(self.process_frame, frame_bytes):
-                    frames_ascii += frame_batch
-                    queue.put(1)
-
-            progress_thread.join()
-
-        stdout.write(f"Frame conversion completed in {round(time.time() - time_snapshot, 4)} seconds.")
-
-        frame_rate_str = vid_info['r_frame_rate']
-        if '/' in frame_rate_str:
-            num, denom = map(int, frame_rate_str.split('/'))
-            frame_rate = round(num / denom)
-        else:
-            frame_rate = int(frame_rate_str)
-
+            task = progress.add_task("[yellow]Converting frames...", total=frame_count)
+
+            for frame in pipeline:
+                frames_ascii.append(frame.copy()) # the pipeline reuses its output buffers
+                progress.update(task, advance=1)
+
+        pipeline.close()
+        stdout.write(f"Converted {len(frames_ascii)} frames in {round(time.time() - time_snapshot, 4)} seconds.")
+
+        if self.cache is not None:
+            entry = self._store(cache_keys, shapes, frame_rate, brightness, palette_name)
+            for frame in frames_ascii:
+                entry.add(frame)
+            with audio_bytes() as audio:
+                for pcm in audio:
+                    entry.add_audio(pcm)
+            entry.commit()
+
+        if len(shapes) > 1:
+            return StackedLadder(frames_ascii, shapes, current), frame_rate, audio_bytes
         return frames_ascii, frame_rate, audio_bytes
-    
-    def process_frame(self, byte_content):
-        batch = []
-
-        for image in byte_content:
-            rgb_pixels = np.array(image, dtype=np.int32)
-
-            ascii_image = []
-
-            height, width, _ = rgb_pixels.shape
-            last_rgb = np.zeros((3,), dtype=np.int32)
 
-            ansi_colors = np.full((height, width), "\033[0m", dtype=object)
-            color_changes = np.zeros((height, width), dtype=bool) 
+    def _store(self, cache_keys, shapes, frame_rate, brightness, palette_name):
+        # the cache entry of a conversion, or of every rendition of it, filled from stacked cell grids;
+        # written from its own thread, so storing a chunk never holds the playback loop up
+        entries = [self.cache.store(cache_key, frame_rate, None, shape, brightness, palette_name) for cache_key, shape in zip(cache_keys, shapes)]
+        return BackgroundRecording(LadderRecording(entries, shapes) if len(entries) > 1 else entries[0])
 
-            for y in range(height):
-                for x in range(width):
-                    current_rgb = rgb_pixels[y, x]
-
-                    distance = 0
-                    for i in range(3):
-                        distance += abs(current_rgb[i] - last_rgb[i])
-
-                    if distance > 0 or (y == 0 and x == 0):
-                        ansi_colors[y, x] = f"\033[48;2;{current_rgb[0]};{current_rgb[1]};{current_rgb[2]}m"
-                        color_changes[y, x] = True
-                        last_rgb = current_rgb
-                    else:
-                        ansi_colors[y, x] = ansi_colors[y, x-1]  # use the previous color if no change
-
-            # create the ANSI sequence directly without printing
-            for y in range(height):
-                ascii_row = []
-                for x in range(width):
-                    if color_changes[y, x]:
-                        ascii_row.append(ansi_colors[y, x] + " ")  # use ANSI color
-                    else:
-                        ascii_row.append(" ")  # use the same character without color change
-                ascii_image.append("".join(ascii_row))
-
-            # append the final ANSI sequences image for this frame
-            batch.append("\n".join(ascii_image))
-
-        # return the batch containing the ANSI sequences for the images
-        return batch
+    def process_frame(self, byte_content):
+        # converts a batch of frames into cell grids for the palette, drawn by src.utils.render
+        return [convert_frame(image, self.palette, self.half_block, self.glyphs) for image in byte_content]
     
     def main(self):
         """
@@ -318,11 +359,194 @@ class TerminalPlayer:
             if self.windows:
                 system("cls")
             else:
-                system("clear")
+                # the sequences `clear` would print, without starting a process for it
+                stdout.write('\033[H\033[2J')
+                stdout.flush()
         except Exception as e:
             stdout.write("Couldn't clear terminal: " + str(e))
             stdout.write("\nSkipping...\n")
 
+    def _init_colors(self):
+        try:
+            from colorama import init # type: ignore
+            init()
+        except ImportError:
+            stdout.write("WARNING: Couldn't import colorama, color support might not be avaliable on your terminal.\n")
+
+    def play_file(self, path):
+        """
+        Plays a converted container (see `src.cli convert`) without any prompt.
+
+        Renditions of other sizes stored next to it (see `src.cli convert --ladder`) are
+        shown when the terminal is resized.
+
+        Args:
+            path (str): The path to the container.
+        """
+        stdout.write('\033[?1049h') # initializes alternate buffer
+        readers = []
+        try:
+            for rendition in rendition_paths(path):
+                with open(rendition, 'rb') as file:
+                    readers.append(VideoReader(file))
+            first = readers[0]
+            if first.palette:
+                self.palette = get_palette(first.palette)
+            self.glyphs = glyphs_for_brightness(first.brightness)
+            self._init_colors()
+            frames = ReaderLadder(readers) if len(readers) > 1 else first
+            self.play_frames(frames, first.frame_rate, first.audio_source)
+        finally:
+            for reader in readers:
+                reader.close()
+            stdout.write('\033[?1049l') # return to main buffer
+
+    def play_frames(self, frames_ascii, frame_rate, audio_bytes):
+        """
+        Plays converted frames once, in sync with the audio.
+
+        Args:
+            frames_ascii (list | FramePipeline | VideoReader): The cell grids to draw.
+            frame_rate (Fraction): The frame rate of the video.
+            audio_bytes (bytes | callable): The audio, see `play_audio`.
+        """
+        hk = threading.Thread(target=self.start_hotkeys, daemon=True)
+        hk.start()
+
+        ladder = frames_ascii if isinstance(frames_ascii, (StackedLadder, ReaderLadder)) else None
+        pipeline = frames_ascii.frames if isinstance(frames_ascii, StackedLadder) else frames_ascii
+        streaming = isinstance(pipeline, FramePipeline)
+        if streaming:
+            # start converting and only start the clock once a few frames are ready
+            pipeline.start()
+            pipeline.wait_ready()
+        
+        recording = self.recording
+        self.recording = None
+
+        self.audio_started.clear()
+        audio_thread = threading.Thread(target=self.play_audio, args=(audio_bytes, recording.add_audio if recording else None))
+        audio_thread.start()
+
+        stored = isinstance(frames_ascii, (VideoReader, ReaderLadder))
+        if not stored:
+            self.audio_started.wait()
+            self._clearBuffer()
+
+        stdout.write('\033[?25l') # hides cursor
+
+        renderer = DamageRenderer(self.palette, self.glyphs)
+        # frames are written to the terminal from another thread, the loop never waits for it
+        writer = TerminalWriter().start()
+        dirty_rows = None # rows changed since the last drawn frame, None when unknown
+
+        self.resized = False
+        if ladder is not None:
+            # the terminal may have been resized since the resolution was captured
+            self._resize(ladder, renderer)
+        if stored:
+            # stored frames can be read right away: the first one is shown while the audio
+            # output opens, and drawing it again once the clock starts costs nothing
+            renderer.reset(clear=True)
+            if len(frames_ascii):
+                writer.write(renderer.render(frames_ascii[0]))
+            self.audio_started.wait()
+
+        clock = PlaybackClock(frame_rate, self.audio_position)
+        # glyph cells hold levels next to their colors, only the frame rate can be lowered
+        governor = QualityGovernor(clock.frame_duration, packed_colors=not self.palette.indexed and self.glyphs is None)
+        clock.start()
+
+        handle_resize = hasattr(signal, 'SIGWINCH') and threading.current_thread() is threading.main_thread()
+        if handle_resize:
+            previous_handler = signal.signal(signal.SIGWINCH, self._on_resize)
+
+        record = recording.add if recording else None
+        if isinstance(frames_ascii, StackedLadder):
+            # every rendition is recorded as it's converted, not only the one shown
+            frames = frames_ascii.deltas(record)
+            record = None
+        elif isinstance(frames_ascii, (VideoReader, ReaderLadder)):
+            # stored videos already know which rows changed between frames
+            frames = frames_ascii.deltas()
+        else:
+            frames = ((frame, None) for frame in frames_ascii)
+
+        for i, (frame, changed_rows) in enumerate(frames):
+            if self.stop:
+                break
+            if record:
+                record(frame)
+
+            if self.resized:
+                self.resized = False
+                self._resize(ladder, renderer)
+                dirty_rows = None
+                if ladder is not None and frame.shape != ladder.shapes[ladder.current]:
+                    # drawn at the old size, the frame wouldn't fit; the next one is the new rendition
+                    continue
+
+            if changed_rows is None:
+                dirty_rows = None
+            elif dirty_rows is not None:
+                dirty_rows.update(changed_rows)
+
+            if governor.should_draw(i) and clock.should_draw(i):
+                clock.wait(i)
+                draw_start = time.perf_counter()
+
+                # only the cells that changed since the last drawn frame are written
+                with METRICS.span('render'):
+                    output = renderer.render(governor.apply(frame), dirty_rows)
+                METRICS.observe('frame bytes', len(output))
+                writer.write(output)
+                dirty_rows = set()
+
+                # what the terminal cost since the previous drawn frame, queue stalls included
+                governor.record(writer.take_cost(), len(output))
+                clock.drew(time.perf_counter() - draw_start)
+
+        writer.close()
+        if handle_resize:
+            signal.signal(signal.SIGWINCH, previous_handler)
+        if streaming:
+            pipeline.stop()
+        audio_thread.join() # the recording's audio is complete once it finished playing
+        if recording:
+            # only a complete playback leaves a usable conversion behind
+            if self.stop:
+                recording.abort()
+            else:
+                recording.commit()
+        stdout.write('\033[?25h') # show cursor
+
+        stdout.write(f"\033[0m\n{clock.summary()}\n{governor.summary()}\n{writer.summary()}\n")
+        if renderer.frames_rendered:
+            stdout.write(f"{renderer.bytes_written // renderer.frames_rendered} bytes per frame on average\n")
+        stdout.write(METRICS.summary() + '\n')
+        if self.trace:
+            METRICS.write_trace(self.trace)
+            stdout.write(f"Trace written to {self.trace}\n")
+
+
+    def _on_resize(self, signum, frame):
+        # SIGWINCH handler, the frame loop takes care of it
+        self.resized = True
+
+    def _resize(self, ladder, renderer):
+        # switches to the rendition closest to the terminal's new size and draws everything again
+        try:
+            terminal = os.get_terminal_size()
+        except OSError:
+            terminal = None
+        if ladder is not None and terminal is not None:
+            index = closest_rendition(ladder.shapes, terminal.columns, terminal.lines)
+            if index != ladder.current:
+                ladder.select(index)
+                METRICS.count('rendition switches')
+        # the terminal reflowed what was displayed, the next frame is drawn in full on a clear screen
+        renderer.reset(clear=True)
+
     def _main(self):
         """
         Core function to handle video playback in the terminal using curses.
@@ -341,75 +565,23 @@ class TerminalPlayer:
             - Monitors for user input to stop playback and clear the terminal.
             - Provides an option for the user to replay the video or exit.
         """
+        stdout.write('\033[?1049h') # initializes alternate buffer
         frames_ascii, frame_rate, audio_bytes = self.create_video()
 
         input("\nPress enter to play (while playing, press Q to exit)... ")
         
-        try:
-            from colorama import init # type: ignore
-            init()
-        except ImportError:
-            stdout.write("WARNING: Couldn't import colorama, color support might not be avaliable on your terminal.\n")
-
-        def play_frames():
-            hk = threading.Thread(target=self.start_hotkeys)
-            hk.start()
-            
-            audio_thread = threading.Thread(target=self.play_audio, args=(audio_bytes,))
-            audio_thread.start()
-
-            while self.playing is not True:
-                continue
+        self._init_colors()
 
-            self._clearBuffer()
-
-            frame_duration = 1 / frame_rate
-            start_time = time.time()
-
-            stdout.write('\033[?25l') # hides cursor
-
-            previous_frame = None
-
-            for i, frame in enumerate(frames_ascii):
-                if self.stop:
-                    break
-                elapsed_time = time.time() - start_time
-                expected_frame = int(elapsed_time / frame_duration)
-
-                if i >= expected_frame:
-                    if previous_frame:
-                        if previous_frame == frame:
-                            # avoid draws if identic frame
-                            time_to_sleep = frame_duration - (time.time() - (start_time + i * frame_duration))
-                            time.sleep(max(0, time_to_sleep))
-                            continue
-
-                        changes = ""
-                            
-                        # only redraw lines that have changed compared to the previous frame
-                        for line_index, (prev_line, new_line) in enumerate(zip(previous_frame.splitlines(), frame.splitlines())):
-                            if prev_line != new_line:
-                                changes += f'\033[{line_index + 1};0H{new_line}'
-                        
-                        if changes:
-                            stdout.write(changes)
-                            
-                    else:
-                        stdout.write('\033[H' + frame)
-                    stdout.flush()
-                    previous_frame = frame
-
-                time_to_sleep = frame_duration - (time.time() - (start_time + i * frame_duration))
-                time.sleep(max(0, time_to_sleep))
-                
-            audio_thread.join()
-            stdout.write('\033[?25h') # show cursor
-
-        play_frames()
+        self.play_frames(frames_ascii, frame_rate, audio_bytes)
         while True:
             if input("Do you want to play again? (Y/N): ").strip().lower() in ['y', 'yes', 'sim', 's']: 
-                play_frames()
+                self.play_frames(frames_ascii, frame_rate, audio_bytes)
             if input("Are you sure? (Y/N): ").strip().lower() in ['y', 'yes', 'sim', 's']: 
+                pipeline = frames_ascii.frames if isinstance(frames_ascii, StackedLadder) else frames_ascii
+                if isinstance(pipeline, FramePipeline):
+                    pipeline.close()
+                if self.download:
+                    self.download.close()
                 stdout.write('\033[?1049l') # return to main buffer
                 exit(0)
         
@@ -0,0 +1,232 @@
+import io
+import threading
+import wave
+
+import numpy as np
+
+# (sample rate, channels, bytes per sample) of decoded audio: 16-bit stereo PCM at 44.1 kHz
+AUDIO_FORMAT = (44100, 2, 2)
+
+# Audio decoded ahead of the output stream by default, see `AudioBuffer`
+DEFAULT_BUFFER_SECONDS = 2.0
+
+# Audio frames read from a WAV file per chunk
+WAV_CHUNK_FRAMES = 1 << 14
+
+
+class AudioSource:
+    """
+    PCM audio read chunk by chunk, from a decoder, a container or WAV bytes.
+
+    Iterating yields the raw interleaved samples as bytes; `close` stops whatever
+    produces them (e.g. kills the decoder) when playback is abandoned midway.
+    """
+
+    def __init__(self, chunks, rate, channels, sample_width):
+        """
+        Args:
+            chunks (iterable): Yields the PCM data, in order.
+            rate (int): Audio frames per second.
+            channels (int): Interleaved channels per audio frame.
+            sample_width (int): Bytes per sample.
+        """
+        self.chunks = chunks
+        self.rate = rate
+        self.channels = channels
+        self.sample_width = sample_width
+
+    @property
+    def format(self):
+        return self.rate, self.channels, self.sample_width
+
+    @property
+    def frame_size(self):
+        # bytes per audio frame, one sample per channel
+        return self.channels * self.sample_width
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+
+def _wav_chunks(wav, start_frame):
+    try:
+        wav.setpos(min(start_frame, wav.getnframes()))
+        while data := wav.readframes(WAV_CHUNK_FRAMES):
+            yield data
+    finally:
+        wav.close()
+
+
+def wav_audio(wav_bytes, start=0.0):
+    """
+    Reads WAV data held in memory as an audio source.
+
+    Args:
+        wav_bytes (bytes): The audio data in WAV format.
+        start (float): Position to start from, in seconds.
+
+    Returns:
+        AudioSource: The audio.
+    """
+    wav = wave.open(io.BytesIO(wav_bytes))
+    return AudioSource(
+        _wav_chunks(wav, int(start * wav.getframerate())),
+        wav.getframerate(), wav.getnchannels(), wav.getsampwidth(),
+    )
+
+
+def wav_bytes(pcm, audio_format=AUDIO_FORMAT):
+    """
+    Wraps PCM data in a WAV header.
+
+    Args:
+        pcm (bytes | iterable): The PCM data, or chunks of it.
+        audio_format (tuple): The (sample rate, channels, bytes per sample) of the data.
+
+    Returns:
+        bytes: The audio data in WAV format.
+    """
+    rate, channels, sample_width = audio_format
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as wav:
+        wav.setframerate(rate)
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        for chunk in ([pcm] if isinstance(pcm, (bytes, bytearray, memoryview)) else pcm):
+            wav.writeframesraw(chunk)
+    return output.getvalue()
+
+
+class AudioBuffer:
+    """
+    Bounded ring of PCM data between an audio source and the output stream.
+
+    A producer thread `write`s decoded audio into it, blocking while it's full, and
+    playback `read`s it back, so decoding or decompression stalls are absorbed without
+    ever holding more than `seconds` of audio in memory. The audio frames read so far
+    give the playback position.
+    """
+
+    def __init__(self, rate, frame_size, seconds=DEFAULT_BUFFER_SECONDS):
+        """
+        Args:
+            rate (int): Audio frames per second.
+            frame_size (int): Bytes per audio frame.
+            seconds (float): Capacity of the ring.
+        """
+        self.rate = rate
+        self.frame_size = frame_size
+        self.ring = np.empty(max(1, int(rate * seconds)) * frame_size, dtype=np.uint8)
+
+        self.start = 0 # ring offset of the oldest byte not read yet
+        self.size = 0 # bytes written and not read yet
+        self.frames_read = 0
+        self.finished = False # the producer wrote everything
+        self.closed = False # the consumer went away
+        self._changed = threading.Condition()
+
+    @property
+    def position(self):
+        # seconds of audio handed to the output so far
+        return self.frames_read / self.rate
+
+    def write(self, data):
+        """
+        Appends PCM data, waiting for room as needed.
+
+        Args:
+            data (bytes): The data.
+
+        Returns:
+            bool: False when the buffer was closed before everything could be written.
+        """
+        data = np.frombuffer(data, dtype=np.uint8)
+        capacity = len(self.ring)
+        offset = 0
+        while offset < len(data):
+            with self._changed:
+                while self.size == capacity and not self.closed:
+                    self._changed.wait()
+                if self.closed:
+                    return False
+
+                count = min(len(data) - offset, capacity - self.size)
+                end = (self.start + self.size) % capacity
+                first = min(count, capacity - end) # the part before the ring wraps around
+                self.ring[end:end + first] = data[offset:offset + first]
+                self.ring[:count - first] = data[offset + first:offset + count]
+                self.size += count
+                offset += count
+                self._changed.notify_all()
+        return True
+
+    def read(self, size):
+        """
+        Takes up to `size` bytes of whole audio frames, waiting while the ring is empty.
+
+        Args:
+            size (int): Maximum number of bytes.
+
+        Returns:
+            bytes: The data, empty once the producer finished and everything was read
+                (or the buffer was closed).
+        """
+        capacity = len(self.ring)
+        with self._changed:
+            while self.size < self.frame_size and not self.finished and not self.closed:
+                self._changed.wait()
+            if self.closed:
+                return b''
+
+            count = min(size, self.size)
+            count -= count % self.frame_size
+            first = min(count, capacity - self.start)
+            data = self.ring[self.start:self.start + first].tobytes() + self.ring[:count - first].tobytes()
+            self.start = (self.start + count) % capacity
+            self.size -= count
+            self.frames_read += count // self.frame_size
+            self._changed.notify_all()
+        return data
+
+    def finish(self):
+        # marks the end of the audio, reads return what's left and then nothing
+        with self._changed:
+            self.finished = True
+            self._changed.notify_all()
+
+    def close(self):
+        # abandons the buffer, unblocking the producer
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+
+def fill_buffer(source, buffer, record=None):
+    """
+    Copies an audio source into a buffer until either ends, then closes the source.
+
+    Args:
+        source (AudioSource): The audio.
+        buffer (AudioBuffer): The buffer, finished once the source is exhausted.
+        record (callable | None): Also called with every chunk, e.g. to store the audio
+            while it plays.
+    """
+    try:
+        for chunk in source:
+            if record:
+                record(chunk)
+            if not buffer.write(chunk):
+                break
+    finally:
+        buffer.finish()
+        source.close()
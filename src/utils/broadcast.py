@@ -0,0 +1,271 @@
+import asyncio
+import os
+import time
+
+from src.utils.conversion import cache_variant, cells_format, cells_shape, frame_pipeline, probe_video
+from src.utils.file.cache import BackgroundRecording
+from src.utils.protocol import DEFAULT_MAX_BUFFER, DELTA, END, HELLO, KEYFRAME, MESSAGE, PROTOCOL_VERSION, parse_address
+from src.utils.render import DamageRenderer
+from src.utils.stream import stream_audio
+
+# Seconds viewers get to read the end of the broadcast before the server exits
+CLOSE_TIMEOUT = 5
+
+
+def video_frames(input_filename, palette, height, width=None, half_block=False, glyphs=None, cache=None):
+    """
+    Converts a video for a broadcast, or opens its cached conversion.
+
+    Args:
+        input_filename (str): The path to the video file.
+        palette (Palette): The output palette.
+        height (int): Rows of cells.
+        width (int | None): Columns of cells, None to follow the video's aspect ratio.
+        half_block (bool): Whether to produce half-block cells.
+        glyphs (Glyphs | None): Produces glyph cells instead (see src.utils.glyphs).
+        cache (VideoCache | None): Where conversions are looked up and stored; the first
+            complete pass of a conversion is stored, audio included, for the player too.
+
+    Returns:
+        tuple: A function returning a new iterator of (cells, changed rows) per frame, the
+            frame rate, the (height, width) of the cell grids and a function releasing the source.
+    """
+    video_width, video_height, frame_rate, _ = probe_video(input_filename)
+    shape = cells_shape(video_width, video_height, height, width)
+    decode_height = shape[0] * 2 if half_block else shape[0]
+
+    if cache is not None:
+        key = cache.key(input_filename, shape[1], decode_height, cache_variant(palette, half_block, glyphs))
+        cached = cache.load(key)
+        if cached:
+            frames, frame_rate, _ = cached
+            return frames.deltas, frame_rate, shape, frames.close
+
+    pipeline = frame_pipeline(input_filename, shape, palette, half_block, glyphs=glyphs)
+    brightness, palette_name = cells_format(palette, half_block, glyphs)
+    passes = 0
+
+    def frames():
+        nonlocal passes
+        passes += 1
+        # stored from its own thread, see `BackgroundRecording`
+        entry = BackgroundRecording(cache.store(key, frame_rate, None, shape, brightness, palette_name)) if cache is not None and passes == 1 else None
+        pipeline.start()
+        completed = False
+        try:
+            for cells in pipeline:
+                if entry:
+                    entry.add(cells)
+                yield cells, None
+            completed = True
+        finally:
+            pipeline.stop()
+            if entry and completed:
+                with stream_audio(input_filename) as audio:
+                    for pcm in audio:
+                        entry.add_audio(pcm)
+                entry.commit()
+            elif entry:
+                entry.abort()
+
+    return frames, frame_rate, shape, pipeline.close
+
+
+class Viewer:
+    # a connected viewer and what it was sent
+    def __init__(self, writer):
+        self.writer = writer
+        self.synced = False # whether it shows the previous frame, so deltas apply
+        self.frames = 0
+        self.keyframes = 0
+        self.skipped = 0 # frames it missed while its buffer was full
+
+    @property
+    def buffered(self):
+        return self.writer.transport.get_write_buffer_size()
+
+
+class BroadcastServer:
+    """
+    Converts a video once and streams it to any number of viewers.
+
+    Frames are rendered by a single shared `DamageRenderer` and the same delta is
+    written to every viewer, so the per-viewer cost is a socket write. Writes never
+    block the broadcast: each viewer's socket buffers on its own, and a viewer whose
+    buffer grows past `max_buffer` bytes stops receiving deltas. Once it drained
+    what it had, it is resynced with a keyframe of the current frame and follows the
+    deltas again, so a slow terminal drops frames instead of holding memory or
+    delaying the others. New viewers start with a keyframe the same way.
+    """
+
+    def __init__(self, frames, frame_rate, palette, glyphs=None, max_buffer=DEFAULT_MAX_BUFFER, min_viewers=0, loop=False, realtime=True):
+        """
+        Args:
+            frames (callable): Returns a new iterator of (cells, changed rows or None) per frame,
+                e.g. `VideoReader.deltas` or the first result of `video_frames`.
+            frame_rate (Fraction): The frame rate of the video.
+            palette (Palette): The palette of the cells.
+            glyphs (Glyphs | None): The glyph mode of the cells, None for colored blocks.
+            max_buffer (int): Bytes queued for a viewer before it's resynced.
+            min_viewers (int): Viewers to wait for before the broadcast starts.
+            loop (bool): Whether to start over once the video ends, until stopped.
+            realtime (bool): Whether frames are paced at the frame rate, or sent as fast as
+                they are rendered (for load tests).
+        """
+        self.frames = frames
+        self.frame_rate = frame_rate
+        self.renderer = DamageRenderer(palette, glyphs, shared=True)
+        self.max_buffer = max_buffer
+        self.min_viewers = min_viewers
+        self.loop = loop
+        self.realtime = realtime
+
+        self.shape = (0, 0)
+        self.viewers = set()
+        self._handlers = set()
+        self.stopped = False
+        self._joined = None
+
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.resyncs = 0 # keyframes sent to viewers that fell behind
+        self.late = 0 # frames rendered after their time
+        self.max_lag = 0.0
+
+    async def _accept(self, reader, writer):
+        height, width = self.shape
+        writer.write(HELLO.pack(b'ASCB', PROTOCOL_VERSION, width, height, self.frame_rate.numerator, self.frame_rate.denominator))
+        viewer = Viewer(writer)
+        self.viewers.add(viewer)
+        self._handlers.add(asyncio.current_task())
+        self._joined.set()
+        try:
+            # viewers don't send anything, reading only notices them leaving
+            await reader.read()
+        except (ConnectionError, asyncio.CancelledError):
+            pass # gone, or the server is shutting down
+        finally:
+            self.viewers.discard(viewer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    def _send(self, index, delta):
+        keyframe = None
+        for viewer in list(self.viewers):
+            if viewer.writer.is_closing():
+                self.viewers.discard(viewer)
+                continue
+
+            buffered = viewer.buffered
+            if viewer.synced and buffered > self.max_buffer:
+                # too far behind, it skips frames until it has drained
+                viewer.synced = False
+                if viewer.keyframes:
+                    self.resyncs += 1
+            if not viewer.synced:
+                if buffered > self.max_buffer // 4:
+                    viewer.skipped += 1
+                    continue
+                keyframe = keyframe or self.renderer.keyframe()
+                kind, payload = KEYFRAME, keyframe
+                viewer.synced = True
+                viewer.keyframes += 1
+            elif delta:
+                kind, payload = DELTA, delta
+            else:
+                continue
+
+            viewer.writer.write(MESSAGE.pack(kind, index, len(payload)) + payload)
+            viewer.frames += 1
+            self.bytes_sent += MESSAGE.size + len(payload)
+
+    def _render(self, frames):
+        # pulls and renders the next frame, run in a worker thread
+        item = next(frames, None)
+        if item is None:
+            return None
+        cells, rows = item
+        return self.renderer.render(cells, rows)
+
+    async def _broadcast(self):
+        index = 0
+        start = time.perf_counter()
+        while not self.stopped:
+            frames = iter(self.frames())
+            try:
+                while not self.stopped:
+                    delta = await asyncio.to_thread(self._render, frames)
+                    if delta is None:
+                        break
+                    self._send(index, delta)
+                    self.frames_sent += 1
+                    index += 1
+
+                    if self.realtime:
+                        lag = time.perf_counter() - (start + index / self.frame_rate)
+                        if lag > 0:
+                            self.late += 1
+                            self.max_lag = max(self.max_lag, lag)
+                        await asyncio.sleep(max(-lag, 0))
+                    else:
+                        await asyncio.sleep(0) # lets the viewers' sockets be served
+            finally:
+                if hasattr(frames, 'close'):
+                    await asyncio.to_thread(frames.close)
+            if not self.loop:
+                break
+
+    async def serve(self, address, shape, ready=None):
+        """
+        Runs the broadcast until the video ends (or `stop` is called).
+
+        Args:
+            address (str): Where to listen, see `parse_address`.
+            shape (tuple): The (height, width) of the frames' cell grids, sent to viewers.
+            ready (callable | None): Called once the server listens.
+        """
+        self.shape = shape
+        self._joined = asyncio.Event()
+        address = parse_address(address)
+        if address[0] == 'unix':
+            if os.path.exists(address[1]):
+                os.remove(address[1]) # left behind by a previous server
+            server = await asyncio.start_unix_server(self._accept, address[1])
+        else:
+            server = await asyncio.start_server(self._accept, address[1], address[2])
+
+        try:
+            if ready:
+                ready()
+            while len(self.viewers) < self.min_viewers and not self.stopped:
+                self._joined.clear()
+                await self._joined.wait()
+            await self._broadcast()
+        finally:
+            server.close()
+            for viewer in list(self.viewers):
+                if not viewer.writer.is_closing():
+                    if not viewer.synced and self.renderer.screen is not None:
+                        # viewers that fell behind still end on the last frame
+                        keyframe = self.renderer.keyframe()
+                        viewer.writer.write(MESSAGE.pack(KEYFRAME, self.frames_sent, len(keyframe)) + keyframe)
+                    viewer.writer.write(MESSAGE.pack(END, self.frames_sent, 0))
+                    viewer.writer.close()
+            if self._handlers:
+                # viewers leave once they've read what was left for them
+                await asyncio.wait(self._handlers, timeout=CLOSE_TIMEOUT)
+            await server.wait_closed()
+            if address[0] == 'unix' and os.path.exists(address[1]):
+                os.remove(address[1])
+
+    def stop(self):
+        # ends the broadcast after the current frame
+        self.stopped = True
+        if self._joined is not None:
+            self._joined.set()
+
+    def summary(self):
+        return (
+            f"broadcast: {self.frames_sent} frames, {self.bytes_sent / 1e6:.1f} MB sent, {self.resyncs} resync(s), "
+            f"{self.late} late (max {self.max_lag * 1000:.1f} ms)"
+        )
@@ -0,0 +1,110 @@
+import time
+from fractions import Fraction
+
+from src.utils.metrics import METRICS
+
+
+class PlaybackClock:
+    """
+    Frame scheduler following the audio stream.
+
+    Time is measured with `time.perf_counter` and frame deadlines are computed from the
+    exact (rational) frame rate, so 29.97 fps content doesn't drift. When an audio
+    position is available the clock is slowly pulled towards it, keeping video in sync
+    with what is actually being heard.
+
+    Frames that can no longer be drawn before the next one is due are dropped; the
+    decision uses a running estimate of how long drawing takes, so a slow terminal
+    drops more frames instead of falling further behind.
+    """
+
+    def __init__(self, frame_rate, audio_position=None, sync_gain=0.1, max_drift=0.5):
+        """
+        Args:
+            frame_rate (Fraction | int | float): Frames per second of the video.
+            audio_position (callable | None): Returns the current audio playback position
+                in seconds, or None while it isn't known.
+            sync_gain (float): Fraction of the measured A/V drift corrected per frame.
+            max_drift (float): Drift (in seconds) past which the clock jumps straight to the audio.
+        """
+        self.frame_rate = Fraction(frame_rate).limit_denominator(1001 * 1000)
+        self.frame_duration = float(1 / self.frame_rate)
+        self.audio_position = audio_position
+        self.sync_gain = sync_gain
+        self.max_drift = max_drift
+
+        self.start_time = None
+        self.draw_time = 0.0 # running estimate of the time spent drawing a frame
+
+        # counters
+        self.drawn = 0
+        self.dropped = 0
+        self.late = 0
+        self.drift = 0.0 # last measured audio - video clock difference, in seconds
+        self.max_abs_drift = 0.0
+
+    def start(self):
+        self.start_time = time.perf_counter()
+
+    def now(self):
+        # position in the video, in seconds
+        return time.perf_counter() - self.start_time
+
+    def frame_time(self, index):
+        return float(index / self.frame_rate)
+
+    def sync(self):
+        # pulls the clock towards the audio position, if there is one
+        if self.audio_position is None:
+            return
+        position = self.audio_position()
+        if position is None:
+            return
+
+        self.drift = position - self.now()
+        self.max_abs_drift = max(self.max_abs_drift, abs(self.drift))
+        correction = self.drift if abs(self.drift) > self.max_drift else self.drift * self.sync_gain
+        self.start_time -= correction
+
+    def should_draw(self, index):
+        """
+        Decides whether frame `index` should be drawn or dropped.
+
+        Args:
+            index (int): The frame index.
+
+        Returns:
+            bool: False when the frame would only be finished after the next one is due.
+        """
+        self.sync()
+        now = self.now()
+        if now + self.draw_time > self.frame_time(index + 1):
+            self.dropped += 1
+            METRICS.count('dropped frames')
+            return False
+        if now > self.frame_time(index):
+            self.late += 1
+            METRICS.count('late frames')
+        return True
+
+    def drew(self, seconds):
+        # records how long drawing a frame took
+        self.drawn += 1
+        self.draw_time = seconds if self.drawn == 1 else self.draw_time * 0.9 + seconds * 0.1
+
+    def wait(self, index):
+        # sleeps until frame `index` is due
+        remaining = self.frame_time(index) - self.now()
+        if remaining > 0:
+            start = time.perf_counter()
+            time.sleep(remaining)
+            slept = time.perf_counter() - start
+            METRICS.record('sleep', slept, start)
+            # how much later than asked the sleep returned, the scheduler's jitter
+            METRICS.observe('oversleep', max(slept - remaining, 0.0), 's')
+
+    def summary(self):
+        return (
+            f"{self.drawn} frames drawn, {self.dropped} dropped, {self.late} late, "
+            f"A/V drift {self.drift * 1000:+.1f} ms (max {self.max_abs_drift * 1000:.1f} ms)"
+        )
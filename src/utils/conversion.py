@@ -0,0 +1,296 @@
+import glob
+import os
+import time
+from fractions import Fraction
+from functools import partial
+
+import numpy as np
+
+from src.utils.encoder import half_blocks
+from src.utils.file.cache import EXTENSION
+from src.utils.file.codecs import DEFAULT_CODEC
+from src.utils.file.tools import BRIGHTNESS_CELLS, BRIGHTNESS_WIDE_CELLS, DEFAULT_CHUNK_FRAMES, VideoWriter
+from src.utils.ladder import rendition_path, split_stacked, stacked_shape
+from src.utils.stream import FramePipeline, iter_frames, stream_audio
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.m4v', '.flv', '.wmv', '.mpg', '.mpeg')
+
+
+def convert_frame(frame, palette, half_block=False, glyphs=None):
+    # converts an RGB frame into a cell grid for the palette (or glyph mode); a module-level
+    # function so workers only receive the palette, not the player
+    if glyphs is not None:
+        return glyphs.quantize(frame, palette)
+    if half_block:
+        return half_blocks(palette.quantize(frame))
+    return palette.quantize(frame)
+
+
+def probe_video(input_filename, headers=None):
+    """
+    Reads the properties of a video's first video stream.
+
+    Args:
+        input_filename (str): The path to the video file, or its URL.
+        headers (dict | None): HTTP headers sent with a URL (e.g. those yt-dlp requires).
+
+    Returns:
+        tuple: The width, height, exact frame rate (Fraction) and frame count (None when
+            the container doesn't say).
+    """
+    import ffmpeg
+
+    options = {'headers': ''.join(f'{name}: {value}\r\n' for name, value in headers.items())} if headers else {}
+    probe = ffmpeg.probe(input_filename, **options)
+    vid_info = next(stream for stream in probe['streams'] if stream['codec_type'] == 'video')
+    frame_count = int(vid_info['nb_frames']) if vid_info.get('nb_frames', '').isdigit() else None
+    return int(vid_info['width']), int(vid_info['height']), Fraction(vid_info['r_frame_rate']), frame_count
+
+
+def exact_frame_rate(fps):
+    # a frame rate known as a float (e.g. from yt-dlp) as a Fraction; NTSC rates are snapped to
+    # n * 1000 / 1001, 29.97 read as 2997/100 would drift from the audio on long videos
+    ntsc = Fraction(round(fps * 1.001) * 1000, 1001)
+    if fps != round(fps) and abs(float(ntsc) - fps) < 0.01:
+        return ntsc
+    return Fraction(fps).limit_denominator(1001)
+
+
+def cells_shape(video_width, video_height, height, width=None):
+    # cell grid for a target height, the width following the video's aspect ratio
+    # (cells are about twice as tall as they are wide)
+    if width is None:
+        width = int(round(height * video_width / video_height * 2))
+    return height, width
+
+
+def cells_format(palette, half_block=False, glyphs=None):
+    # container brightness marker and palette name of the cells a conversion produces
+    if glyphs is not None:
+        # monochrome glyphs don't depend on the palette
+        return glyphs.brightness, palette.name if glyphs.color else ''
+    return BRIGHTNESS_WIDE_CELLS if half_block else BRIGHTNESS_CELLS, palette.name
+
+
+def cache_variant(palette, half_block=False, glyphs=None):
+    # the conversion settings a cache key depends on, besides the source and the resolution
+    _, palette_name = cells_format(palette, half_block, glyphs)
+    return f'{palette_name}{palette.tolerance}{"half" if half_block else ""}{"glyphs-" + glyphs.name if glyphs else ""}'
+
+
+def frame_pipeline(input_filename, shape, palette, half_block=False, feed=None, glyphs=None, **options):
+    """
+    Builds the pipeline decoding a video and converting it into cell grids.
+
+    Args:
+        input_filename (str): The path to the video file.
+        shape (tuple): The (height, width) of the cell grids.
+        palette (Palette): The output palette.
+        half_block (bool): Whether to produce half-block cells, decoding twice the height.
+        feed (callable | None): Writes the video into ffmpeg's stdin instead of it reading
+            `input_filename` (see `Download.feed`).
+        glyphs (Glyphs | None): Produces glyph cells instead (see src.utils.glyphs).
+        **options: Passed on to `FramePipeline` (processes, batch_size, ...).
+
+    Returns:
+        FramePipeline: The pipeline, not started.
+    """
+    height, width = shape
+    decode_height = height * 2 if half_block else height
+    return FramePipeline(
+        lambda ring: iter_frames(input_filename, width, decode_height, ring=ring, feed=feed),
+        partial(convert_frame, palette=palette, half_block=half_block, glyphs=glyphs),
+        (decode_height, width),
+        shape,
+        glyphs.dtype if glyphs is not None else np.uint64 if half_block else np.uint32,
+        **options,
+    )
+
+
+def ladder_pipeline(input_filename, shapes, palette, half_block=False, feed=None, glyphs=None, **options):
+    """
+    Builds the pipeline converting a video into several renditions at once.
+
+    The video is decoded once, scaled to every rendition by the same ffmpeg, and the
+    renditions are converted as a single cell grid with their frames stacked vertically
+    (see `src.utils.ladder.split_stacked`). Cells only depend on their own pixels, so
+    this gives the same cells as converting every rendition on its own.
+
+    Args:
+        input_filename (str): The path to the video file.
+        shapes (list[tuple]): The (height, width) of every rendition's cell grids.
+        palette, half_block, feed, glyphs, **options: See `frame_pipeline`.
+
+    Returns:
+        FramePipeline: The pipeline, not started, yielding the stacked cell grids.
+    """
+    scale = 2 if half_block else 1
+    height, width = stacked_shape(shapes)
+    sizes = [(rendition_width, rendition_height * scale) for rendition_height, rendition_width in shapes]
+    return FramePipeline(
+        lambda ring: iter_frames(input_filename, width, height * scale, ring=ring, feed=feed, sizes=sizes),
+        partial(convert_frame, palette=palette, half_block=half_block, glyphs=glyphs),
+        (height * scale, width),
+        (height, width),
+        glyphs.dtype if glyphs is not None else np.uint64 if half_block else np.uint32,
+        **options,
+    )
+
+
+def ladder_shapes(video_width, video_height, heights, width=None):
+    # cell grids of renditions of several heights; an explicit width is scaled along with the height
+    return [
+        cells_shape(video_width, video_height, height, round(width * height / heights[0]) if width else None)
+        for height in heights
+    ]
+
+
+def convert_file(input_filename, output_filename, palette, height, width=None, half_block=False, processes=None, codec=DEFAULT_CODEC, level=None, glyphs=None, ladder=None):
+    """
+    Converts a video file into a container, without any interaction.
+
+    Args:
+        input_filename (str): The path to the video file.
+        output_filename (str): Where to write the container.
+        palette (Palette): The output palette.
+        height (int): Rows of cells.
+        width (int | None): Columns of cells, None to follow the video's aspect ratio.
+        half_block (bool): Whether to store half-block cells.
+        processes (int | None): Conversion worker processes, None for one per core.
+        codec (str): Compression of the container's chunks (see src.utils.file.codecs).
+        level (int | None): The codec's level, None for its default.
+        glyphs (Glyphs | None): Stores glyph cells instead (see src.utils.glyphs).
+        ladder (list[int] | None): Rows of cells of further renditions, converted in the
+            same pass and stored next to the output (see `src.utils.ladder.rendition_path`).
+
+    Returns:
+        tuple: The number of frames converted and the seconds it took.
+    """
+    start = time.perf_counter()
+    video_width, video_height, frame_rate, _ = probe_video(input_filename)
+    heights = [height] + [rendition for rendition in dict.fromkeys(ladder or ()) if rendition != height]
+    shapes = ladder_shapes(video_width, video_height, heights, width)
+    output_filenames = [output_filename] + [rendition_path(output_filename, rendition) for rendition in heights[1:]]
+    brightness, palette_name = cells_format(palette, half_block, glyphs)
+
+    if len(shapes) > 1:
+        pipeline = ladder_pipeline(input_filename, shapes, palette, half_block, glyphs=glyphs, processes=processes)
+    else:
+        pipeline = frame_pipeline(input_filename, shapes[0], palette, half_block, glyphs=glyphs, processes=processes)
+    temp_filenames = [f'{filename}.{os.getpid()}.tmp' for filename in output_filenames]
+    files = []
+    try:
+        writers = []
+        for temp_filename, shape in zip(temp_filenames, shapes):
+            files.append(open(temp_filename, 'wb'))
+            writers.append(VideoWriter(files[-1], frame_rate, brightness, DEFAULT_CHUNK_FRAMES, shape, palette_name, codec=codec, level=level))
+        for cells in pipeline:
+            for writer, frame in zip(writers, split_stacked(cells, shapes)):
+                writer.add(frame)
+        # the audio is stored chunk by chunk as it's decoded, never held whole in memory
+        for pcm in stream_audio(input_filename):
+            for writer in writers:
+                writer.add_audio(pcm)
+        for writer, file in zip(writers, files):
+            writer.close()
+            file.close()
+        for temp_filename, filename in zip(temp_filenames, output_filenames):
+            os.replace(temp_filename, filename)
+    finally:
+        pipeline.close()
+        for file in files:
+            file.close()
+        for temp_filename in temp_filenames:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+
+    return writers[0].frame_count, time.perf_counter() - start
+
+
+def find_videos(patterns):
+    """
+    Expands files, directories and glob patterns into a sorted list of video files.
+
+    Args:
+        patterns (list[str]): Paths, directories (searched for video files, not recursively)
+            or glob patterns.
+
+    Returns:
+        list[str]: The video files found, without duplicates.
+    """
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found.update(
+                os.path.join(pattern, name) for name in os.listdir(pattern)
+                if name.lower().endswith(VIDEO_EXTENSIONS)
+            )
+        elif os.path.isfile(pattern):
+            found.add(pattern)
+        else:
+            found.update(path for path in glob.glob(pattern) if os.path.isfile(path))
+    return sorted(found)
+
+
+def output_path(input_filename, output):
+    # container path for an input: inside `output` when it's a directory, next to the input without one
+    name = os.path.splitext(os.path.basename(input_filename))[0] + EXTENSION
+    return os.path.join(output if output else os.path.dirname(input_filename), name)
+
+
+def convert_many(input_filenames, output, palette, height, width=None, half_block=False, jobs=None, cpus=None, report=None, codec=DEFAULT_CODEC, level=None, glyphs=None, ladder=None):
+    """
+    Converts many videos at once, sharing the CPU budget between them.
+
+    Up to `jobs` videos are converted at a time; each gets an equal share of the cores
+    for its conversion workers, minus one for its decoder.
+
+    Args:
+        input_filenames (list[str]): The video files.
+        output (str | None): Directory for the containers, None to write them next to the videos.
+        palette (Palette): The output palette.
+        height (int): Rows of cells.
+        width (int | None): Columns of cells, None to follow each video's aspect ratio.
+        half_block (bool): Whether to store half-block cells.
+        jobs (int | None): Videos converted at a time, None for one per two cores.
+        cpus (int | None): Cores to use in total, None for all of them.
+        report (callable | None): Called with (input, output, frames, seconds, error) as
+            each video finishes; error is None on success.
+        codec (str): Compression of the containers' chunks.
+        level (int | None): The codec's level, None for its default.
+        glyphs (Glyphs | None): Stores glyph cells instead.
+        ladder (list[int] | None): Rows of cells of further renditions of every video.
+
+    Returns:
+        tuple: Total frames converted, wall-clock seconds and the number of failures.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    cpus = cpus or os.cpu_count() or 1
+    jobs = max(1, min(jobs or cpus // 2, len(input_filenames)))
+    processes = max(1, cpus // jobs - 1)
+    if output:
+        os.makedirs(output, exist_ok=True)
+
+    start = time.perf_counter()
+    total_frames = 0
+    failures = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(convert_file, path, output_path(path, output), palette, height, width, half_block, processes, codec, level, glyphs, ladder): path
+            for path in input_filenames
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                frames, seconds = future.result()
+            except Exception as e:
+                failures += 1
+                if report:
+                    report(path, output_path(path, output), 0, 0.0, e)
+                continue
+            total_frames += frames
+            if report:
+                report(path, output_path(path, output), frames, seconds, None)
+
+    return total_frames, time.perf_counter() - start, failures
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import threading
+
+import requests
+
+from src.utils.conversion import exact_frame_rate, probe_video
+
+
+class Download:
+    """
+    Downloads a file in the background, so it can be decoded while it arrives.
+
+    Chunks are appended to a spool file on disk as they come in, nothing is kept in
+    memory. Any number of readers can follow the spool from its start with
+    `iter_chunks` (or pipe it into a process with `feed`): they read what has already
+    been written and wait for more until the download is complete. A reader started
+    after the download finished simply reads the file, so replays don't download again.
+    """
+
+    def __init__(self, url, headers=None, suffix='', chunk_size=1 << 16):
+        """
+        Args:
+            url (str): The URL to download.
+            headers (dict | None): Extra HTTP headers (e.g. those yt-dlp requires).
+            suffix (str): Suffix of the spool file, e.g. '.mp4'.
+            chunk_size (int): Bytes requested per read.
+        """
+        self.url = url
+        self.headers = headers or {}
+        self.chunk_size = chunk_size
+
+        spool, self.path = tempfile.mkstemp(suffix=suffix, prefix='ascii-player-')
+        os.close(spool)
+
+        self.size = 0 # bytes written to the spool so far
+        self.complete = False
+        self.error = None
+        self._changed = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            with requests.get(self.url, headers=self.headers, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                with open(self.path, 'wb') as spool:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        spool.write(chunk)
+                        spool.flush()
+                        with self._changed:
+                            self.size += len(chunk)
+                            self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._changed:
+                self.complete = True
+                self._changed.notify_all()
+
+    def iter_chunks(self):
+        """
+        Yields the downloaded data from the start, waiting for the download as needed.
+
+        Raises:
+            Exception: The download's error, once every byte received before it was read.
+        """
+        with open(self.path, 'rb') as spool:
+            position = 0
+            while True:
+                with self._changed:
+                    while position == self.size and not self.complete:
+                        self._changed.wait()
+                    available, complete = self.size - position, self.complete
+
+                if available:
+                    chunk = spool.read(min(available, self.chunk_size))
+                    position += len(chunk)
+                    yield chunk
+                elif complete:
+                    if self.error is not None:
+                        raise self.error
+                    return
+
+    def feed(self, stream):
+        # writes the whole download into `stream` (e.g. ffmpeg's stdin), then closes it
+        try:
+            for chunk in self.iter_chunks():
+                stream.write(chunk)
+        except Exception:
+            pass # the reader went away (e.g. playback stopped), or the download failed and `wait` raises it
+        finally:
+            try:
+                stream.close()
+            except BrokenPipeError:
+                pass
+
+    def wait(self):
+        # blocks until the download is complete, raising its error if it failed
+        with self._changed:
+            while not self.complete:
+                self._changed.wait()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        # removes the spool file; the download thread is a daemon and dies with the player
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def probe_stream(video):
+    """
+    Reads the properties of a video looked up with `yt_resolve`, without downloading it.
+
+    What yt-dlp reported is used when it's complete; otherwise the URL is probed, with
+    the HTTP headers the download will send.
+
+    Args:
+        video (dict): The video, as returned by `yt_resolve`.
+
+    Returns:
+        tuple: The width, height, exact frame rate (Fraction) and frame count (None when unknown).
+    """
+    if video['width'] and video['height'] and video['fps']:
+        return video['width'], video['height'], exact_frame_rate(video['fps']), None
+    return probe_video(video['url'], video['http_headers'])
+
+
+def download_video(video):
+    # starts downloading a video looked up with `yt_resolve`, see `Download`
+    return Download(video['url'], video['http_headers'], suffix=f".{video['ext']}").start()
@@ -0,0 +1,301 @@
+import numpy as np
+
+# Bumped whenever the encoded output changes, so previously cached conversions are not reused
+ENCODER_VERSION = 3
+
+# Escape sequence fragments, kept as uint8 arrays so they can be scattered into the output buffer
+SGR_PREFIX = np.frombuffer(b'\033[48;2;', dtype=np.uint8)
+FG_SGR_PREFIX = np.frombuffer(b'\033[38;2;', dtype=np.uint8)
+SPACE = ord(' ')
+SEMICOLON = ord(';')
+NEWLINE = ord('\n')
+SGR_SUFFIX = ord('m')
+
+CSI = np.frombuffer(b'\033[', dtype=np.uint8)
+CUP_SUFFIX = ord('H')
+
+# Integer -> decimal string tables ("0".."9999", enough for color bytes and cursor positions),
+# padded to 4 digits and with their real length
+_values = np.arange(10000)
+DEC_LENGTH = (1 + (_values >= 10) + (_values >= 100) + (_values >= 1000)).astype(np.int64)
+# digit i of a number is value // 10 ** (length - 1 - i) % 10, the positions past its length are zeros
+_positions = DEC_LENGTH[:, None] - 1 - np.arange(4)
+DEC_DIGITS = np.where(_positions >= 0, ord('0') + _values[:, None] // 10 ** np.maximum(_positions, 0) % 10, 0).astype(np.uint8)
+
+# Fixed part of a truecolor sequence: prefix + two ';' + 'm'
+SGR_FIXED_LENGTH = len(SGR_PREFIX) + 3
+
+# Cell glyphs: a space showing the background, or the upper half block showing the foreground
+# on top of the background (half-block cells)
+GLYPH_BYTES = np.zeros((2, 3), dtype=np.uint8)
+GLYPH_BYTES[0, 0] = SPACE
+GLYPH_BYTES[1] = np.frombuffer('\u2580'.encode(), dtype=np.uint8)
+GLYPH_LENGTH = np.array([1, 3], dtype=np.int64)
+
+
+def pack_rgb(frame):
+    """
+    Packs an RGB frame into one integer per cell.
+
+    Args:
+        frame (np.ndarray): A (height, width, 3) uint8 array.
+
+    Returns:
+        np.ndarray: A (height, width) uint32 array holding 0xRRGGBB per cell.
+    """
+    frame = np.asarray(frame, dtype=np.uint8)
+    return (
+        (frame[..., 0].astype(np.uint32) << 16)
+        | (frame[..., 1].astype(np.uint32) << 8)
+        | frame[..., 2].astype(np.uint32)
+    )
+
+
+def half_blocks(cells):
+    """
+    Pairs rows of cells into half-block cells, each showing two vertical pixels.
+
+    Args:
+        cells (np.ndarray): A (height, width) uint32 array of colors; an odd last row is doubled.
+
+    Returns:
+        np.ndarray: A (ceil(height / 2), width) uint64 array holding top << 32 | bottom.
+    """
+    if len(cells) % 2:
+        cells = np.concatenate([cells, cells[-1:]])
+    return (cells[0::2].astype(np.uint64) << np.uint64(32)) | cells[1::2].astype(np.uint64)
+
+
+def split_half_blocks(cells):
+    # half-block cells -> (top, bottom) color arrays
+    return (cells >> np.uint64(32)).astype(np.uint32), (cells & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def color_changes(cells):
+    """
+    Finds the cells where the background color has to be (re)emitted.
+
+    The color carries over from the end of one row to the start of the next, so the
+    comparison runs over the flattened frame, and the very first cell always emits.
+
+    Args:
+        cells (np.ndarray): A (height, width) array of packed colors.
+
+    Returns:
+        np.ndarray: A (height, width) bool array, True where a color sequence is needed.
+    """
+    flat = cells.reshape(-1)
+    changes = np.empty(flat.shape, dtype=bool)
+    changes[:1] = True
+    changes[1:] = np.diff(flat.astype(np.int64)) != 0
+    return changes.reshape(cells.shape)
+
+
+def _changes(colors, active):
+    # True where a color differs from the one before it, the first one compared with `active`
+    changes = np.empty(len(colors), dtype=bool)
+    changes[1:] = colors[1:] != colors[:-1]
+    if len(colors):
+        changes[0] = active is None or colors[0] != active
+    return changes
+
+
+def _write_decimal(out, offsets, values):
+    # writes the decimal representation of every value at its offset, returns the end offsets
+    lengths = DEC_LENGTH[values]
+    digits = DEC_DIGITS[values]
+    for position in range(DEC_DIGITS.shape[1]):
+        has_digit = lengths > position
+        out[offsets[has_digit] + position] = digits[has_digit, position]
+    return offsets + lengths
+
+
+def _write_table(out, offsets, table, lengths):
+    # writes rows of a byte table at their offsets, returns the end offsets
+    for position in range(table.shape[1]):
+        has_byte = lengths > position
+        out[offsets[has_byte] + position] = table[has_byte, position]
+    return offsets + lengths
+
+
+def _sgr_lengths(colors, palette, foreground=False):
+    # bytes taken by the color sequence of every color
+    if palette is not None and palette.indexed:
+        return (palette.fg_sgr_length if foreground else palette.sgr_length)[colors]
+    red = (colors >> 16) & 0xFF
+    green = (colors >> 8) & 0xFF
+    blue = colors & 0xFF
+    return SGR_FIXED_LENGTH + DEC_LENGTH[red] + DEC_LENGTH[green] + DEC_LENGTH[blue]
+
+
+def _write_sgr(out, offsets, colors, palette, foreground=False):
+    # writes the color sequence of every color at its offset, returns the end offsets
+    if palette is not None and palette.indexed:
+        if foreground:
+            return _write_table(out, offsets, palette.fg_sgr_table[colors], palette.fg_sgr_length[colors])
+        return _write_table(out, offsets, palette.sgr_table[colors], palette.sgr_length[colors])
+
+    prefix = FG_SGR_PREFIX if foreground else SGR_PREFIX
+    for position, byte in enumerate(prefix):
+        out[offsets + position] = byte
+    offsets = _write_decimal(out, offsets + len(prefix), (colors >> 16) & 0xFF)
+    out[offsets] = SEMICOLON
+    offsets = _write_decimal(out, offsets + 1, (colors >> 8) & 0xFF)
+    out[offsets] = SEMICOLON
+    offsets = _write_decimal(out, offsets + 1, colors & 0xFF)
+    out[offsets] = SGR_SUFFIX
+    return offsets + 1
+
+
+def _plan(cells, fg, bg, glyphs=None):
+    """
+    Works out, for a sequence of cells in output order, which glyph each one needs and
+    where the foreground and background colors have to be set.
+
+    Returns:
+        tuple: glyphs, foreground colors, foreground changes, background colors,
+            background changes, and the final (fg, bg) state.
+    """
+    if glyphs is not None:
+        # glyph cells (see src.utils.glyphs) never set the background
+        no_changes = np.zeros(len(cells), dtype=bool)
+        if not glyphs.color:
+            no_colors = np.zeros(len(cells), dtype=np.uint32)
+            return cells.astype(np.intp), no_colors, no_changes, no_colors, no_changes, (fg, bg)
+        colors = cells >> np.uint32(8)
+        fg_changes = _changes(colors, fg)
+        last_fg = int(colors[-1]) if len(cells) else fg
+        return (cells & np.uint32(0xFF)).astype(np.intp), colors, fg_changes, colors, no_changes, (last_fg, bg)
+
+    if cells.dtype != np.uint64:
+        glyphs = np.zeros(len(cells), dtype=np.intp)
+        bg_changes = _changes(cells, bg)
+        last_bg = int(cells[-1]) if len(cells) else bg
+        return glyphs, cells, np.zeros(len(cells), dtype=bool), cells, bg_changes, (fg, last_bg)
+
+    top, bottom = split_half_blocks(cells)
+    # two equal halves are drawn as a space, only needing the background
+    glyphs = (top != bottom).astype(np.intp)
+    bg_changes = _changes(bottom, bg)
+
+    drawn = np.flatnonzero(glyphs)
+    fg_changes = np.zeros(len(cells), dtype=bool)
+    fg_changes[drawn] = _changes(top[drawn], fg)
+
+    last_fg = int(top[drawn[-1]]) if len(drawn) else fg
+    last_bg = int(bottom[-1]) if len(cells) else bg
+    return glyphs, top, fg_changes, bottom, bg_changes, (last_fg, last_bg)
+
+
+def _emit(glyphs, fg, fg_changes, bg, bg_changes, palette, moves=None, rows=None, cols=None, newlines=None, glyph_set=None):
+    """
+    Builds the output for a sequence of cells: each one is an optional cursor move, an
+    optional foreground and background sequence, its glyph and an optional newline. Per-cell
+    lengths are prefix-summed into offsets and every part is scattered into one buffer.
+    Glyphs index `GLYPH_BYTES`, or the character table of `glyph_set` in glyph mode.
+    """
+    fg = fg.astype(np.intp)
+    bg = bg.astype(np.intp)
+    glyph_bytes, glyph_length = (GLYPH_BYTES, GLYPH_LENGTH) if glyph_set is None else (glyph_set.table, glyph_set.length)
+
+    lengths = glyph_length[glyphs].copy()
+    lengths += np.where(fg_changes, _sgr_lengths(fg, palette, foreground=True), 0)
+    lengths += np.where(bg_changes, _sgr_lengths(bg, palette), 0)
+    if moves is not None:
+        rows = rows.astype(np.intp) + 1
+        cols = cols.astype(np.intp) + 1
+        lengths += np.where(moves, len(CSI) + 2 + DEC_LENGTH[rows] + DEC_LENGTH[cols], 0)
+    if newlines is not None:
+        lengths += newlines
+
+    ends = np.cumsum(lengths)
+    offsets = ends - lengths
+    out = np.zeros(int(ends[-1]) if ends.size else 0, dtype=np.uint8)
+
+    # cursor moves (`\\033[row;colH`, 1-based)
+    if moves is not None:
+        move_offsets = offsets[moves]
+        for position, byte in enumerate(CSI):
+            out[move_offsets + position] = byte
+        move_offsets = _write_decimal(out, move_offsets + len(CSI), rows[moves])
+        out[move_offsets] = SEMICOLON
+        move_offsets = _write_decimal(out, move_offsets + 1, cols[moves])
+        out[move_offsets] = CUP_SUFFIX
+        offsets[moves] = move_offsets + 1
+
+    offsets[fg_changes] = _write_sgr(out, offsets[fg_changes], fg[fg_changes], palette, foreground=True)
+    offsets[bg_changes] = _write_sgr(out, offsets[bg_changes], bg[bg_changes], palette)
+    offsets = _write_table(out, offsets, glyph_bytes[glyphs], glyph_length[glyphs])
+
+    if newlines is not None:
+        out[offsets[newlines.astype(bool)]] = NEWLINE
+
+    return out.tobytes()
+
+
+def encode_cells(cells, palette=None, glyph_set=None):
+    """
+    Encodes a grid of cells into the ANSI byte stream drawn by the player.
+
+    Every cell is a space; a color sequence precedes it whenever its color differs from
+    the previous cell's. Half-block cells (see `half_blocks`) are drawn as an upper half
+    block with the top color as foreground, or as a space when both halves match, with
+    foreground and background sequences only emitted when they change. Glyph cells are
+    drawn as their character, colored ones with a foreground sequence whenever the color
+    changes. Rows are joined with newlines. The whole frame is built with array operations.
+
+    Args:
+        cells (np.ndarray): A (height, width) array of colors, packed 0xRRGGBB values
+            (`\\033[48;2;R;G;Bm` sequences) or indices into `palette`; uint64 for half-block cells.
+        palette (Palette | None): The palette the cells index, None for truecolor.
+        glyph_set (Glyphs | None): The glyph mode of glyph cells (see src.utils.glyphs).
+
+    Returns:
+        bytes: The encoded frame.
+    """
+    height, width = cells.shape
+    flat = cells.reshape(-1)
+    glyphs, fg, fg_changes, bg, bg_changes, _ = _plan(flat, None, None, glyph_set)
+
+    newlines = np.zeros((height, width), dtype=np.int64)
+    newlines[:-1, -1] = 1
+
+    return _emit(glyphs, fg, fg_changes, bg, bg_changes, palette, newlines=newlines.reshape(-1), glyph_set=glyph_set)
+
+
+def encode_updates(rows, cols, cells, moves, palette=None, fg=None, bg=None, glyph_set=None):
+    """
+    Encodes a list of cell updates into an ANSI byte stream.
+
+    Each updated cell is drawn like in `encode_cells`, optionally preceded by a cursor move.
+    Color sequences are skipped when the color is already active.
+
+    Args:
+        rows (np.ndarray): The row of every updated cell, in output order.
+        cols (np.ndarray): The column of every updated cell.
+        cells (np.ndarray): The new value of every updated cell (see `encode_cells`).
+        moves (np.ndarray): Bool mask, True where the cursor has to be moved first.
+        palette (Palette | None): The palette the colors index, None for truecolor.
+        fg (int | None): The active foreground color, None when unknown.
+        bg (int | None): The active background color, None when unknown.
+        glyph_set (Glyphs | None): The glyph mode of glyph cells.
+
+    Returns:
+        tuple: The encoded updates (bytes) and the active (fg, bg) colors after them.
+    """
+    glyphs, fg_colors, fg_changes, bg_colors, bg_changes, state = _plan(cells, fg, bg, glyph_set)
+    output = _emit(glyphs, fg_colors, fg_changes, bg_colors, bg_changes, palette, moves, rows, cols, glyph_set=glyph_set)
+    return output, state
+
+
+def encode_frame(frame):
+    """
+    Encodes an RGB frame into an ANSI string, identical to the per-pixel encoder output.
+
+    Args:
+        frame (np.ndarray): A (height, width, 3) uint8 array.
+
+    Returns:
+        str: The ANSI sequences for the frame, rows separated by newlines.
+    """
+    return encode_cells(pack_rgb(frame)).decode('ascii')
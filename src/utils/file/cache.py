@@ -0,0 +1,223 @@
+import hashlib
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from src.utils.encoder import ENCODER_VERSION
+from src.utils.file.codecs import DEFAULT_CODEC
+from src.utils.file.tools import BRIGHTNESS_CELLS, DEFAULT_CHUNK_FRAMES, VideoReader, VideoWriter
+from src.utils.metrics import METRICS
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ascii-player')
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3 # 4 GiB
+
+EXTENSION = '.vide'
+
+# Frames a `BackgroundRecording` holds before `add` waits for it, two chunks' worth
+DEFAULT_RECORDING_QUEUE = 2 * DEFAULT_CHUNK_FRAMES
+
+
+def file_digest(path, chunk_size=1 << 20):
+    # hashes the file contents, so renamed or re-downloaded copies of a video share an entry
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CacheEntry:
+    """
+    A cache entry being written. Frames are added as they are converted and the entry
+    only becomes visible once `commit` is called, so an interrupted conversion never
+    leaves a truncated video in the cache.
+    """
+
+    def __init__(self, cache, key, frame_rate, audio_bytes=None, frame_shape=(0, 0), brightness=BRIGHTNESS_CELLS, palette=''):
+        self.cache = cache
+        self.path = cache.path(key)
+        self.temp_path = f'{self.path}.{os.getpid()}.tmp'
+        self.audio_bytes = audio_bytes
+
+        self.file = open(self.temp_path, 'wb')
+        self.writer = VideoWriter(self.file, frame_rate, brightness, DEFAULT_CHUNK_FRAMES, frame_shape, palette, codec=cache.codec, level=cache.level)
+
+    def add(self, frame):
+        self.writer.add(frame)
+
+    def add_audio(self, pcm):
+        # raw PCM, see `VideoWriter.add_audio`; may be called from another thread than `add`
+        self.writer.add_audio(pcm)
+
+    def commit(self):
+        self.writer.close(self.audio_bytes)
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+        self.cache.evict()
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.temp_path)
+
+
+class BackgroundRecording:
+    """
+    Fills a cache entry (or a `LadderRecording`) from its own thread.
+
+    Every `DEFAULT_CHUNK_FRAMES` frames, adding one compresses a whole chunk and hashes its
+    rows, which takes hundreds of milliseconds on large frames. `add` only copies the frame
+    into a bounded queue, and a recorder thread writes it, so a playback adding frames as
+    it shows them never waits for a chunk to be written; it only waits once
+    `max_pending` frames are queued, i.e. if the disk can't keep up at all.
+    `commit` writes what's still queued first, `abort` drops it.
+    """
+
+    def __init__(self, entry, max_pending=DEFAULT_RECORDING_QUEUE):
+        """
+        Args:
+            entry (CacheEntry | LadderRecording): Where the frames are written.
+            max_pending (int): Frames queued before `add` waits for the recorder.
+        """
+        self.entry = entry
+        self.error = None # raised by `commit` if writing a frame failed
+        self.aborted = False
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name='recorder', daemon=True)
+        self._thread.start()
+
+    def add(self, frame):
+        # frames may be views into a ring the pipeline reuses, the queue holds copies
+        self._queue.put(np.array(frame))
+
+    def add_audio(self, pcm):
+        # the writer takes audio from any thread
+        self.entry.add_audio(pcm)
+
+    def _run(self):
+        while (frame := self._queue.get()) is not None:
+            if self.error is not None or self.aborted:
+                continue
+            try:
+                with METRICS.span('record'):
+                    self.entry.add(frame)
+            except Exception as e:
+                self.error = e
+
+    def _finish(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def commit(self):
+        self._finish()
+        if self.error is not None:
+            self.entry.abort()
+            raise self.error
+        self.entry.commit()
+
+    def abort(self):
+        self.aborted = True
+        self._finish()
+        self.entry.abort()
+
+
+class VideoCache:
+    """
+    On-disk cache of converted videos.
+
+    Entries are addressed by the source file's contents, the target resolution, the
+    encoder version and any other conversion setting, and hold the converted cell grids plus the audio. Hits refresh the
+    entry's modification time; once the cache grows past `max_bytes`, the least
+    recently used entries are removed.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, codec=DEFAULT_CODEC, level=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.codec = codec # compression of new entries, see src.utils.file.codecs
+        self.level = level
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, input_filename, target_frame_width, target_frame_height, variant='', source_id=None):
+        """
+        Builds the cache key of a video converted at a given resolution.
+
+        Args:
+            input_filename (str): The path to the source video.
+            target_frame_width (int): The width of the converted frames.
+            target_frame_height (int): The height of the converted frames.
+            variant (str): Any other conversion setting that changes the frames (e.g. the palette).
+            source_id (str | None): Identifies the source instead of its contents, for videos
+                streamed from a URL that aren't on disk yet.
+
+        Returns:
+            str: The key of the entry.
+        """
+        digest = file_digest(input_filename) if source_id is None else hashlib.blake2b(source_id.encode(), digest_size=20).hexdigest()
+        key = f'{digest}-{target_frame_width}x{target_frame_height}-v{ENCODER_VERSION}'
+        return f'{key}-{variant}' if variant else key
+
+    def path(self, key):
+        return os.path.join(self.directory, key + EXTENSION)
+
+    def load(self, key):
+        """
+        Opens a cached video. Frames are decoded lazily, chunk by chunk, as they are read.
+
+        Args:
+            key (str): The key of the entry.
+
+        Returns:
+            tuple | None: The frames (a `VideoReader`), frame rate and a function opening the
+                audio (`VideoReader.audio_source`), or None on a miss.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                frames = VideoReader(file)
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError, struct.error, zlib.error):
+            # unreadable entry, drop it and convert again
+            os.remove(path)
+            return None
+
+        os.utime(path) # marks the entry as recently used
+        return frames, frames.frame_rate, frames.audio_source
+
+    def store(self, key, frame_rate, audio_bytes=None, frame_shape=(0, 0), brightness=BRIGHTNESS_CELLS, palette=''):
+        """
+        Starts writing a new entry.
+
+        Args:
+            key (str): The key of the entry.
+            frame_rate (int): The frame rate of the video.
+            audio_bytes (bytes | None): The audio data in WAV format, or None when it's
+                added chunk by chunk with `CacheEntry.add_audio`.
+            frame_shape (tuple): The (height, width) of the frames' cell grids.
+            brightness (float): BRIGHTNESS_CELLS, or BRIGHTNESS_WIDE_CELLS for half-block cells.
+            palette (str): The name of the cells' palette (see src.utils.palette).
+
+        Returns:
+            CacheEntry: The entry to add frames to.
+        """
+        return CacheEntry(self, key, frame_rate, audio_bytes, frame_shape, brightness, palette)
+
+    def evict(self):
+        # removes the least recently used entries until the cache fits in max_bytes
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(EXTENSION):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
@@ -0,0 +1,106 @@
+import bz2
+import lzma
+import time
+import zlib
+
+# Compression of container chunks. Every chunk starts with the u8 tag of the codec that compressed it, so codecs
+# can be switched per file (or even per chunk) and a reader only needs the codecs of the chunks it actually reads.
+# zstd and lz4 are only available when their packages (zstandard, lz4) are installed.
+DEFAULT_CODEC = 'zlib'
+
+
+class Codec:
+    def __init__(self, tag, name, compress, decompress, default_level=None, levels=()):
+        self.tag = tag
+        self.name = name
+        self._compress = compress
+        self.decompress = decompress # takes any bytes-like object, e.g. a slice of the mapped file
+        self.default_level = default_level
+        self.levels = levels # the levels worth comparing, see `bench_codec`
+
+    def compress(self, data, level=None):
+        return self._compress(data, self.default_level if level is None else level)
+
+
+# Registered codecs by name and by tag, tags are stored in files and must never change
+CODECS = {}
+CODEC_TAGS = {}
+
+# Names of the codecs files may use, including the optional ones that aren't installed
+KNOWN_CODECS = {0: 'none', 1: 'zlib', 2: 'lzma', 3: 'bz2', 4: 'zstd', 5: 'lz4'}
+
+def register_codec(codec):
+    CODECS[codec.name] = codec
+    CODEC_TAGS[codec.tag] = codec
+
+# Stored as-is: reading a chunk is a slice of the mapped file, nothing is copied or decompressed
+register_codec(Codec(0, 'none', lambda data, level: bytes(data), lambda data: data))
+register_codec(Codec(1, 'zlib', lambda data, level: zlib.compress(data, level), zlib.decompress, 1, (1, 6, 9)))
+register_codec(Codec(2, 'lzma', lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 1, (0, 1, 6)))
+register_codec(Codec(3, 'bz2', lambda data, level: bz2.compress(data, level), bz2.decompress, 9, (1, 9)))
+
+try:
+    import zstandard
+    register_codec(Codec(
+        4, 'zstd',
+        lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+        3, (1, 3, 9, 19),
+    ))
+except ImportError:
+    pass
+
+try:
+    import lz4.frame
+    register_codec(Codec(5, 'lz4', lambda data, level: lz4.frame.compress(data, compression_level=level), lz4.frame.decompress, 0, (0, 9)))
+except ImportError:
+    pass
+
+def get_codec(name):
+    if name not in CODECS:
+        if name in KNOWN_CODECS.values():
+            raise ValueError(f"The {name} codec isn't installed")
+        raise ValueError(f"Unknown codec '{name}', expected one of {', '.join(CODECS)}")
+    return CODECS[name]
+
+def codec_for_tag(tag):
+    if tag not in CODEC_TAGS:
+        raise ValueError(f"Chunk compressed with {KNOWN_CODECS.get(tag, f'unknown codec {tag}')}, which isn't installed")
+    return CODEC_TAGS[tag]
+
+def compress_chunk(data, codec, level=None):
+    # Tagged chunk, as stored in containers
+    return bytes((codec.tag,)) + codec.compress(data, level)
+
+def decompress_chunk(chunk):
+    # Reverses compress_chunk, `chunk` may be a memoryview of the mapped file
+    return codec_for_tag(chunk[0]).decompress(chunk[1:])
+
+def bench_codec(codec, level, samples):
+    """
+    Measures a codec on some data.
+
+    Args:
+        codec (Codec): The codec.
+        level (int | None): Its level, None for the default one.
+        samples (list[bytes]): The data, compressed one sample at a time like container chunks.
+
+    Returns:
+        tuple: The compression ratio (input / output size), encoding and decoding speeds in MB/s of input.
+    """
+    start = time.perf_counter()
+    compressed = [codec.compress(sample, level) for sample in samples]
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for data in compressed:
+        codec.decompress(data)
+    decode_seconds = time.perf_counter() - start
+
+    size = sum(map(len, samples))
+    megabytes = size / 1e6
+    return (
+        size / max(sum(map(len, compressed)), 1),
+        megabytes / encode_seconds if encode_seconds else float('inf'),
+        megabytes / decode_seconds if decode_seconds else float('inf'),
+    )
@@ -1,7 +1,19 @@
+import hashlib
+import io
 import struct
 import mmap
+import threading
+import wave
 import zlib
-from multiprocessing import Pool, cpu_count
+from bisect import bisect_right
+from collections import OrderedDict
+from fractions import Fraction
+
+import numpy as np
+
+from src.utils.audio import AUDIO_FORMAT, AudioSource, wav_audio, wav_bytes
+from src.utils.file.codecs import DEFAULT_CODEC, compress_chunk, decompress_chunk, get_codec
+from src.utils.metrics import METRICS
 
 # Adjusted brightness levels and encoding maps for both ASCII and color encoding preparation
 BRIGHTNESS_LEVELS_LOW = " .-+*wGHM#&%@\n"
@@ -10,126 +22,703 @@ BRIGHTNESS_LEVELS_HIGH = "          .-':_,^=;><+!rc*/z?sLTv)J7(|F{C}fI31tlu[neoZ
 LOW_ENCODING = {char: idx for idx, char in enumerate(BRIGHTNESS_LEVELS_LOW)}
 HIGH_ENCODING = {char: idx for idx, char in enumerate(BRIGHTNESS_LEVELS_HIGH)}
 
-# Utility to pack frames in batches
+# Brightness value marking frames stored as-is (UTF-8 text, e.g. rendered ANSI frames) instead of packed
+BRIGHTNESS_RAW = -1.0
+# Brightness value marking frames stored as cell grids: (height, width) arrays of packed 0xRRGGBB colors
+BRIGHTNESS_CELLS = -2.0
+# Brightness value marking frames stored as half-block cell grids: (height, width) arrays of u64 top << 32 | bottom colors
+BRIGHTNESS_WIDE_CELLS = -3.0
+# Brightness values marking frames stored as glyph cell grids (see src.utils.glyphs): (height, width) arrays of levels
+# into BRIGHTNESS_LEVELS_LOW / HIGH, packed like text frames at 4 / 7 bits per cell, or with the foreground color as
+# u32 color << 8 | level
+BRIGHTNESS_GLYPHS_LOW = -4.0
+BRIGHTNESS_GLYPHS_HIGH = -5.0
+BRIGHTNESS_COLOR_GLYPHS_LOW = -6.0
+BRIGHTNESS_COLOR_GLYPHS_HIGH = -7.0
+CELL_BRIGHTNESS = (
+    BRIGHTNESS_CELLS, BRIGHTNESS_WIDE_CELLS,
+    BRIGHTNESS_GLYPHS_LOW, BRIGHTNESS_GLYPHS_HIGH, BRIGHTNESS_COLOR_GLYPHS_LOW, BRIGHTNESS_COLOR_GLYPHS_HIGH,
+)
+
+# Version 2 container layout (little endian):
+#   header  'VID2', u16 version, u16 flags, f32 brightness, u32 frame rate numerator, u32 denominator, u32 chunk frames,
+#           u16 width, u16 height (cell grids only, 0 otherwise), 16 byte zero padded name of the cells' palette (empty when unknown)
+#   chunks  compressed streams (a u8 codec tag followed by the data, see codecs.py), each holding up to `chunk frames` frames as (u32 length, record) pairs
+#           with FLAG_DELTA a record is 'K' + packed frame (keyframe) or 'D', u32 row count and per changed row
+#           (u32 row index, u32 row length in characters or cells, u32 packed length, packed row); without it, the packed frame
+#           with FLAG_ROWS a record can also be 'R' + one u32 row ID per row, see rows below
+#           interleaved with audio chunks, compressed streams of raw PCM as it was added
+#   rows    also interleaved with row chunks, compressed streams of (u32 row length in characters or
+#           cells, u32 packed length, packed row) holding every distinct row once; row IDs number them across the file
+#   index   'INDX', u32 frame count, u32 chunk count, per chunk (u64 offset, u32 length, u32 first frame, u32 frame count),
+#           u32 sample rate, u16 channels, u16 bytes per sample, u32 audio chunk count and per audio chunk
+#           (u64 offset, u32 length, u64 first audio frame, u32 audio frame count),
+#           u32 row chunk count and per row chunk (u64 offset, u32 length, u32 first row ID, u32 row count)
+#   footer  u64 index offset, 'VEND'
+# Chunks are compressed independently, so a reader only has to decompress the chunk holding the frame it wants,
+# and audio can be played from any position without decompressing what comes before it.
+# With the row store, a row that repeats anywhere in the file (static scenes, letterboxing, slideshows) is only stored
+# once; frames are arrays of row IDs, and comparing two frames compares integers instead of rows.
+# The first layout (version 2) is still read: no shape or palette in the header, zlib chunks without a codec tag
+# and without rows, the audio as 'AUDI', u32 length, zlib compressed WAV of the whole soundtrack, and an index
+# ending with its u64 offset and u32 length instead of the audio and row chunks.
+CONTAINER_VERSION = 3
+LEGACY_CONTAINER_VERSION = 2
+DEFAULT_CHUNK_FRAMES = 64
+DEFAULT_AUDIO_CHUNK_SECONDS = 1
+# Distinct rows the writer remembers, older ones are stored again if they come back
+DEFAULT_ROW_WINDOW = 1 << 16
+# Decoded row chunks the reader keeps
+ROW_CACHE_CHUNKS = 16
+
+# Header flags
+FLAG_DELTA = 1
+FLAG_ROWS = 2
+
+KEYFRAME = b'K'
+DELTA = b'D'
+ROW_FRAME = b'R'
+
+HEADER = struct.Struct('<4sHHfIII')
+FRAME_SHAPE = struct.Struct('<HH')
+PALETTE_NAME = struct.Struct('<16s')
+CHUNK_ENTRY = struct.Struct('<QIII')
+INDEX_HEADER = struct.Struct('<4sII')
+AUDIO_ENTRY = struct.Struct('<QI')
+AUDIO_HEADER = struct.Struct('<IHHI')
+AUDIO_CHUNK_ENTRY = struct.Struct('<QIQI')
+FOOTER = struct.Struct('<Q4s')
+ROW_CHANGE = struct.Struct('<III')
+ROW_COUNT = struct.Struct('<I')
+ROW_CHUNK_ENTRY = struct.Struct('<QIII')
+ROW_ENTRY = struct.Struct('<II')
+
+# Utility to pack frames in batches. Every packer is vectorized over a whole frame, so frames are packed one
+# at a time: stacking a batch into one array costs more than the per-call overhead it saves, except for
+# small text frames (see benchmarks/packing.py)
 def pack_frame_batch(frames, brightness_level):
-    pack_func = pack_high if brightness_level == 1.0 else pack_low
+    pack_func = pack_function(brightness_level)
     return [pack_func(frame) for frame in frames]
 
+def pack_function(brightness):
+    if brightness == BRIGHTNESS_RAW:
+        return pack_raw
+    if brightness == BRIGHTNESS_CELLS:
+        return pack_cells
+    if brightness == BRIGHTNESS_WIDE_CELLS:
+        return pack_wide_cells
+    if brightness == BRIGHTNESS_GLYPHS_LOW:
+        return pack_glyphs_low
+    if brightness == BRIGHTNESS_GLYPHS_HIGH:
+        return pack_glyphs_high
+    if brightness in (BRIGHTNESS_COLOR_GLYPHS_LOW, BRIGHTNESS_COLOR_GLYPHS_HIGH):
+        return pack_cells
+    return pack_high if brightness == 1.0 else pack_low
+
+def unpack_function(brightness):
+    if brightness == BRIGHTNESS_RAW:
+        return unpack_raw
+    if brightness == BRIGHTNESS_CELLS:
+        return unpack_cells
+    if brightness == BRIGHTNESS_WIDE_CELLS:
+        return unpack_wide_cells
+    if brightness == BRIGHTNESS_GLYPHS_LOW:
+        return unpack_glyphs_low
+    if brightness == BRIGHTNESS_GLYPHS_HIGH:
+        return unpack_glyphs_high
+    if brightness in (BRIGHTNESS_COLOR_GLYPHS_LOW, BRIGHTNESS_COLOR_GLYPHS_HIGH):
+        return unpack_cells
+    return unpack_high if brightness == 1.0 else unpack_low
+
+def pack_raw(frame):
+    return frame.encode('utf-8')
+
+def unpack_raw(packed_bytes):
+    return bytes(packed_bytes).decode('utf-8')
+
+def pack_cells(cells):
+    return np.ascontiguousarray(cells, dtype='<u4').tobytes()
+
+def unpack_cells(packed_bytes):
+    # Flat array of cells, the reader gives it its (height, width) shape
+    return np.frombuffer(packed_bytes, dtype='<u4').astype(np.uint32)
+
+def pack_wide_cells(cells):
+    return np.ascontiguousarray(cells, dtype='<u8').tobytes()
+
+def unpack_wide_cells(packed_bytes):
+    return np.frombuffer(packed_bytes, dtype='<u8').astype(np.uint64)
+
+# Code point -> level index lookup arrays, unknown characters map to 0 like the dict lookups they replace
+def _encoding_table(encoding):
+    table = np.zeros(max(map(ord, encoding)) + 1, dtype=np.uint8)
+    for char, idx in encoding.items():
+        table[ord(char)] = idx
+    return table
+
+LOW_TABLE = _encoding_table(LOW_ENCODING)
+HIGH_TABLE = _encoding_table(HIGH_ENCODING)
+
+# Level index -> code point, for decoding
+LOW_CODEPOINTS = np.array([ord(char) for char in BRIGHTNESS_LEVELS_LOW], dtype=np.uint32)
+HIGH_CODEPOINTS = np.array([ord(char) for char in BRIGHTNESS_LEVELS_HIGH], dtype=np.uint32)
+
+# 256-entry decode table: packed byte -> its two 4-bit values
+BYTE_NIBBLES = np.stack([np.arange(256) >> 4, np.arange(256) & 0x0F], axis=1).astype(np.uint8)
+
+def _codepoints(text):
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+def _from_codepoints(codepoints):
+    return codepoints.astype('<u4').tobytes().decode('utf-32-le')
+
+def _levels(codepoints, table):
+    inside = codepoints < len(table)
+    return np.where(inside, table[np.where(inside, codepoints, 0)], 0).astype(np.uint8)
+
+def _pack_values_low(values):
+    if len(values) % 2:
+        values = np.append(values, np.uint8(0))
+    return ((values[0::2] << 4) | values[1::2]).tobytes()
+
+# Bit offsets of 8 consecutive 7-bit values inside the 56 bit word they're packed into, first value on top
+SEPTET_SHIFTS = np.arange(49, -1, -7, dtype=np.uint64)
+
+def _pack_values_high(values):
+    # keep the low 7 bits of every value, MSB first, zero padded to a whole byte;
+    # every 8 values make a 56 bit word, written as 7 big endian bytes
+    count = len(values)
+    groups = np.zeros(-(-count // 8) * 8, dtype=np.uint64)
+    groups[:count] = values & 0x7F
+    words = (groups.reshape(-1, 8) << SEPTET_SHIFTS).sum(axis=1, dtype=np.uint64) << np.uint64(8)
+    packed = words.astype('>u8').view(np.uint8).reshape(-1, 8)[:, :7]
+    return packed.tobytes()[:-(-count * 7 // 8)]
+
 # Adjusted functions to handle color data if needed
 def pack_low(frame):
-    packed_bytes = bytearray()
-    bit_buffer = 0
-    bit_count = 0
-
-    for char in frame:
-        value = LOW_ENCODING.get(char, 0)
-        bit_buffer = (bit_buffer << 4) | value
-        bit_count += 4
-        while bit_count >= 8:
-            bit_count -= 8
-            packed_bytes.append((bit_buffer >> bit_count) & 0xFF)
-
-    if bit_count > 0:
-        packed_bytes.append((bit_buffer << (8 - bit_count)) & 0xFF)
-    return packed_bytes
+    return _pack_values_low(_levels(_codepoints(frame), LOW_TABLE))
 
 def pack_high(frame):
-    packed_bytes = bytearray()
-    bit_buffer = 0
-    bit_count = 0
-
-    for char in frame:
-        value = HIGH_ENCODING.get(char, 0)
-        bit_buffer = (bit_buffer << 7) | value
-        bit_count += 7
-        while bit_count >= 8:
-            bit_count -= 8
-            packed_bytes.append((bit_buffer >> bit_count) & 0xFF)
-
-    if bit_count > 0:
-        packed_bytes.append((bit_buffer << (8 - bit_count)) & 0xFF)
-    return packed_bytes
+    return _pack_values_high(_levels(_codepoints(frame), HIGH_TABLE))
+
+def _unpack_values_low(packed_bytes):
+    return BYTE_NIBBLES[np.frombuffer(packed_bytes, dtype=np.uint8)].reshape(-1)
+
+def _unpack_values_high(packed_bytes):
+    data = np.frombuffer(packed_bytes, dtype=np.uint8)
+    count = len(data) * 8 // 7
+    septets = np.zeros(-(-len(data) // 7) * 7, dtype=np.uint8)
+    septets[:len(data)] = data
+    words = np.zeros((len(septets) // 7, 8), dtype=np.uint8)
+    words[:, :7] = septets.reshape(-1, 7)
+    words = words.view('>u8').reshape(-1, 1).astype(np.uint64) >> np.uint64(8)
+    return ((words >> SEPTET_SHIFTS) & np.uint64(0x7F)).astype(np.uint8).reshape(-1)[:count]
 
 def unpack_low(packed_bytes):
-    bit_buffer = 0
-    bit_count = 0
-    result = []
+    values = _unpack_values_low(packed_bytes)
+    values = values[values < len(BRIGHTNESS_LEVELS_LOW)]
+    return _from_codepoints(LOW_CODEPOINTS[values])
 
-    for byte in packed_bytes:
-        bit_buffer = (bit_buffer << 8) | byte 
-        bit_count += 8
+def unpack_high(packed_bytes):
+    values = _unpack_values_high(packed_bytes)
+    values = values[values < len(BRIGHTNESS_LEVELS_HIGH)]
+    return _from_codepoints(HIGH_CODEPOINTS[values])
 
-        while bit_count >= 4:
-            bit_count -= 4
-            value = (bit_buffer >> bit_count) & 0x0F
-            if value < len(BRIGHTNESS_LEVELS_LOW): 
-                result.append(BRIGHTNESS_LEVELS_LOW[value]) 
+# Glyph cells are already levels, they're packed without going through text.
+# Unpacked arrays may hold a padding value at the end, the reader trims them to the row or frame size.
+def pack_glyphs_low(cells):
+    return _pack_values_low(np.ascontiguousarray(cells, dtype=np.uint8).reshape(-1))
 
-    return ''.join(result)
+def pack_glyphs_high(cells):
+    return _pack_values_high(np.ascontiguousarray(cells, dtype=np.uint8).reshape(-1))
 
-def unpack_high(packed_bytes):
-    bit_buffer = 0
-    bit_count = 0
-    result = []
-
-    for byte in packed_bytes:
-        bit_buffer = (bit_buffer << 8) | byte
-        bit_count += 8
-
-        while bit_count >= 7: 
-            bit_count -= 7
-            value = (bit_buffer >> bit_count) & 0x7F
-            if value < len(BRIGHTNESS_LEVELS_HIGH): 
-                result.append(BRIGHTNESS_LEVELS_HIGH[value]) 
-
-    return ''.join(result)
-
-# Optimized parallel frame packing in batches
-def pack_frames_parallel(frames, brightness):
-    batch_size = 50  # batch size can be adjusted based on testing
-    with Pool(cpu_count()) as pool:
-        packed_batches = pool.starmap(pack_frame_batch, [(frames[i:i + batch_size], brightness) for i in range(0, len(frames), batch_size)])
-    return [frame for batch in packed_batches for frame in batch]
-
-# Optimized write_video function with mmap for writing, less frequent flushes, and zlib compression at level 2 // changed it back to 1 for faster writing
-def write_video(file, frames, frame_rate, brightness, audio_bytes):
-    # Use memory-mapped file for write efficiency
-    with mmap.mmap(file.fileno(), 0) as mmapped_file:
-        mmapped_file.write(b'VIDE')
-        mmapped_file.write(struct.pack('I', frame_rate))
-        mmapped_file.write(struct.pack('f', brightness))
-
-        # Parallel pack frames in batches
-        packed_frames = pack_frames_parallel(frames, brightness)
-
-        # Aggregate frame data with length headers
-        frame_data = bytearray()
-        for packed_frame in packed_frames:
-            frame_data.extend(struct.pack('I', len(packed_frame)))
-            frame_data.extend(packed_frame)
-
-        # Compress frame data with optimized level for color storage
-        compressed_frames = zlib.compress(frame_data, level=1)
-        mmapped_file.write(struct.pack('I', len(compressed_frames)))
-        mmapped_file.write(compressed_frames)
-
-        # Compress audio data at optimized compression level
-        compressed_audio = zlib.compress(audio_bytes, level=1)
-        mmapped_file.write(b'AUDI')
-        mmapped_file.write(struct.pack('I', len(compressed_audio)))
-        mmapped_file.write(compressed_audio)
-
-        mmapped_file.flush()  # Flush once after all writes
-
-# Optimized read_video function
+def unpack_glyphs_low(packed_bytes):
+    return _unpack_values_low(packed_bytes)
+
+def unpack_glyphs_high(packed_bytes):
+    return _unpack_values_high(packed_bytes)
+
+# Streaming writer: frames are compressed chunk by chunk as they come in, so a video can be stored while it's still being converted.
+# Each chunk starts with a keyframe, the frames after it only store the rows that changed since the previous frame.
+# Audio is added the same way, possibly from another thread (e.g. while it plays), and stored in chunks of `audio_chunk_seconds`.
+# With the row store (the default), frames are stored as row IDs instead: every distinct row is hashed and only stored the first
+# time it's seen, in the row chunk written next to the frame chunk that introduced it.
+class VideoWriter:
+    def __init__(self, file, frame_rate, brightness, chunk_frames=DEFAULT_CHUNK_FRAMES, frame_shape=(0, 0), palette='',
+                 audio_format=AUDIO_FORMAT, audio_chunk_seconds=DEFAULT_AUDIO_CHUNK_SECONDS, codec=DEFAULT_CODEC, level=None,
+                 row_store=True, row_window=DEFAULT_ROW_WINDOW):
+        self.file = file
+        self.codec = get_codec(codec)
+        self.level = level # None for the codec's default
+        self.pack_func = pack_function(brightness)
+        self.chunk_frames = chunk_frames
+        self.audio_format = audio_format
+        self.audio_chunk_seconds = audio_chunk_seconds
+        self.row_store = row_store
+        self.row_window = row_window
+        self.lock = threading.Lock() # frame and audio chunks may be written by different threads
+
+        frame_rate = Fraction(frame_rate).limit_denominator(1001 * 1000)
+        flags = FLAG_DELTA | (FLAG_ROWS if row_store else 0)
+        file.write(HEADER.pack(b'VID2', CONTAINER_VERSION, flags, brightness, frame_rate.numerator, frame_rate.denominator, chunk_frames))
+        height, width = frame_shape
+        file.write(FRAME_SHAPE.pack(width, height))
+        file.write(PALETTE_NAME.pack(palette.encode('ascii')))
+
+        self.chunks = []
+        self.frame_count = 0
+        self.pending = []
+        self.previous_rows = None
+        self.previous_ids = None
+
+        self.row_ids = OrderedDict() # row digest -> row ID, least recently seen first
+        self.row_count = 0
+        self.row_chunks = []
+        self.pending_rows = bytearray()
+        self.pending_row_count = 0
+        self.rows_seen = 0 # rows of every frame, for `dedup_ratio`
+
+        self.audio_chunks = []
+        self.audio_frame_count = 0
+        self.pending_audio = bytearray()
+
+    def add(self, frame):
+        # Timed as a whole, the compression of the chunks it completes included
+        with METRICS.span('pack'):
+            self._add(frame)
+
+    def _add(self, frame):
+        # Text frames are diffed line by line, cell grids row by row
+        rows = frame if isinstance(frame, np.ndarray) else frame.split('\n')
+        previous_rows, self.previous_rows = self.previous_rows, rows
+        changed = None
+        if previous_rows is not None and len(rows) == len(previous_rows):
+            if isinstance(rows, np.ndarray):
+                changed = np.flatnonzero((previous_rows != rows).any(axis=1)).tolist()
+            else:
+                changed = [index for index, (previous, row) in enumerate(zip(previous_rows, rows)) if previous != row]
+
+        if self.row_store:
+            self._add_row_frame(rows, changed)
+            return
+
+        if self.pending and changed is not None:
+            # A delta touching most rows costs about as much as a keyframe
+            if len(changed) * 2 <= len(rows):
+                record = bytearray(DELTA)
+                record.extend(struct.pack('<I', len(changed)))
+                for index in changed:
+                    packed_row = self.pack_func(rows[index])
+                    record.extend(ROW_CHANGE.pack(index, len(rows[index]), len(packed_row)))
+                    record.extend(packed_row)
+                self._add_record(record)
+                return
+
+        self._add_record(KEYFRAME + self.pack_func(frame))
+
+    def _add_row_frame(self, rows, changed):
+        # Only the rows that changed since the previous frame are looked up, the others keep their IDs
+        if changed is None or self.previous_ids is None:
+            ids = np.empty(len(rows), dtype='<u4')
+            changed = range(len(rows))
+        else:
+            ids = self.previous_ids.copy()
+        for index in changed:
+            ids[index] = self._row_id(rows[index])
+        self.previous_ids = ids
+        self.rows_seen += len(rows)
+        self._add_record(ROW_FRAME + ids.tobytes())
+
+    def _row_id(self, row):
+        data = row.tobytes() if isinstance(row, np.ndarray) else row.encode('utf-8')
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        row_id = self.row_ids.get(digest)
+        if row_id is not None:
+            self.row_ids.move_to_end(digest)
+            return row_id
+
+        row_id = self.row_count
+        self.row_count += 1
+        packed_row = self.pack_func(row)
+        self.pending_rows.extend(ROW_ENTRY.pack(len(row), len(packed_row)))
+        self.pending_rows.extend(packed_row)
+        self.pending_row_count += 1
+
+        self.row_ids[digest] = row_id
+        if len(self.row_ids) > self.row_window:
+            self.row_ids.popitem(last=False)
+        return row_id
+
+    @property
+    def dedup_ratio(self):
+        # Rows added per row stored, 1.0 when no row repeated
+        return self.rows_seen / self.row_count if self.row_count else 1.0
+
+    def add_packed(self, packed_frame):
+        # Already packed frames can't be diffed, they are stored as keyframes
+        self.previous_rows = None
+        self.previous_ids = None
+        self._add_record(KEYFRAME + packed_frame)
+
+    def _add_record(self, record):
+        self.pending.append(record)
+        if len(self.pending) == self.chunk_frames:
+            self._flush_chunk()
+
+    def _flush_rows(self):
+        # The rows introduced by the frames about to be written
+        if not self.pending_row_count:
+            return
+
+        with METRICS.span('compress'):
+            compressed = compress_chunk(self.pending_rows, self.codec, self.level)
+        first_row = self.row_count - self.pending_row_count
+        with self.lock:
+            self.row_chunks.append((self.file.tell(), len(compressed), first_row, self.pending_row_count))
+            self.file.write(compressed)
+        self.pending_rows = bytearray()
+        self.pending_row_count = 0
+
+    def _flush_chunk(self):
+        self._flush_rows()
+        if not self.pending:
+            return
+
+        chunk = bytearray()
+        for packed_frame in self.pending:
+            chunk.extend(struct.pack('<I', len(packed_frame)))
+            chunk.extend(packed_frame)
+        with METRICS.span('compress'):
+            compressed = compress_chunk(chunk, self.codec, self.level)
+
+        with self.lock:
+            self.chunks.append((self.file.tell(), len(compressed), self.frame_count, len(self.pending)))
+            self.file.write(compressed)
+        self.frame_count += len(self.pending)
+        self.pending = []
+
+    def add_audio(self, pcm):
+        # Raw PCM in `audio_format`, whole audio frames
+        rate, channels, sample_width = self.audio_format
+        chunk_bytes = int(rate * self.audio_chunk_seconds) * channels * sample_width
+        self.pending_audio.extend(pcm)
+        while len(self.pending_audio) >= chunk_bytes:
+            self._flush_audio(chunk_bytes)
+
+    def _flush_audio(self, size=None):
+        pcm = self.pending_audio[:size] if size else self.pending_audio
+        if not pcm:
+            return
+
+        _, channels, sample_width = self.audio_format
+        frames = len(pcm) // (channels * sample_width)
+        with METRICS.span('compress'):
+            compressed = compress_chunk(pcm, self.codec, self.level)
+        with self.lock:
+            self.audio_chunks.append((self.file.tell(), len(compressed), self.audio_frame_count, frames))
+            self.file.write(compressed)
+        self.audio_frame_count += frames
+        del self.pending_audio[:len(pcm)]
+
+    def close(self, audio_bytes=None):
+        # Audio can also be given here at once, as WAV data, instead of through add_audio
+        if audio_bytes:
+            with wave.open(io.BytesIO(audio_bytes)) as wav:
+                self.audio_format = (wav.getframerate(), wav.getnchannels(), wav.getsampwidth())
+                self.add_audio(wav.readframes(wav.getnframes()))
+
+        self._flush_chunk()
+        self._flush_audio()
+
+        index_offset = self.file.tell()
+        self.file.write(INDEX_HEADER.pack(b'INDX', self.frame_count, len(self.chunks)))
+        for chunk in self.chunks:
+            self.file.write(CHUNK_ENTRY.pack(*chunk))
+        self.file.write(AUDIO_HEADER.pack(*self.audio_format, len(self.audio_chunks)))
+        for chunk in self.audio_chunks:
+            self.file.write(AUDIO_CHUNK_ENTRY.pack(*chunk))
+        self.file.write(ROW_COUNT.pack(len(self.row_chunks)))
+        for chunk in self.row_chunks:
+            self.file.write(ROW_CHUNK_ENTRY.pack(*chunk))
+        self.file.write(FOOTER.pack(index_offset, b'VEND'))
+        self.file.flush()
+
+def write_video(file, frames, frame_rate, brightness, audio_bytes, chunk_frames=DEFAULT_CHUNK_FRAMES, palette='', codec=DEFAULT_CODEC, level=None,
+                row_store=True):
+    # audio_bytes is WAV data
+    frame_shape = frames[0].shape if brightness in CELL_BRIGHTNESS and len(frames) else (0, 0)
+    writer = VideoWriter(file, frame_rate, brightness, chunk_frames, frame_shape, palette, codec=codec, level=level, row_store=row_store)
+
+    for frame in frames:
+        writer.add(frame)
+
+    writer.close(audio_bytes)
+
+# Random access reader: maps the file and decodes only the chunk holding the requested frame
+class VideoReader:
+    def __init__(self, file):
+        self.mmapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self.mmapped_file
+
+        magic, version, self.flags, brightness, rate_num, rate_den, chunk_frames = HEADER.unpack_from(mm, 0)
+        if magic != b'VID2':
+            raise ValueError("Invalid file format")
+        if version not in (LEGACY_CONTAINER_VERSION, CONTAINER_VERSION):
+            raise ValueError(f"Unsupported container version {version}")
+
+        self.version = version
+        self.legacy = version == LEGACY_CONTAINER_VERSION
+        self.brightness = brightness
+        self.frame_rate = Fraction(rate_num, rate_den)
+        self.chunk_frames = chunk_frames
+        self.unpack_func = unpack_function(brightness)
+
+        if self.legacy:
+            self.width, self.height, self.palette = 0, 0, ''
+        else:
+            self.width, self.height = FRAME_SHAPE.unpack_from(mm, HEADER.size)
+            self.palette = PALETTE_NAME.unpack_from(mm, HEADER.size + FRAME_SHAPE.size)[0].rstrip(b'\0').decode('ascii')
+        self.cells = brightness in CELL_BRIGHTNESS
+
+        index_offset, end_magic = FOOTER.unpack_from(mm, len(mm) - FOOTER.size)
+        if end_magic != b'VEND':
+            raise ValueError("Missing frame index")
+
+        index_magic, self.frame_count, chunk_count = INDEX_HEADER.unpack_from(mm, index_offset)
+        if index_magic != b'INDX':
+            raise ValueError("Corrupted frame index")
+
+        offset = index_offset + INDEX_HEADER.size
+        self.chunks = [CHUNK_ENTRY.unpack_from(mm, offset + i * CHUNK_ENTRY.size) for i in range(chunk_count)]
+        self.chunk_starts = [chunk[2] for chunk in self.chunks]
+
+        offset += chunk_count * CHUNK_ENTRY.size
+        if self.legacy:
+            # A single compressed WAV blob, only readable as a whole, and no row store
+            self.audio_format = None
+            self.audio_chunks = None
+            self.audio_entry = AUDIO_ENTRY.unpack_from(mm, offset)
+            self.row_chunks = []
+        else:
+            rate, channels, sample_width, audio_chunk_count = AUDIO_HEADER.unpack_from(mm, offset)
+            self.audio_format = (rate, channels, sample_width)
+            offset += AUDIO_HEADER.size
+            self.audio_chunks = [AUDIO_CHUNK_ENTRY.unpack_from(mm, offset + i * AUDIO_CHUNK_ENTRY.size) for i in range(audio_chunk_count)]
+            self.audio_chunk_starts = [chunk[2] for chunk in self.audio_chunks]
+            self.audio_entry = None
+            offset += audio_chunk_count * AUDIO_CHUNK_ENTRY.size
+
+            row_chunk_count = ROW_COUNT.unpack_from(mm, offset)[0]
+            offset += ROW_COUNT.size
+            self.row_chunks = [ROW_CHUNK_ENTRY.unpack_from(mm, offset + i * ROW_CHUNK_ENTRY.size) for i in range(row_chunk_count)]
+        self.row_chunk_starts = [chunk[2] for chunk in self.row_chunks]
+        # Decoded row chunks, least recently used first
+        self.cached_rows = OrderedDict()
+
+        # Last decoded chunk, sequential reads only decompress each chunk once
+        self.cached_chunk = (None, None, None, None)
+
+    def __len__(self):
+        return self.frame_count
+
+    def _chunk_for(self, index):
+        return bisect_right(self.chunk_starts, index) - 1
+
+    def _row_chunk(self, row_chunk_index):
+        if row_chunk_index in self.cached_rows:
+            self.cached_rows.move_to_end(row_chunk_index)
+            return self.cached_rows[row_chunk_index]
+
+        offset, length, _, count = self.row_chunks[row_chunk_index]
+        data = self._read_chunk(offset, length)
+        rows = []
+        position = 0
+        for _ in range(count):
+            row_length, packed_length = ROW_ENTRY.unpack_from(data, position)
+            position += ROW_ENTRY.size
+            rows.append(self.unpack_func(data[position:position + packed_length])[:row_length])
+            position += packed_length
+
+        self.cached_rows[row_chunk_index] = rows
+        if len(self.cached_rows) > ROW_CACHE_CHUNKS:
+            self.cached_rows.popitem(last=False)
+        return rows
+
+    def _rows(self, ids):
+        # Looks the rows of a frame up in the row store
+        rows = []
+        for row_id in ids.tolist():
+            row_chunk_index = bisect_right(self.row_chunk_starts, row_id) - 1
+            rows.append(self._row_chunk(row_chunk_index)[row_id - self.row_chunks[row_chunk_index][2]])
+        return rows
+
+    def _decode_chunk(self, chunk_index):
+        # Returns the chunk's frames, per frame the rows changed since the previous one (None for keyframes)
+        # and the row IDs of frames stored in the row store (None otherwise)
+        if self.cached_chunk[0] == chunk_index:
+            return self.cached_chunk[1:]
+
+        offset, length, _, count = self.chunks[chunk_index]
+        data = self._read_chunk(offset, length)
+
+        frames = []
+        changes = []
+        frame_ids = []
+        rows = None
+        ids = None
+        position = 0
+        for _ in range(count):
+            record_length = struct.unpack_from('<I', data, position)[0]
+            position += 4
+            record = data[position:position + record_length]
+            position += record_length
+
+            if not self.flags & FLAG_DELTA:
+                frames.append(self.unpack_func(record))
+                changes.append(None)
+                frame_ids.append(None)
+                continue
+
+            if record[:1] == ROW_FRAME:
+                # Copied, `record` may be a view of the mapped file
+                previous_ids, ids = ids, np.frombuffer(record[1:], dtype='<u4').astype(np.uint32)
+                if previous_ids is not None and len(previous_ids) == len(ids):
+                    # only the rows whose IDs changed are looked up, like deltas
+                    changed = np.flatnonzero(previous_ids != ids).tolist()
+                    rows = rows.copy() if self.cells else list(rows)
+                    for index, row in zip(changed, self._rows(ids[changed])):
+                        rows[index] = row
+                else:
+                    changed = None
+                    rows = self._rows(ids)
+                    rows = np.stack(rows) if self.cells else rows
+                frame = rows if self.cells else '\n'.join(rows)
+            elif record[:1] == KEYFRAME:
+                frame = self.unpack_func(record[1:])
+                if self.cells:
+                    frame = rows = frame[:self.height * self.width].reshape(self.height, self.width)
+                else:
+                    rows = frame.split('\n')
+                changed = None
+                ids = None
+            else:
+                rows = rows.copy() if self.cells else list(rows)
+                changed = []
+                row_position = 5
+                for _ in range(struct.unpack_from('<I', record, 1)[0]):
+                    index, row_length, packed_length = ROW_CHANGE.unpack_from(record, row_position)
+                    row_position += ROW_CHANGE.size
+                    rows[index] = self.unpack_func(record[row_position:row_position + packed_length])[:row_length]
+                    row_position += packed_length
+                    changed.append(index)
+                frame = rows if self.cells else '\n'.join(rows)
+                ids = None
+
+            frames.append(frame)
+            changes.append(changed)
+            frame_ids.append(ids)
+
+        self.cached_chunk = (chunk_index, frames, changes, frame_ids)
+        return frames, changes, frame_ids
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.frame_count
+        if not 0 <= index < self.frame_count:
+            raise IndexError("Frame index out of range")
+
+        chunk_index = self._chunk_for(index)
+        return self._decode_chunk(chunk_index)[0][index - self.chunks[chunk_index][2]]
+
+    def deltas(self, start=0):
+        # Yields (frame, changed rows) from `start` on, decoding one chunk at a time.
+        # Changed rows is None whenever the whole frame has to be considered new.
+        if start >= self.frame_count:
+            return
+        chunk_index = self._chunk_for(start)
+        skip = start - self.chunks[chunk_index][2]
+        previous_ids = None
+        for chunk_index in range(chunk_index, len(self.chunks)):
+            frames, changes, frame_ids = self._decode_chunk(chunk_index)
+            if skip:
+                changes = [None] + changes[skip + 1:]
+                frames = frames[skip:]
+                frame_ids = frame_ids[skip:]
+            elif previous_ids is not None and frame_ids and frame_ids[0] is not None and len(frame_ids[0]) == len(previous_ids):
+                # row IDs are global, the first frame of a chunk is compared with the last one of the previous chunk
+                changes = [np.flatnonzero(previous_ids != frame_ids[0]).tolist()] + changes[1:]
+            yield from zip(frames, changes)
+            previous_ids = frame_ids[-1] if frame_ids else None
+            skip = 0
+
+    def frames(self, start=0):
+        # Yields frames from `start` on, decoding one chunk at a time
+        for frame, _ in self.deltas(start):
+            yield frame
+
+    def __iter__(self):
+        return self.frames()
+
+    def frame_at(self, seconds):
+        # Index of the frame shown at a given time
+        return min(int(seconds * self.frame_rate), max(self.frame_count - 1, 0))
+
+    def _read_chunk(self, offset, length):
+        # Decompressed straight from the mapping; uncompressed chunks come back as a view of it, without any copy
+        chunk = memoryview(self.mmapped_file)[offset:offset + length]
+        with METRICS.span('decompress'):
+            return zlib.decompress(chunk) if self.legacy else decompress_chunk(chunk)
+
+    def chunk_payloads(self):
+        # Yields the decompressed data of every frame chunk, row chunk and audio chunk
+        for offset, length, _, _ in self.chunks + self.row_chunks + (self.audio_chunks or []):
+            yield bytes(self._read_chunk(offset, length))
+
+    def _audio_chunks(self, start_frame):
+        if not self.audio_chunks:
+            return
+        chunk_index = max(bisect_right(self.audio_chunk_starts, start_frame) - 1, 0)
+        skip = max(start_frame - self.audio_chunks[chunk_index][2], 0) * self.audio_format[1] * self.audio_format[2]
+        for offset, length, _, _ in self.audio_chunks[chunk_index:]:
+            # Copied out of the mapping, audio may outlive the reader
+            yield bytes(self._read_chunk(offset, length)[skip:])
+            skip = 0
+
+    def audio_source(self, start=0.0):
+        # The audio from `start` seconds on, decompressed one chunk at a time as it's read
+        if self.audio_entry is not None:
+            return wav_audio(self.audio(), start)
+        rate, channels, sample_width = self.audio_format
+        return AudioSource(self._audio_chunks(int(start * rate)), rate, channels, sample_width)
+
+    def audio(self):
+        # The whole soundtrack as WAV data
+        if self.audio_entry is None:
+            return wav_bytes(self._audio_chunks(0), self.audio_format)
+        offset, length = self.audio_entry
+        return zlib.decompress(self.mmapped_file[offset:offset + length])
+
+    def close(self):
+        self.cached_chunk = (None, None, None, None)
+        self.cached_rows.clear()
+        self.mmapped_file.close()
+
+# Reads a whole video into memory, version 1 ('VIDE') files included
 def read_video(file):
     with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mmapped_file:
-        if mmapped_file.read(4) != b'VIDE':
+        magic = mmapped_file.read(4)
+        if magic == b'VID2':
+            reader = VideoReader(file)
+            try:
+                return list(reader), reader.frame_rate, reader.brightness, reader.audio()
+            finally:
+                reader.close()
+        if magic != b'VIDE':
             raise ValueError("Invalid file format")
 
         frame_rate = struct.unpack('I', mmapped_file.read(4))[0]
         brightness = struct.unpack('f', mmapped_file.read(4))[0]
-        unpack_func = unpack_high if brightness == 1.0 else unpack_low
+        unpack_func = unpack_function(brightness)
 
         # Read and decompress frame data
         frame_data_length = struct.unpack('I', mmapped_file.read(4))[0]
@@ -0,0 +1,123 @@
+import numpy as np
+
+from src.utils.file.tools import (
+    BRIGHTNESS_COLOR_GLYPHS_HIGH, BRIGHTNESS_COLOR_GLYPHS_LOW, BRIGHTNESS_GLYPHS_HIGH, BRIGHTNESS_GLYPHS_LOW,
+    BRIGHTNESS_LEVELS_HIGH, BRIGHTNESS_LEVELS_LOW,
+)
+
+# Characters from darkest to brightest, the container's brightness tables without their trailing newline
+RAMPS = {
+    'low': BRIGHTNESS_LEVELS_LOW[:-1],
+    'high': BRIGHTNESS_LEVELS_HIGH[:-1],
+}
+
+# Container brightness marker of every (ramp, colored) combination
+GLYPH_BRIGHTNESS = {
+    ('low', False): BRIGHTNESS_GLYPHS_LOW,
+    ('high', False): BRIGHTNESS_GLYPHS_HIGH,
+    ('low', True): BRIGHTNESS_COLOR_GLYPHS_LOW,
+    ('high', True): BRIGHTNESS_COLOR_GLYPHS_HIGH,
+}
+
+# Luma weights (BT.601) in 1/256ths
+LUMA_WEIGHTS = (77, 150, 29)
+
+
+class Glyphs:
+    """
+    Glyph mode: every cell is a character picked by the luminance of its pixel, on the
+    terminal's own background.
+
+    Monochrome cells are uint8 indices into the ramp, which the container stores with
+    its 4-bit ('low') or 7-bit ('high') packers. Colored cells also set the foreground
+    to the pixel's color in the output palette, and hold `color << 8 | level` in a uint32
+    (packed 0xRRGGBB colors take the upper 24 bits). Both conversions are table lookups.
+    """
+
+    def __init__(self, ramp='high', color=False):
+        """
+        Args:
+            ramp (str): 'low' (13 levels, plain ASCII) or 'high' (112 levels).
+            color (bool): Whether glyphs are drawn in the pixel's color.
+        """
+        if ramp not in RAMPS:
+            raise ValueError(f"Unknown glyph ramp '{ramp}'")
+        self.ramp = ramp
+        self.color = color
+        characters = RAMPS[ramp]
+
+        # luminance -> level
+        self.lut = (np.arange(256) * len(characters) // 256).astype(np.uint8)
+
+        # level -> UTF-8 bytes of its character, for the encoder
+        encoded = [character.encode() for character in characters]
+        self.table = np.zeros((len(encoded), max(map(len, encoded))), dtype=np.uint8)
+        self.length = np.zeros(len(encoded), dtype=np.int64)
+        for level, character in enumerate(encoded):
+            self.table[level, :len(character)] = np.frombuffer(character, dtype=np.uint8)
+            self.length[level] = len(character)
+
+    @property
+    def name(self):
+        return f"{self.ramp}{'-color' if self.color else ''}"
+
+    @property
+    def brightness(self):
+        # the container's brightness marker for these cells
+        return GLYPH_BRIGHTNESS[self.ramp, self.color]
+
+    @property
+    def dtype(self):
+        return np.uint32 if self.color else np.uint8
+
+    def levels(self, frame):
+        """
+        Maps an RGB frame to ramp levels.
+
+        Args:
+            frame (np.ndarray): A (height, width, 3) uint8 array.
+
+        Returns:
+            np.ndarray: A (height, width) uint8 array of levels.
+        """
+        frame = np.asarray(frame, dtype=np.uint8)
+        red, green, blue = LUMA_WEIGHTS
+        luma = (
+            red * frame[..., 0].astype(np.uint16)
+            + green * frame[..., 1].astype(np.uint16)
+            + blue * frame[..., 2].astype(np.uint16)
+        ) >> 8
+        return self.lut[luma]
+
+    def quantize(self, frame, palette=None):
+        """
+        Converts an RGB frame into glyph cells.
+
+        Args:
+            frame (np.ndarray): A (height, width, 3) uint8 array.
+            palette (Palette | None): The palette of the foreground colors, used by colored glyphs.
+
+        Returns:
+            np.ndarray: A (height, width) array of cells, uint8 or uint32 (see the class docs).
+        """
+        levels = self.levels(frame)
+        if not self.color:
+            return levels
+        colors = palette.quantize(frame) if palette is not None else np.zeros(levels.shape, dtype=np.uint32)
+        return (colors.astype(np.uint32) << np.uint32(8)) | levels
+
+
+def glyphs_for_brightness(brightness):
+    """
+    Finds the glyph mode of a container's cells.
+
+    Args:
+        brightness (float): The container's brightness marker.
+
+    Returns:
+        Glyphs | None: The glyph mode, None when the cells aren't glyphs.
+    """
+    for (ramp, color), marker in GLYPH_BRIGHTNESS.items():
+        if marker == brightness:
+            return Glyphs(ramp, color)
+    return None
@@ -0,0 +1,115 @@
+from collections import deque, namedtuple
+
+import numpy as np
+
+# color_bits: bits kept per color channel, frame_step: draw every n-th frame
+QualityLevel = namedtuple('QualityLevel', ['color_bits', 'frame_step'])
+
+# From best to cheapest. Fewer color bits make neighbouring cells (and the same cell across
+# frames) share colors, so runs get longer and fewer cells change; the last levels also cap
+# the frame rate.
+DEFAULT_LEVELS = [
+    QualityLevel(8, 1),
+    QualityLevel(6, 1),
+    QualityLevel(5, 1),
+    QualityLevel(4, 1),
+    QualityLevel(4, 2),
+    QualityLevel(3, 2),
+    QualityLevel(3, 3),
+]
+
+
+def color_mask(bits):
+    # packed mask keeping the top `bits` of each channel, and the value centering the kept range
+    channel_mask = (0xFF << (8 - bits)) & 0xFF
+    channel_half = (1 << (8 - bits)) >> 1
+    mask = (channel_mask << 16) | (channel_mask << 8) | channel_mask
+    half = (channel_half << 16) | (channel_half << 8) | channel_half
+    return np.uint32(mask), np.uint32(half)
+
+
+class QualityGovernor:
+    """
+    Adapts the output quality to what the terminal can absorb.
+
+    The time the terminal takes to absorb each frame is compared with the frame budget.
+    When the terminal falls behind, the governor steps down to a cheaper quality level
+    (less color precision, then a lower frame rate); when writes have had plenty of
+    headroom for a while, it steps back up.
+    """
+
+    def __init__(self, frame_duration, levels=DEFAULT_LEVELS, budget=0.6, headroom=0.25, window=24, packed_colors=True):
+        """
+        Args:
+            frame_duration (float): Seconds per frame of the video.
+            levels (list[QualityLevel]): Quality levels, from best to cheapest.
+            budget (float): Share of the time between drawn frames that output may take.
+            headroom (float): Share under which output is considered cheap enough to step up.
+            window (int): Drawn frames measured before each decision.
+            packed_colors (bool): Whether cells hold packed RGB colors; palette indices can't
+                lose precision, only the frame rate is lowered for them.
+        """
+        self.frame_duration = frame_duration
+        self.levels = levels
+        self.budget = budget
+        self.headroom = headroom
+        self.window = window
+        self.packed_colors = packed_colors
+
+        self.level_index = 0
+        self.write_times = deque(maxlen=window)
+        self.frame_bytes = deque(maxlen=window)
+        self.changes = 0
+
+    @property
+    def level(self):
+        return self.levels[self.level_index]
+
+    def should_draw(self, index):
+        return index % self.level.frame_step == 0
+
+    def apply(self, cells):
+        # quantizes a frame of packed colors to the current color precision
+        if self.level.color_bits >= 8 or not self.packed_colors:
+            return cells
+        mask, half = color_mask(self.level.color_bits)
+        if cells.dtype == np.uint64:
+            # half-block cells, both halves at once
+            mask = (np.uint64(mask) << np.uint64(32)) | np.uint64(mask)
+            half = (np.uint64(half) << np.uint64(32)) | np.uint64(half)
+        return (cells & mask) | half
+
+    def record(self, seconds, written_bytes):
+        """
+        Records the output cost of a drawn frame and adjusts the quality level.
+
+        Args:
+            seconds (float): Time output took since the previous drawn frame (see
+                `TerminalWriter.take_cost`).
+            written_bytes (int): Bytes written for the frame.
+        """
+        self.write_times.append(seconds)
+        self.frame_bytes.append(written_bytes)
+        if len(self.write_times) < self.window:
+            return
+
+        allowed = self.frame_duration * self.level.frame_step
+        average = sum(self.write_times) / len(self.write_times)
+
+        if average > allowed * self.budget and self.level_index < len(self.levels) - 1:
+            self._set_level(self.level_index + 1)
+        elif average < allowed * self.headroom and self.level_index > 0:
+            self._set_level(self.level_index - 1)
+
+    def _set_level(self, index):
+        self.level_index = index
+        self.changes += 1
+        self.write_times.clear()
+        self.frame_bytes.clear()
+
+    def summary(self):
+        average_bytes = sum(self.frame_bytes) // len(self.frame_bytes) if self.frame_bytes else 0
+        return (
+            f"quality: {self.level.color_bits} bits per channel, every {self.level.frame_step} frame(s), "
+            f"{self.changes} adjustment(s), {average_bytes} bytes per frame recently"
+        )
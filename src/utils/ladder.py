@@ -0,0 +1,176 @@
+import glob
+import os
+import re
+
+# Sizes of the renditions converted next to the captured one, relative to it; covers making
+# the font one or two steps smaller or larger, or the window half as big
+DEFAULT_LADDER = (1.5, 1.0, 0.75, 0.5)
+
+# Cells the player leaves free around a frame, see `TerminalPlayer.create_video`
+MARGIN_COLUMNS = 1
+MARGIN_LINES = 2
+
+
+def ladder_heights(height, factors=DEFAULT_LADDER):
+    # rows of cells of every rendition, from the largest down, the captured height always included
+    return sorted({height} | {max(2, round(height * factor)) for factor in factors}, reverse=True)
+
+
+def stacked_shape(shapes):
+    # cell grid holding every rendition's frame, one under the other and aligned to the left
+    return sum(height for height, _ in shapes), max(width for _, width in shapes)
+
+
+def split_stacked(cells, shapes):
+    # the renditions' frames in a stacked cell grid, as views
+    frames = []
+    top = 0
+    for height, width in shapes:
+        frames.append(cells[top:top + height, :width])
+        top += height
+    return frames
+
+
+def closest_rendition(shapes, columns, lines):
+    """
+    Picks the rendition to show on a terminal of a given size.
+
+    Args:
+        shapes (list[tuple]): The (height, width) of every rendition, in cells.
+        columns (int): The terminal's columns.
+        lines (int): The terminal's lines.
+
+    Returns:
+        int: The index of the largest rendition fitting the terminal, or of the smallest
+            one when none does.
+    """
+    fitting = [
+        (height * width, index) for index, (height, width) in enumerate(shapes)
+        if height <= lines - MARGIN_LINES and width <= columns - MARGIN_COLUMNS
+    ]
+    if fitting:
+        return max(fitting)[1]
+    return min((height * width, index) for index, (height, width) in enumerate(shapes))[1]
+
+
+def rendition_path(path, height):
+    # where the rendition of a container with `height` rows is stored, next to it
+    stem, extension = os.path.splitext(path)
+    return f'{stem}@{height}{extension}'
+
+
+def rendition_paths(path):
+    # a container followed by the renditions stored next to it, from the largest down
+    stem, extension = os.path.splitext(path)
+    pattern = re.compile(re.escape(os.path.basename(stem)) + r'@(\d+)' + re.escape(extension) + '$')
+    found = []
+    for candidate in glob.glob(glob.escape(stem) + '@*' + extension):
+        match = pattern.match(os.path.basename(candidate))
+        if match:
+            found.append((int(match.group(1)), candidate))
+    return [path] + [candidate for _, candidate in sorted(found, reverse=True)]
+
+
+class StackedLadder:
+    """
+    Renditions of a video converted together, as stacked cell grids (see `stacked_shape`).
+
+    Only the selected rendition is yielded by `deltas`; switching is a matter of slicing
+    another part of the same frames, so it takes effect at the very next frame.
+    """
+
+    def __init__(self, frames, shapes, current=0):
+        """
+        Args:
+            frames (Iterable[np.ndarray]): The stacked cell grids, e.g. a `FramePipeline`.
+            shapes (list[tuple]): The (height, width) of every rendition, in stacking order.
+            current (int): The rendition shown first.
+        """
+        self.frames = frames
+        self.shapes = shapes
+        self.current = current
+
+    def select(self, index):
+        self.current = index
+
+    def deltas(self, record=None):
+        # yields (frame, None) like `VideoReader.deltas`, the rows that changed aren't known;
+        # `record` is called with every stacked frame, e.g. to store all the renditions
+        for cells in self.frames:
+            if record is not None:
+                record(cells)
+            yield split_stacked(cells, self.shapes)[self.current], None
+
+
+class ReaderLadder:
+    """
+    Renditions of a video stored in separate containers (or cache entries).
+
+    Switching opens the other container at the current frame, decoding only the chunk
+    holding it; the first frame of the new rendition is yielded as a keyframe.
+    """
+
+    def __init__(self, readers, current=0):
+        """
+        Args:
+            readers (list[VideoReader]): The renditions, with the same frames.
+            current (int): The rendition shown first.
+        """
+        self.readers = readers
+        self.shapes = [(reader.height, reader.width) for reader in readers]
+        self.current = current
+
+    def select(self, index):
+        self.current = index
+
+    def __len__(self):
+        return len(self.readers[self.current])
+
+    def __getitem__(self, index):
+        # a frame of the selected rendition
+        return self.readers[self.current][index]
+
+    def deltas(self):
+        index = 0
+        while True:
+            current = self.current
+            keyframe = True
+            for frame, changed in self.readers[current].deltas(index):
+                if self.current != current:
+                    break
+                yield frame, None if keyframe else changed
+                keyframe = False
+                index += 1
+            else:
+                return
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
+
+
+class LadderRecording:
+    """
+    Cache entries (or any writers with the same methods) filled with every rendition of a
+    video at once, from stacked cell grids.
+    """
+
+    def __init__(self, entries, shapes):
+        self.entries = entries
+        self.shapes = shapes
+
+    def add(self, cells):
+        for entry, frame in zip(self.entries, split_stacked(cells, self.shapes)):
+            entry.add(frame)
+
+    def add_audio(self, pcm):
+        for entry in self.entries:
+            entry.add_audio(pcm)
+
+    def commit(self):
+        for entry in self.entries:
+            entry.commit()
+
+    def abort(self):
+        for entry in self.entries:
+            entry.abort()
@@ -0,0 +1,201 @@
+import json
+import math
+import os
+import threading
+import time
+
+# Histogram buckets per doubling of the value; percentiles are accurate to about 19%
+BUCKETS_PER_OCTAVE = 4
+# Trace events kept at most, later ones are counted but not stored
+MAX_TRACE_EVENTS = 1 << 20
+
+
+class Histogram:
+    """
+    Distribution of a measured value (seconds or bytes) in logarithmic buckets.
+
+    Recording a value is a logarithm and a dictionary update, whatever the number of
+    values, so it's cheap enough for every frame of every stage.
+    """
+
+    def __init__(self, unit='s'):
+        self.unit = unit
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        bucket = math.floor(math.log2(value) * BUCKETS_PER_OCTAVE) if value > 0 else None
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        # upper bound of the bucket holding the given share of the values
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda bucket: -math.inf if bucket is None else bucket):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return 0.0 if bucket is None else min(2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE), self.max)
+        return self.max
+
+
+def format_value(value, unit):
+    if unit == 's':
+        return f'{value * 1e3:.2f} ms' if value < 1 else f'{value:.2f} s'
+    if unit == 'B':
+        return f'{value / 1024:.1f} KiB' if value >= 1024 else f'{value:.0f} B'
+    return f'{value:.2f} {unit}'
+
+
+class Metrics:
+    """
+    Per-stage timings, value histograms and counters of a run, plus an optional trace.
+
+    Stages are timed with `span` (or `record` for durations measured elsewhere, e.g. in
+    the conversion workers, whose timings come back with their results). Everything can
+    be recorded from any thread. While tracing, every timed stage is also kept as an
+    event, and `write_trace` dumps them in the Chrome trace format (chrome://tracing,
+    Perfetto), one row per process and thread, to see which stage limits a machine.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.events = None # trace events, None while not tracing
+        self.thread_names = {} # names of the threads events were recorded in, kept once they've ended
+        self.dropped_events = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            if self.events is not None:
+                self.events = []
+            self.dropped_events = 0
+
+    def _histogram(self, name, unit):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(unit)
+        return histogram
+
+    def record(self, name, seconds, start=None, pid=None, tid=None):
+        """
+        Records the duration of a stage.
+
+        Args:
+            name (str): The stage.
+            seconds (float): How long it took.
+            start (float | None): When it started (`time.perf_counter`), for the trace;
+                None when it just ended.
+            pid (int | None): The process it ran in, None for this one.
+            tid (int | None): The thread it ran in, None for the current one.
+        """
+        with self._lock:
+            self._histogram(name, 's').add(seconds)
+            if self.events is None:
+                return
+            if len(self.events) >= MAX_TRACE_EVENTS:
+                self.dropped_events += 1
+                return
+            if start is None:
+                start = time.perf_counter() - seconds
+            if tid is None:
+                tid = threading.get_ident()
+                if tid not in self.thread_names:
+                    self.thread_names[tid] = threading.current_thread().name
+            self.events.append((name, start, seconds, pid or os.getpid(), tid))
+
+    def observe(self, name, value, unit='B'):
+        # records a value that isn't a duration, e.g. the bytes written for a frame
+        with self._lock:
+            self._histogram(name, unit).add(value)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def span(self, name):
+        # times the `with` block as stage `name`
+        return Span(self, name)
+
+    def start_trace(self):
+        with self._lock:
+            self.events = []
+            self.dropped_events = 0
+
+    def write_trace(self, path):
+        """
+        Writes the trace events recorded since `start_trace` as a Chrome trace.
+
+        Args:
+            path (str): The JSON file to write.
+        """
+        with self._lock:
+            events = list(self.events or ())
+            counters = dict(self.counters)
+            names = dict(self.thread_names)
+        origin = min((start for _, start, _, _, _ in events), default=0.0)
+        trace = [
+            {'name': name, 'ph': 'X', 'ts': (start - origin) * 1e6, 'dur': seconds * 1e6, 'pid': pid, 'tid': tid}
+            for name, start, seconds, pid, tid in events
+        ]
+        # names the rows: threads of this process, conversion workers
+        for pid, tid in {(pid, tid) for _, _, _, pid, tid in events}:
+            name = names.get(tid, f'thread {tid}') if pid == os.getpid() else 'worker'
+            trace.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        for pid in {pid for _, _, _, pid, _ in events}:
+            name = 'main' if pid == os.getpid() else f'worker {pid}'
+            trace.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}})
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms', 'otherData': {'counters': counters}}, file)
+
+    def summary(self):
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        if not histograms and not counters:
+            return ''
+
+        lines = [f"{'stage':<22}{'count':>8}{'total':>12}{'mean':>12}{'p50':>12}{'p95':>12}{'p99':>12}{'max':>12}"]
+        for name, histogram in histograms:
+            total = format_value(histogram.total, histogram.unit)
+            values = [histogram.mean, histogram.percentile(0.5), histogram.percentile(0.95), histogram.percentile(0.99), histogram.max]
+            lines.append(f"{name:<22}{histogram.count:>8}{total:>12}" + ''.join(f'{format_value(value, histogram.unit):>12}' for value in values))
+        if counters:
+            lines.append(', '.join(f'{name}: {value}' for name, value in counters))
+        if self.dropped_events:
+            lines.append(f"{self.dropped_events} trace event(s) past the limit weren't kept")
+        return '\n'.join(lines)
+
+
+class Span:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.name, time.perf_counter() - self.start, self.start)
+
+
+# Metrics of this process, recorded by every stage
+METRICS = Metrics()
@@ -1,7 +1,5 @@
-import requests
 from yt_dlp import YoutubeDL
 from yt_dlp.utils import DownloadError
-from io import BytesIO
 
 class muteLogger:
     def error(self, msg=None):
@@ -11,38 +9,65 @@ class muteLogger:
     def debug(self, msg=None):
         pass
 
-def yt_download(link, custom_name=None):
-    # set up options for yt-dlp
+def pick_format(info, pixel_height):
+    """
+    Picks the format to stream: the smallest one with both audio and video that is at
+    least `pixel_height` tall, or the tallest one when none is.
+
+    Args:
+        info (dict): yt-dlp's info for the video.
+        pixel_height (int): The height the frames will be scaled to.
+
+    Returns:
+        dict: The format (with 'url' and, when known, 'width', 'height', 'fps').
+    """
+    formats = [
+        fmt for fmt in info.get('formats') or []
+        if fmt.get('url') and fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none'
+        and fmt.get('protocol', 'https') in ('http', 'https')
+    ]
+    if not formats:
+        return info # direct links have no format list
+
+    tall_enough = [fmt for fmt in formats if (fmt.get('height') or 0) >= pixel_height]
+    if tall_enough:
+        return min(tall_enough, key=lambda fmt: (fmt['height'], fmt.get('tbr') or 0))
+    return max(formats, key=lambda fmt: (fmt.get('height') or 0, fmt.get('tbr') or 0))
+
+def yt_resolve(link, pixel_height):
+    """
+    Looks a video up without downloading it.
+
+    Args:
+        link (str): The video's URL (YouTube or anything else yt-dlp supports, direct links included).
+        pixel_height (int): The height the frames will be scaled to, used to pick the format.
+
+    Returns:
+        dict | bool: The video's 'title', 'id' (stable across runs, for the cache) and its
+            chosen format's 'url', 'ext', 'http_headers', 'width', 'height' and 'fps';
+            False when the URL isn't valid.
+    """
     ydl_opts = {
-        'format': 'best',  # choose the best quality available
         'noplaylist': True,  # do not download playlists
         'logger': muteLogger,
     }
 
     with YoutubeDL(ydl_opts) as ydl:
         try:
-            print(f"Downloading video...")
             info = ydl.extract_info(link, download=False)  # set download=False to get info without downloading
-            
-            # get the download URL
-            video_url = info['url']
-
-            # create a BytesIO buffer to hold the video data
-            video_buffer = BytesIO()
-
-            response = requests.get(video_url, stream=True)
-            response.raise_for_status()  # Raise an error for bad responses
-
-            # write the response content to the BytesIO buffer
-            for chunk in response.iter_content(chunk_size=8192):
-                video_buffer.write(chunk)
-
-            # seek to the beginning of the buffer for reading
-            video_buffer.seek(0)
-
-            return True, info['title'], info['ext'], video_buffer.getvalue()  # return the video bytes
         except DownloadError as e:
             if "is not a valid URL" in str(e):
                 return False
-        except Exception as e:
-            raise Exception(f'An unexpected error occurred: {e}')
\ No newline at end of file
+            raise Exception(f'An unexpected error occurred: {e}')
+
+    fmt = pick_format(info, pixel_height)
+    return {
+        'title': info.get('title'),
+        'id': f"{info.get('webpage_url') or link}#{fmt.get('format_id', '')}",
+        'url': fmt['url'],
+        'ext': fmt.get('ext') or info.get('ext') or '',
+        'http_headers': fmt.get('http_headers') or info.get('http_headers') or {},
+        'width': fmt.get('width'),
+        'height': fmt.get('height'),
+        'fps': fmt.get('fps'),
+    }
@@ -0,0 +1,194 @@
+import os
+import sys
+import threading
+import time
+
+from src.utils.metrics import METRICS
+
+# Output queued for the terminal before `TerminalWriter.write` waits for the writer
+DEFAULT_MAX_PENDING = 8 << 20 # 8 MiB
+# Frames queued before `TerminalWriter.write` waits; the terminal is never more than these
+# and the ones being written behind what the playback loop drew
+DEFAULT_MAX_FRAMES = 2
+
+
+class TerminalWriter:
+    """
+    Writes frames to the terminal from its own thread.
+
+    The playback loop hands over the encoded output of each frame and moves on; the
+    writer thread pushes it to the terminal's file descriptor with `os.write`, without
+    going through the text layer of `sys.stdout`. On Windows it writes through
+    `sys.stdout` instead, so colorama's wrapper (see `TerminalPlayer._init_colors`)
+    still translates escape sequences on consoles that don't support them.
+
+    Output is double-buffered: frames queued while the terminal is busy are appended to
+    a back buffer, which the writer swaps out and writes whole once the previous write
+    is done, so a slow terminal gets fewer, larger writes instead of falling further behind.
+
+    The queue depth (frames waiting for the writer) and the time the terminal blocked
+    the writer are measured; the playback loop only ever waits when `max_frames` frames
+    or `max_pending` bytes are already queued, and that wait is reported as stall time.
+    Waiting keeps the picture in step with the audio: the time it takes counts as drawing
+    time for `PlaybackClock`, which drops the frames that are due meanwhile, instead of
+    the terminal showing them seconds late.
+    """
+
+    def __init__(self, fd=None, max_pending=DEFAULT_MAX_PENDING, max_frames=DEFAULT_MAX_FRAMES):
+        """
+        Args:
+            fd (int | None): The terminal's file descriptor, None for standard output.
+            max_pending (int): Bytes queued before `write` waits for the writer.
+            max_frames (int): Frames queued before `write` waits for the writer.
+        """
+        # colorama replaces sys.stdout on Windows, it's looked up when writing
+        self.through_stdout = fd is None and os.name == 'nt'
+        self.fd = sys.stdout.fileno() if fd is None else fd
+        self.max_pending = max_pending
+        self.max_frames = max_frames
+
+        self.back = bytearray() # output queued since the writer last swapped buffers
+        self.back_frames = 0
+        self.busy = False # the writer is writing the front buffer
+        self.closed = False
+        self._changed = threading.Condition()
+        self._thread = None
+
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.writes = 0 # os.write calls
+        self.write_seconds = 0.0 # time spent in os.write, i.e. waiting for the terminal
+        self.stall_seconds = 0.0 # time `write` waited for room in the queue
+        self._cost = 0.0 # write and stall time since the last `take_cost`
+        self.max_depth = 0
+        self.depth_total = 0 # summed queue depths, for the average
+        self.frames_queued = 0
+
+    def start(self):
+        sys.stdout.flush() # whatever was printed through sys.stdout goes first
+        self._thread = threading.Thread(target=self._run, name='terminal writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def depth(self):
+        # frames queued and not written yet
+        return self.back_frames
+
+    def write(self, data):
+        """
+        Queues the output of a frame.
+
+        Args:
+            data (bytes | memoryview): The encoded output; empty frames are skipped.
+        """
+        if not data:
+            return
+        with self._changed:
+            if self._full(len(data)):
+                start = time.perf_counter()
+                while self._full(len(data)) and not self.closed:
+                    self._changed.wait()
+                stalled = time.perf_counter() - start
+                self.stall_seconds += stalled
+                self._cost += stalled
+            if self.closed:
+                return
+            self.back += data
+            self.back_frames += 1
+            self.frames_queued += 1
+            self.depth_total += self.back_frames
+            self.max_depth = max(self.max_depth, self.back_frames)
+            self._changed.notify_all()
+
+    def _full(self, size):
+        # whether `size` more bytes would go past the limits of the queue
+        return bool(self.back) and (self.back_frames >= self.max_frames or len(self.back) + size > self.max_pending)
+
+    def _write(self, front):
+        if self.through_stdout:
+            sys.stdout.write(front.decode('utf-8', 'replace'))
+            sys.stdout.flush()
+            self.writes += 1
+            return
+        view = memoryview(front)
+        while view:
+            view = view[os.write(self.fd, view):]
+            self.writes += 1
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self.back and not self.closed:
+                    self._changed.wait()
+                if not self.back:
+                    return
+                # swaps the buffers, frames queued from now on go to a fresh one
+                front, frames = self.back, self.back_frames
+                self.back = bytearray()
+                self.back_frames = 0
+                self.busy = True
+                self._changed.notify_all()
+
+            start = time.perf_counter()
+            try:
+                self._write(front)
+            except (OSError, ValueError):
+                # the terminal went away, nothing more can be shown
+                with self._changed:
+                    self.closed = True
+                    self.busy = False
+                    self.back = bytearray()
+                    self.back_frames = 0
+                    self._changed.notify_all()
+                return
+            seconds = time.perf_counter() - start
+            METRICS.record('terminal write', seconds, start)
+            METRICS.observe('terminal write bytes', len(front))
+
+            with self._changed:
+                self.write_seconds += seconds
+                self._cost += seconds
+                self.frames_written += frames
+                self.bytes_written += len(front)
+                self.busy = False
+                self._changed.notify_all()
+
+    def take_cost(self):
+        """
+        Returns the output cost since the previous call: the time the terminal blocked the
+        writer plus the time `write` waited for room in the queue, e.g. for `QualityGovernor`.
+        Every second is counted once, whichever frames it was spent on.
+        """
+        with self._changed:
+            cost, self._cost = self._cost, 0.0
+        return cost
+
+    def drain(self):
+        # waits until everything queued reached the terminal
+        with self._changed:
+            while (self.back or self.busy) and not self.closed:
+                self._changed.wait()
+
+    def close(self):
+        # writes what's left and stops the thread
+        self.drain()
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def summary(self):
+        average_depth = self.depth_total / self.frames_queued if self.frames_queued else 0.0
+        return (
+            f"output: {self.frames_written} frames in {self.writes} write(s), "
+            f"queue depth {average_depth:.1f} on average (max {self.max_depth}), "
+            f"{self.write_seconds * 1000:.0f} ms blocked on the terminal, {self.stall_seconds * 1000:.0f} ms stalled"
+        )
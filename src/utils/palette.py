@@ -0,0 +1,195 @@
+import numpy as np
+
+from src.utils.encoder import pack_rgb, split_half_blocks
+
+# Weights of the perceptual distance (red, green, blue): a cheap approximation of how much
+# more sensitive the eye is to green than to red, and to red than to blue
+PERCEPTUAL_WEIGHTS = np.array([2, 4, 3], dtype=np.int64)
+
+# Merging levels of the truecolor tolerance, runs of up to 2 ** TOLERANCE_LEVELS cells can form
+TOLERANCE_LEVELS = 5
+
+
+def perceptual_distance(a, b):
+    """
+    Weighted RGB distance between packed colors, scaled back to 0-255 units.
+
+    Args:
+        a (np.ndarray): Packed 0xRRGGBB colors.
+        b (np.ndarray): Packed 0xRRGGBB colors, broadcastable to `a`.
+
+    Returns:
+        np.ndarray: The distances, as float arrays.
+    """
+    a = a.astype(np.int64)
+    b = b.astype(np.int64)
+    squared = 0
+    for channel, weight in enumerate(PERCEPTUAL_WEIGHTS):
+        shift = 16 - 8 * channel
+        difference = ((a >> shift) & 0xFF) - ((b >> shift) & 0xFF)
+        squared = squared + weight * difference * difference
+    return np.sqrt(squared / PERCEPTUAL_WEIGHTS.sum())
+
+
+def _sgr_tables(sequences):
+    # escape sequences -> (count, longest) byte table and per-sequence lengths
+    table = np.zeros((len(sequences), max(map(len, sequences))), dtype=np.uint8)
+    lengths = np.zeros(len(sequences), dtype=np.int64)
+    for index, sequence in enumerate(sequences):
+        table[index, :len(sequence)] = np.frombuffer(sequence, dtype=np.uint8)
+        lengths[index] = len(sequence)
+    return table, lengths
+
+
+class Palette:
+    """
+    An output palette: how frames are turned into cell colors and how those are written.
+
+    Truecolor cells hold packed 0xRRGGBB values. Indexed palettes map every color to
+    the nearest palette entry through a lookup table over 15-bit colors (5 bits per
+    channel, 32K entries), so quantizing a frame is a single indexing operation; their
+    cells hold palette indices and the escape sequences come from a precomputed table.
+    """
+
+    def __init__(self, name, colors=None, sequences=None, fg_sequences=None, tolerance=0):
+        """
+        Args:
+            name (str): The palette name.
+            colors (list[tuple] | None): RGB values of the palette entries, None for truecolor.
+            sequences (list[bytes] | None): Background color sequence of every entry.
+            fg_sequences (list[bytes] | None): Foreground color sequence of every entry,
+                used by half-block cells.
+            tolerance (float): Truecolor only, perceptual distance under which two colors
+                are treated as the same (see `perceptual_distance`).
+        """
+        self.name = name
+        self.colors = None if colors is None else np.array(colors, dtype=np.uint8)
+        self.tolerance = tolerance
+        self.sgr_table, self.sgr_length = (None, None) if sequences is None else _sgr_tables(sequences)
+        self.fg_sgr_table, self.fg_sgr_length = (None, None) if fg_sequences is None else _sgr_tables(fg_sequences)
+        self.lut = None if colors is None else self._build_lut()
+
+    @property
+    def indexed(self):
+        return self.colors is not None
+
+    def _build_lut(self):
+        # 15-bit color -> nearest palette index, one red level at a time to keep memory low
+        levels = (np.arange(32) * 255 + 15) // 31
+        green, blue = np.meshgrid(levels, levels, indexing='ij')
+        entries = pack_rgb(self.colors.reshape(1, -1, 3))
+        lut = np.empty(32 ** 3, dtype=np.uint8)
+        for red in range(32):
+            plane = np.stack([np.full_like(green, levels[red]), green, blue], axis=-1).reshape(-1, 1, 3)
+            distances = perceptual_distance(pack_rgb(plane).reshape(-1, 1), entries)
+            lut[red * 1024:(red + 1) * 1024] = np.argmin(distances, axis=1)
+        return lut
+
+    def quantize(self, frame):
+        """
+        Converts an RGB frame into cells for this palette.
+
+        Args:
+            frame (np.ndarray): A (height, width, 3) uint8 array.
+
+        Returns:
+            np.ndarray: A (height, width) uint32 array of cell colors.
+        """
+        if self.indexed:
+            frame = np.asarray(frame, dtype=np.uint8) >> 3
+            index = (frame[..., 0].astype(np.intp) << 10) | (frame[..., 1].astype(np.intp) << 5) | frame[..., 2]
+            return self.lut[index].astype(np.uint32)
+
+        cells = pack_rgb(frame)
+        if self.tolerance > 0:
+            cells = self.snap(cells)
+        return cells
+
+    def snap(self, cells):
+        """
+        Merges near-identical neighbours, so runs of similar colors need a single sequence.
+
+        Cells are merged in aligned blocks of doubling size: a block takes the color of the
+        block on its left when that block is a single color within the tolerance of every
+        cell it would cover. The check is always made against the cells' original colors,
+        so no cell ends up further than the tolerance from its real color.
+
+        Args:
+            cells (np.ndarray): A (height, width) array of packed colors.
+
+        Returns:
+            np.ndarray: The snapped cells.
+        """
+        height, width = cells.shape
+        span = 2 ** TOLERANCE_LEVELS
+        padded_width = -(-width // span) * span
+        original = np.pad(cells, ((0, 0), (0, padded_width - width)), mode='edge')
+        snapped = original.copy()
+
+        block = 1
+        while block < span:
+            pairs = snapped.reshape(height, -1, 2, block)
+            left, right = pairs[:, :, 0], pairs[:, :, 1]
+            color = left[:, :, :1]
+
+            uniform = (left == color).all(axis=-1)
+            targets = original.reshape(height, -1, 2, block)[:, :, 1]
+            close = (perceptual_distance(color, targets) <= self.tolerance).all(axis=-1)
+
+            merge = uniform & close
+            right[merge] = color[merge]
+            block *= 2
+
+        return snapped[:, :width]
+
+    def changed(self, screen, cells):
+        # cells that differ from what's displayed enough to be redrawn
+        if self.indexed or self.tolerance <= 0:
+            return screen != cells
+        if cells.dtype == np.uint64:
+            # half-block cells, redrawn when either half moved too far
+            (screen_top, screen_bottom), (top, bottom) = split_half_blocks(screen), split_half_blocks(cells)
+            return np.maximum(perceptual_distance(screen_top, top), perceptual_distance(screen_bottom, bottom)) > self.tolerance
+        return perceptual_distance(screen, cells) > self.tolerance
+
+
+def _xterm256_colors():
+    # the 6x6x6 color cube and the 24-step gray ramp; 0-15 are left out, terminals theme them
+    cube = [0, 95, 135, 175, 215, 255]
+    colors = [(r, g, b) for r in cube for g in cube for b in cube]
+    colors += [(8 + 10 * i,) * 3 for i in range(24)]
+    return colors
+
+
+ANSI16_COLORS = [
+    (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0), (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+    (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0), (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+]
+
+
+def get_palette(name, tolerance=0):
+    """
+    Builds one of the output palettes.
+
+    Args:
+        name (str): 'truecolor', 'xterm256' or 'ansi16'.
+        tolerance (float): Perceptual tolerance of the truecolor palette.
+
+    Returns:
+        Palette: The palette.
+    """
+    if name == 'truecolor':
+        return Palette(name, tolerance=tolerance)
+    if name == 'xterm256':
+        colors = _xterm256_colors()
+        sequences = [f'\033[48;5;{16 + index}m'.encode() for index in range(len(colors))]
+        fg_sequences = [f'\033[38;5;{16 + index}m'.encode() for index in range(len(colors))]
+        return Palette(name, colors, sequences, fg_sequences)
+    if name == 'ansi16':
+        sequences = [f'\033[{base + index}m'.encode() for base in (40, 100) for index in range(8)]
+        fg_sequences = [f'\033[{base + index}m'.encode() for base in (30, 90) for index in range(8)]
+        return Palette(name, ANSI16_COLORS, sequences, fg_sequences)
+    raise ValueError(f"Unknown palette '{name}'")
+
+
+PALETTES = ['truecolor', 'xterm256', 'ansi16']
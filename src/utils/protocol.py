@@ -0,0 +1,99 @@
+import os
+import socket
+import struct
+from sys import stdout
+
+# Wire protocol (little endian), server to viewer only:
+#   hello    'ASCB', u16 version, u16 width, u16 height, u32 frame rate numerator, u32 denominator
+#   message  u8 type, u32 frame index, u32 payload length, payload
+# KEYFRAME payloads draw a whole frame, DELTA payloads only the cells that changed since the previous frame;
+# both are the terminal sequences themselves, a viewer writes them out as they come. END closes the stream.
+PROTOCOL_VERSION = 1
+HELLO = struct.Struct('<4sHHHII')
+MESSAGE = struct.Struct('<cII')
+
+KEYFRAME = b'K'
+DELTA = b'D'
+END = b'E'
+
+DEFAULT_ADDRESS = 'localhost:7878'
+# Bytes queued for a viewer before it stops receiving deltas and is resynced with a keyframe
+DEFAULT_MAX_BUFFER = 1 << 20 # 1 MiB
+
+
+def parse_address(text):
+    """
+    Parses a server address.
+
+    Args:
+        text (str): 'host:port', ':port' (every interface) or 'unix:PATH' for a Unix socket.
+
+    Returns:
+        tuple: ('unix', path) or ('tcp', host, port).
+    """
+    if text.startswith('unix:'):
+        return 'unix', text[len('unix:'):]
+    host, _, port = text.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f"Invalid address '{text}', expected HOST:PORT or unix:PATH")
+    return 'tcp', host or None, int(port)
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise ConnectionError("The server closed the connection")
+    return data
+
+
+def connect(address, fd=None):
+    """
+    Shows a broadcast on the terminal until it ends.
+
+    Frames are written as they arrive; when the terminal can't keep up, the server
+    notices the backlog and resyncs this viewer with a keyframe.
+
+    Args:
+        address (str): The server's address, see `parse_address`.
+        fd (int | None): The terminal's file descriptor, None for standard output.
+
+    Returns:
+        tuple: The frames shown, the keyframes among them and the bytes received.
+    """
+    fd = stdout.fileno() if fd is None else fd
+    address = parse_address(address)
+    if address[0] == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address[1])
+    else:
+        sock = socket.create_connection((address[1] or 'localhost', address[2]))
+
+    def output(data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+    frames = keyframes = received = 0
+    with sock, sock.makefile('rb') as stream:
+        magic, version, _, _, _, _ = HELLO.unpack(_read_exactly(stream, HELLO.size))
+        if magic != b'ASCB':
+            raise ValueError("Not a broadcast server")
+        if version != PROTOCOL_VERSION:
+            raise ValueError(f"Unsupported protocol version {version}")
+
+        output(b'\033[?1049h\033[2J\033[?25l') # alternate buffer, cleared, cursor hidden
+        try:
+            while True:
+                kind, _, length = MESSAGE.unpack(_read_exactly(stream, MESSAGE.size))
+                if kind == END:
+                    break
+                payload = _read_exactly(stream, length)
+                output(payload)
+                frames += 1
+                keyframes += kind == KEYFRAME
+                received += MESSAGE.size + length
+        except ConnectionError:
+            pass
+        finally:
+            output(b'\033[0m\033[?25h\033[?1049l')
+    return frames, keyframes, received
@@ -0,0 +1,125 @@
+import numpy as np
+
+from src.utils.encoder import encode_cells, encode_updates
+
+
+class DamageRenderer:
+    """
+    Renders frames of packed colors, writing only the cells that changed on screen.
+
+    The renderer remembers what is currently displayed, where the cursor is and which
+    foreground and background colors are active. For every new frame it finds the
+    changed runs of cells per row and emits a cursor move (`CSI row;col H`) plus the
+    color sequences and glyphs for those runs only. The move is skipped when the cursor already sits at the
+    start of a run, and the color sequence when the color is already active.
+
+    With a truecolor palette that has a tolerance, cells within the tolerance of what is
+    displayed are left alone.
+
+    In glyph mode (see src.utils.glyphs) cells are characters on the terminal's own
+    background, the colors are reset before every full frame.
+
+    A shared renderer forgets the cursor and colors after every frame, so its output
+    applies to any terminal showing the previous frame, whatever was drawn before it
+    (e.g. viewers of a broadcast that joined midway, see src.utils.broadcast).
+    """
+
+    def __init__(self, palette=None, glyphs=None, shared=False):
+        self.palette = palette # None draws packed colors in truecolor
+        self.glyphs = glyphs # glyph mode of the cells, None for colored blocks
+        self.shared = shared
+        self.screen = None # cells currently displayed
+        self.cursor = None # (row, col) of the cursor, None when unknown
+        self.fg = None # active foreground color (half-block cells), None when unknown
+        self.bg = None # active background color, None when unknown
+        self.clear = False # clear the screen before the next full frame
+
+        self.frame_bytes = 0 # bytes produced for the last frame
+        self.bytes_written = 0
+        self.frames_rendered = 0
+
+    def reset(self, clear=False):
+        # forgets the screen state, the next frame is drawn in full; after the terminal was
+        # resized, `clear` also erases what it shows around the frame
+        self.clear = clear
+        self.screen = None
+        self.cursor = None
+        self.fg = None
+        self.bg = None
+
+    def render(self, cells, rows=None):
+        """
+        Renders a frame.
+
+        Args:
+            cells (np.ndarray): A (height, width) array of cell colors for the renderer's palette,
+                of half-block cells (see `encoder.half_blocks`), or of glyph cells in glyph mode.
+            rows (Iterable[int] | None): The only rows that may differ from the displayed
+                frame, when known (e.g. from the stored deltas). None compares every row.
+
+        Returns:
+            bytes: The sequences to write to the terminal, empty when nothing changed.
+        """
+        if self.screen is None or self.screen.shape != cells.shape:
+            self.screen = cells.copy()
+            output = self.keyframe()
+            if self.clear:
+                output = b'\033[0m\033[2J' + output
+                self.clear = False
+            self.cursor = None
+            # the colors left active aren't tracked for full frames
+            self.fg = None
+            self.bg = None
+            return self._count(output)
+
+        if rows is None:
+            changed = self._changed(self.screen, cells)
+        else:
+            rows = np.fromiter(sorted(rows), dtype=np.intp)
+            changed = np.zeros(cells.shape, dtype=bool)
+            changed[rows] = self._changed(self.screen[rows], cells[rows])
+
+        changed_rows, changed_cols = np.nonzero(changed)
+        if not len(changed_rows):
+            return self._count(b'')
+
+        updates = cells[changed_rows, changed_cols]
+        width = cells.shape[1]
+
+        # a run starts wherever a changed cell doesn't directly follow the previous one
+        flat = changed_rows * width + changed_cols
+        run_starts = np.ones(len(flat), dtype=bool)
+        run_starts[1:] = np.diff(flat) != 1
+        run_starts[1:] |= np.diff(changed_rows) != 0
+        if self.cursor is not None and self.cursor == (changed_rows[0], changed_cols[0]):
+            run_starts[0] = False
+
+        output, (self.fg, self.bg) = encode_updates(
+            changed_rows, changed_cols, updates, run_starts, self.palette, self.fg, self.bg, self.glyphs
+        )
+
+        self.screen[changed] = cells[changed]
+        last_col = changed_cols[-1] + 1
+        # past the last column the cursor position depends on the terminal's wrapping
+        self.cursor = (changed_rows[-1], last_col) if last_col < width else None
+        if self.shared:
+            self.cursor = None
+            self.fg = None
+            self.bg = None
+        return self._count(output)
+
+    def keyframe(self):
+        # the sequences drawing the displayed frame in full, whatever the terminal shows
+        reset = b'\033[0m' if self.glyphs is not None else b''
+        return b'\033[H' + reset + encode_cells(self.screen, self.palette, self.glyphs)
+
+    def _changed(self, screen, cells):
+        if self.palette is None or self.glyphs is not None:
+            return screen != cells
+        return self.palette.changed(screen, cells)
+
+    def _count(self, output):
+        self.frame_bytes = len(output)
+        self.bytes_written += len(output)
+        self.frames_rendered += 1
+        return output
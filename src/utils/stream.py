@@ -0,0 +1,430 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from src.utils.audio import AUDIO_FORMAT, AudioSource
+from src.utils.metrics import METRICS
+
+# ffmpeg and multiprocessing are imported by the functions using them, players of
+# stored videos import this module without needing either
+
+# Marks the end of a run in the pipeline queue
+END = object()
+
+# Shared arrays and converter of a pool worker, set up by `_attach_worker`
+_worker = {}
+
+
+# Frames decoded ahead of the consumer by default, see `iter_frames`
+DEFAULT_RING_FRAMES = 8
+
+# Bytes of PCM read from the audio decoder at a time, see `stream_audio`
+DEFAULT_AUDIO_CHUNK_BYTES = 1 << 14
+
+
+def _run(stream, feed=None):
+    # starts an ffmpeg command; with `feed`, its input is written to ffmpeg's stdin by a thread
+    if feed is None:
+        return stream.run_async(pipe_stdout=True, pipe_stderr=True)
+    process = stream.run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+    threading.Thread(target=feed, args=(process.stdin,), daemon=True).start()
+    return process
+
+
+def _decoder(input_filename, target_frame_width, target_frame_height, feed=None, sizes=None):
+    # starts ffmpeg writing raw rgb24 frames of the target size to its stdout; with `sizes`,
+    # the video is scaled to every (width, height) in the same pass and the frames are
+    # stacked vertically, each padded to the target width
+    import ffmpeg
+
+    stream = ffmpeg.input('pipe:' if feed else input_filename)
+    if sizes is None:
+        stream = stream.filter('scale', target_frame_width, target_frame_height)
+    else:
+        split = stream.filter_multi_output('split', len(sizes))
+        scaled = [
+            split.stream(index).filter('scale', width, height).filter('pad', target_frame_width, height, 0, 0)
+            for index, (width, height) in enumerate(sizes)
+        ]
+        stream = ffmpeg.filter(scaled, 'vstack', inputs=len(scaled)) if len(scaled) > 1 else scaled[0]
+    return _run(
+        stream
+        .filter('format', 'rgb24')
+        .output('pipe:', format='rawvideo', pix_fmt='rgb24', loglevel="quiet"),
+        feed,
+    )
+
+
+def _audio_decoder(input_filename, feed=None):
+    # starts ffmpeg writing the audio track as WAV to its stdout
+    import ffmpeg
+
+    return _run(ffmpeg.input('pipe:' if feed else input_filename).output('pipe:', format='wav', loglevel="quiet"), feed)
+
+
+def decode_audio(input_filename, feed=None):
+    """
+    Decodes the audio track of a video file to WAV in memory.
+
+    Args:
+        input_filename (str): The path to the video file.
+        feed (callable | None): Writes the video into a stream and closes it, used instead
+            of reading `input_filename` (see `Download.feed`).
+
+    Returns:
+        bytes: The audio data in WAV format.
+    """
+    process = _audio_decoder(input_filename, feed)
+    try:
+        return process.stdout.read()
+    finally:
+        _stop_decoder(process)
+
+
+def _audio_chunks(process, chunk_size):
+    try:
+        while chunk := process.stdout.read1(chunk_size):
+            yield chunk
+    finally:
+        _stop_decoder(process)
+
+
+def stream_audio(input_filename, feed=None, chunk_size=DEFAULT_AUDIO_CHUNK_BYTES):
+    """
+    Decodes the audio track of a video file lazily, as raw PCM chunks.
+
+    The decoder runs alongside the video's, and chunks are yielded as soon as ffmpeg
+    writes them, so playback can start right away (even while downloading) and memory
+    doesn't depend on the length of the video. Audio is resampled to `AUDIO_FORMAT`.
+
+    Args:
+        input_filename (str): The path to the video file.
+        feed (callable | None): See `decode_audio`.
+        chunk_size (int): Maximum bytes per chunk.
+
+    Returns:
+        AudioSource: The audio, closing it stops the decoder.
+    """
+    import ffmpeg
+
+    rate, channels, sample_width = AUDIO_FORMAT
+    process = _run(
+        ffmpeg
+        .input('pipe:' if feed else input_filename)
+        .output('pipe:', format=f's{sample_width * 8}le', acodec=f'pcm_s{sample_width * 8}le', ac=channels, ar=rate, loglevel="quiet"),
+        feed,
+    )
+    return AudioSource(_audio_chunks(process, chunk_size), rate, channels, sample_width)
+
+
+def _stop_decoder(process):
+    process.stdout.close()
+    process.stderr.close()
+    if process.poll() is None:
+        process.kill()
+    process.wait()
+
+
+def _read_frame(stream, frame):
+    # fills `frame` straight from the pipe, returns False when the video ended first
+    view = memoryview(frame).cast('B')
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            return False
+        filled += count
+    return True
+
+
+def iter_frames(input_filename, target_frame_width, target_frame_height, ring_size=DEFAULT_RING_FRAMES, ring=None, feed=None, sizes=None):
+    """
+    Decodes a video file lazily, yielding one RGB frame at a time.
+
+    ffmpeg's output is read straight into a preallocated ring of `ring_size` frames and
+    the frames yielded are views into it, so decoding allocates nothing per frame. A
+    frame stays valid until `ring_size - 1` more frames have been read; consumers that
+    hold on to frames for longer must copy them. ffmpeg is stopped as soon as the
+    generator is closed, so abandoning playback midway doesn't leave it running.
+
+    Args:
+        input_filename (str): The path to the video file.
+        target_frame_width (int): The desired width of the output frames.
+        target_frame_height (int): The desired height of the output frames.
+        ring_size (int): Number of frames in the ring buffer.
+        ring (np.ndarray | None): A (frames, height, width, 3) uint8 array to use as the
+            ring instead of allocating one, e.g. shared memory; frames fill it in order.
+        feed (callable | None): See `decode_audio`.
+        sizes (list[tuple] | None): The (width, height) of several renditions to decode at
+            once, stacked vertically in every frame; the target width and height are then
+            the stacked frame's, see `src.utils.ladder.stacked_shape`.
+
+    Yields:
+        np.ndarray: A (height, width, 3) uint8 view per frame.
+    """
+    process = _decoder(input_filename, target_frame_width, target_frame_height, feed, sizes)
+    if ring is None:
+        ring = np.empty((ring_size, target_frame_height, target_frame_width, 3), dtype=np.uint8)
+    ring_size = len(ring)
+
+    try:
+        slot = 0
+        start = time.perf_counter()
+        while _read_frame(process.stdout, ring[slot]):
+            # waiting on ffmpeg's pipe, the decoding of the frame
+            METRICS.record('decode', time.perf_counter() - start, start)
+            yield ring[slot]
+            slot = (slot + 1) % ring_size
+            start = time.perf_counter()
+    finally:
+        _stop_decoder(process)
+
+
+def read_frames(input_filename, target_frame_width, target_frame_height):
+    """
+    Decodes a whole video file into a single array.
+
+    Frames are read straight into a buffer grown geometrically, instead of one
+    allocation per frame.
+
+    Args:
+        input_filename (str): The path to the video file.
+        target_frame_width (int): The desired width of the output frames.
+        target_frame_height (int): The desired height of the output frames.
+
+    Returns:
+        np.ndarray: A (frames, height, width, 3) uint8 array.
+    """
+    process = _decoder(input_filename, target_frame_width, target_frame_height)
+    frames = np.empty((64, target_frame_height, target_frame_width, 3), dtype=np.uint8)
+
+    try:
+        count = 0
+        while True:
+            if count == len(frames):
+                frames = np.concatenate([frames, np.empty_like(frames)])
+            start = time.perf_counter()
+            if not _read_frame(process.stdout, frames[count]):
+                break
+            METRICS.record('decode', time.perf_counter() - start, start)
+            count += 1
+    finally:
+        _stop_decoder(process)
+
+    return frames[:count].copy() if count < len(frames) // 2 else frames[:count]
+
+
+def default_processes():
+    # one worker per core, leaving one for decoding and drawing
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+class SharedArray:
+    """
+    A NumPy array backed by a `multiprocessing.shared_memory` block, so worker
+    processes can read and write it without anything being pickled.
+    """
+
+    def __init__(self, shape, dtype):
+        from multiprocessing import shared_memory
+
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.memory.buf)
+
+    @property
+    def spec(self):
+        # what a worker needs to attach to the array
+        return self.memory.name, self.array.shape, self.array.dtype.str
+
+    @staticmethod
+    def attach(spec):
+        from multiprocessing import shared_memory
+
+        name, shape, dtype = spec
+        memory = shared_memory.SharedMemory(name=name)
+        return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+    def close(self):
+        self.array = None
+        self.memory.close()
+        self.memory.unlink()
+
+
+def _attach_worker(input_spec, output_spec, convert):
+    # pool initializer: maps the shared frame rings once per worker
+    input_memory, _worker['inputs'] = SharedArray.attach(input_spec)
+    output_memory, _worker['outputs'] = SharedArray.attach(output_spec)
+    _worker['memory'] = (input_memory, output_memory) # keeps the mappings alive
+    _worker['convert'] = convert
+
+
+def _convert_slots(start, count):
+    # converts the frames of a batch in place, only slot numbers cross the process boundary;
+    # the time each frame took goes back with them, for the metrics of the main process
+    inputs, outputs, convert = _worker['inputs'], _worker['outputs'], _worker['convert']
+    timings = []
+    for slot in range(start, start + count):
+        converted = time.perf_counter()
+        outputs[slot] = convert(inputs[slot])
+        timings.append((converted, time.perf_counter() - converted))
+    return start, count, os.getpid(), timings
+
+
+class FramePipeline:
+    """
+    Streams frames from a decoder through a worker pool to the renderer.
+
+    Decoded frames and converted outputs live in two rings in shared memory: the
+    decoder writes frames straight into the input ring, workers convert them into the
+    output ring, and only slot numbers go through the pool. A feeder thread hands
+    batches of consecutive slots to the pool. Pending batches go through a bounded
+    queue, so at most `max_pending` batches are decoded or being converted at any time
+    and memory stays constant no matter how long the video is. Results come out in order.
+
+    The outputs yielded are views into the output ring: each stays valid until the
+    batch after its own has been consumed, consumers keeping them longer must copy them.
+
+    The pipeline can be run several times (e.g. to replay), each `start` calls
+    `source()` again for a fresh frame iterator; iterating again once a run has ended
+    starts a new one.
+    """
+
+    def __init__(self, source, convert, frame_shape, output_shape, output_dtype, processes=None, batch_size=4, max_pending=16, prebuffer=4):
+        """
+        Args:
+            source (callable): Given the (slots, height, width, 3) uint8 input ring, returns
+                a new iterator that decodes one frame per step into its slots, in order
+                (see `iter_frames`).
+            convert (callable): Converts a frame into an output array, run in the workers;
+                must be picklable.
+            frame_shape (tuple): The (height, width) of the decoded frames.
+            output_shape (tuple): The shape of a converted output.
+            output_dtype (np.dtype): The dtype of a converted output.
+            processes (int | None): Worker processes, None for `default_processes()`.
+            batch_size (int): Frames sent to a worker per call.
+            max_pending (int): Maximum number of batches queued or in flight.
+            prebuffer (int): Batches that must be ready before `wait_ready` returns.
+        """
+        from multiprocessing import Pool
+
+        self.source = source
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.prebuffer = min(prebuffer, max_pending)
+
+        # every queued batch, the one being read, the one waiting for room in the queue,
+        # and the two the consumer may still be looking at
+        self.slots = (max_pending + 3) * batch_size
+        self.inputs = SharedArray((self.slots, *frame_shape, 3), np.uint8)
+        self.outputs = SharedArray((self.slots, *output_shape), output_dtype)
+        self.pool = Pool(
+            processes=processes or default_processes(),
+            initializer=_attach_worker,
+            initargs=(self.inputs.spec, self.outputs.spec, convert),
+        )
+
+        self._queue = None
+        self._ended = False # the current run's END (or error) has been consumed
+        self._stopped = threading.Event()
+        self._finished = threading.Event()
+        self._feeder = None
+
+    def start(self):
+        # stops any previous run and launches a new feeder thread
+        self.stop()
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._ended = False
+        self._stopped = threading.Event()
+        self._finished = threading.Event()
+        self._feeder = threading.Thread(target=self._feed, args=(self._queue, self._stopped, self._finished), name='decoder', daemon=True)
+        self._feeder.start()
+
+    def _put(self, pending, item, stopped):
+        while not stopped.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self, pending, stopped, finished):
+        frames = self.source(self.inputs.array)
+        try:
+            start = count = 0
+            for _ in frames:
+                if stopped.is_set():
+                    return
+                count += 1
+                if count == self.batch_size:
+                    if not self._put(pending, self.pool.apply_async(_convert_slots, (start, count)), stopped):
+                        return
+                    # the ring holds a whole number of batches, so batches never wrap around
+                    start = (start + count) % self.slots
+                    count = 0
+            if count:
+                self._put(pending, self.pool.apply_async(_convert_slots, (start, count)), stopped)
+        except Exception as e:
+            self._put(pending, e, stopped)
+        finally:
+            finished.set()
+            if hasattr(frames, 'close'):
+                frames.close()
+            self._put(pending, END, stopped)
+
+    def wait_ready(self):
+        """
+        Blocks until the prebuffer is filled (or the source ran out of frames) and the
+        first batch has been converted.
+        """
+        while self._queue.qsize() < self.prebuffer and not self._finished.is_set():
+            self._finished.wait(0.01)
+
+        head = self._queue.queue[0] if self._queue.qsize() else None
+        if head is not None and head is not END and not isinstance(head, Exception):
+            head.wait()
+
+    def __iter__(self):
+        # the queue of a run that has ended is drained, waiting on it would block forever
+        if self._queue is None or self._ended:
+            self.start()
+        pending = self._queue
+        outputs = self.outputs.array
+        while True:
+            item = pending.get()
+            if item is END or isinstance(item, Exception):
+                self._ended = True
+                if item is END:
+                    return
+                raise item
+            start, count, pid, timings = item.get()
+            for converted, seconds in timings:
+                METRICS.record('convert', seconds, converted, pid, pid)
+            for slot in range(start, start + count):
+                yield outputs[slot]
+
+    def stop(self):
+        # abandons the current run, unblocking and joining the feeder thread
+        self._stopped.set()
+        if self._feeder is not None:
+            self._feeder.join()
+            self._feeder = None
+
+        # batches still being converted would write over the next run's outputs
+        while self._queue is not None and not self._queue.empty():
+            item = self._queue.get()
+            if item is not END and not isinstance(item, Exception):
+                item.wait()
+
+    def close(self):
+        # stops the current run, shuts the worker pool down and frees the shared memory
+        self.stop()
+        self.pool.terminate()
+        self.pool.join()
+        self.inputs.close()
+        self.outputs.close()